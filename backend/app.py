@@ -10,6 +10,7 @@ from flask_cors import CORS
 # Local engines
 import processing_engine as pe
 import insight_engine as ie
+import ingest_engine as ingest
 
 
 # ----------------------------------------------------------------------------
@@ -27,17 +28,19 @@ CORS(app, resources={r"*": {"origins": "*"}})
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
 logger = logging.getLogger(__name__)
 
+MAX_BATCH_IDS = 500
+
 
 @app.get("/health")
 def health() -> Any:
     return jsonify({"status": "ok"}), 200
 
 
-@app.get("/student/<int:student_id>")
-def get_student(student_id: int) -> Any:
-    """Summarize a student and generate insights in one call."""
+@app.get("/student/<student_id>")
+def get_student(student_id: str) -> Any:
+    """Summarize a student (by numeric id or USN) and generate insights in one call."""
     try:
-        summary = pe.summarize_student(student_id)
+        summary = pe.summarize_student(pe.parse_student_key(student_id))
         insights = ie.generate_insights(summary)
         return jsonify({"summary": summary, "insights": insights}), 200
     except Exception as e:
@@ -45,6 +48,235 @@ def get_student(student_id: int) -> Any:
         return jsonify({"error": "Internal Server Error"}), 500
 
 
+@app.get("/student/<student_id>/attendance")
+def get_student_attendance(student_id: str) -> Any:
+    """Attendance over a date range, e.g. ?start=2023-01-01&end=2023-03-31, ?days=30 or &subject=OS."""
+    try:
+        days = request.args.get("days", type=int)
+        if days is not None and days <= 0:
+            return jsonify({"error": "days must be a positive integer."}), 400
+        try:
+            window = pe.attendance_window(
+                pe.parse_student_key(student_id),
+                start=request.args.get("start"),
+                end=request.args.get("end"),
+                days=days,
+                subject=request.args.get("subject"),
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify(window), 200
+    except Exception as e:
+        logger.exception("/student/%s/attendance failed: %s", student_id, e)
+        return jsonify({"error": "Internal Server Error"}), 500
+
+
+@app.get("/student/<student_id>/attendance/trend")
+def get_student_attendance_trend(student_id: str) -> Any:
+    """Weekly or monthly attendance per subject, e.g. ?period=month&start=2023-01-01&subject=OS."""
+    try:
+        try:
+            trend = pe.attendance_trend(
+                pe.parse_student_key(student_id),
+                period=request.args.get("period", "week"),
+                subject=request.args.get("subject"),
+                start=request.args.get("start"),
+                end=request.args.get("end"),
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify(trend), 200
+    except Exception as e:
+        logger.exception("/student/%s/attendance/trend failed: %s", student_id, e)
+        return jsonify({"error": "Internal Server Error"}), 500
+
+
+@app.get("/student/<student_id>/similar")
+def get_similar_students(student_id: str) -> Any:
+    """Students with the most similar grade/attendance profile, e.g. ?k=5 (peer mentoring)."""
+    try:
+        k = request.args.get("k", default=5, type=int)
+        if not 0 < k <= MAX_BATCH_IDS:
+            return jsonify({"error": f"k must be between 1 and {MAX_BATCH_IDS}."}), 400
+        try:
+            similar = pe.similar_students(pe.parse_student_key(student_id), k)
+        except KeyError:
+            return jsonify({"error": "No grades or attendance recorded for this student."}), 404
+        return jsonify({"student": student_id, "similar": similar}), 200
+    except Exception as e:
+        logger.exception("/student/%s/similar failed: %s", student_id, e)
+        return jsonify({"error": "Internal Server Error"}), 500
+
+
+@app.get("/student/<student_id>/dashboard")
+def get_student_dashboard(student_id: str) -> Any:
+    """Chart-ready arrays for the dashboard: grades and attendance with cohort overlays, trend and skills."""
+    try:
+        try:
+            payload = pe.dashboard_payload(pe.parse_student_key(student_id))
+        except KeyError:
+            return jsonify({"error": "Student not found."}), 404
+        return jsonify(payload), 200
+    except Exception as e:
+        logger.exception("/student/%s/dashboard failed: %s", student_id, e)
+        return jsonify({"error": "Internal Server Error"}), 500
+
+
+@app.post("/students/batch")
+def get_students_batch() -> Any:
+    """Summaries (no LLM insights) for many students in one call.
+
+    Expected body: {"ids": [1, 2, "1RV22CS003"]}
+    Returns {"summaries": {"<id>": summary}} keyed by the normalized id.
+    """
+    try:
+        payload: Dict[str, Any] | None = request.get_json(silent=True)
+        ids = payload.get("ids") if isinstance(payload, dict) else None
+        if not isinstance(ids, list) or not all(isinstance(i, (int, str)) and not isinstance(i, bool) for i in ids):
+            return jsonify({"error": "Invalid payload. Expect JSON {\"ids\": [int | string, ...]}."}), 400
+        if len(ids) > MAX_BATCH_IDS:
+            return jsonify({"error": f"At most {MAX_BATCH_IDS} ids per batch."}), 400
+        summaries = pe.summarize_students(ids)
+        return jsonify({"summaries": {str(k): v for k, v in summaries.items()}}), 200
+    except Exception as e:
+        logger.exception("/students/batch failed: %s", e)
+        return jsonify({"error": "Internal Server Error"}), 500
+
+
+@app.get("/students/search")
+def search_students() -> Any:
+    """Students whose projects carry the given tags, e.g. ?tags=NLP,React Native&mode=any.
+
+    mode is 'all' (default, every tag) or 'any' (at least one tag).
+    Returns {"tags", "mode", "count", "students": [id, ...]}.
+    """
+    try:
+        tags = [t for raw in request.args.getlist("tags") for t in raw.split(",") if t.strip()]
+        if not tags:
+            return jsonify({"error": "Pass at least one tag, e.g. ?tags=NLP,Python."}), 400
+        mode = request.args.get("mode", "all")
+        try:
+            students = pe.students_with_tags(tags, mode)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify({"tags": tags, "mode": mode, "count": len(students), "students": students}), 200
+    except Exception as e:
+        logger.exception("/students/search failed: %s", e)
+        return jsonify({"error": "Internal Server Error"}), 500
+
+
+@app.post("/students/query")
+def query_students() -> Any:
+    """Filter, sort and page students by their metrics.
+
+    Expected body: {"where": [{"field": "avg_attendance", "op": "<", "value": 75},
+                              {"field": "department", "op": "==", "value": "CS"}],
+                    "sort": "-avg_grade", "limit": 50, "offset": 0}
+    Returns {"total", "offset", "limit", "next_offset", "students": [...]}.
+    """
+    try:
+        payload: Dict[str, Any] | None = request.get_json(silent=True)
+        if not isinstance(payload, dict):
+            return jsonify({"error": "Invalid payload. Expect a JSON object with where/sort/limit/offset."}), 400
+        limit, offset, fields = payload.get("limit", 50), payload.get("offset", 0), payload.get("fields")
+        if not all(isinstance(v, int) and not isinstance(v, bool) for v in (limit, offset)):
+            return jsonify({"error": "limit and offset must be integers."}), 400
+        if fields is not None and not (isinstance(fields, list) and all(isinstance(f, str) for f in fields)):
+            return jsonify({"error": "fields must be a list of field names."}), 400
+        try:
+            result = pe.query_students(
+                where=payload.get("where"),
+                sort=payload.get("sort"),
+                limit=limit,
+                offset=offset,
+                fields=fields,
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify(result), 200
+    except Exception as e:
+        logger.exception("/students/query failed: %s", e)
+        return jsonify({"error": "Internal Server Error"}), 500
+
+
+@app.get("/students/at-risk")
+def get_at_risk_students() -> Any:
+    """Students ranked by risk score, e.g. ?limit=50&offset=0&min_score=0.3 (no LLM calls)."""
+    try:
+        limit = request.args.get("limit", default=50, type=int)
+        offset = request.args.get("offset", default=0, type=int)
+        min_score = request.args.get("min_score", default=0.0, type=float)
+        if not 0 < limit <= MAX_BATCH_IDS or offset < 0:
+            return jsonify({"error": f"limit must be 1..{MAX_BATCH_IDS} and offset must be >= 0."}), 400
+        return jsonify(pe.at_risk_students(limit=limit, offset=offset, min_score=min_score)), 200
+    except Exception as e:
+        logger.exception("/students/at-risk failed: %s", e)
+        return jsonify({"error": "Internal Server Error"}), 500
+
+
+@app.get("/data/validation")
+def get_validation_report() -> Any:
+    """Rows rejected or nulled by the load-time checks, per source CSV, with sample line numbers."""
+    try:
+        return jsonify({"tables": pe.validation_report()}), 200
+    except Exception as e:
+        logger.exception("/data/validation failed: %s", e)
+        return jsonify({"error": "Internal Server Error"}), 500
+
+
+@app.post("/ingest/<table>")
+def ingest_events(table: str) -> Any:
+    """Append a batch of grade or attendance events; they are served as soon as this returns.
+
+    Expected body for /ingest/grades:
+        {"events": [{"id": "1BM20CS001", "subject": "Math", "grade": "A"}]}
+    and for /ingest/attendance (a 0-100 "attendance" value may replace
+    "status"; subject defaults to Overall):
+        {"events": [{"id": 1, "date": "2023-02-01", "status": "Present", "subject": "OS"}]}
+    Returns {"table", "accepted", "data_version"}.
+    """
+    try:
+        if table not in ingest.LOG_COLUMNS:
+            return jsonify({"error": f"Unknown event table. Use one of {list(ingest.LOG_COLUMNS)}."}), 404
+        payload: Dict[str, Any] | None = request.get_json(silent=True)
+        try:
+            result = ingest.append(table, payload.get("events") if isinstance(payload, dict) else None)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except ingest.UnsupportedBackend as e:
+            return jsonify({"error": str(e)}), 501
+        return jsonify(result), 200
+    except Exception as e:
+        logger.exception("/ingest/%s failed: %s", table, e)
+        return jsonify({"error": "Internal Server Error"}), 500
+
+
+@app.post("/ingest/compact")
+def compact_events() -> Any:
+    """Compact every event log into its columnar file now instead of waiting for the size threshold."""
+    try:
+        try:
+            results = {name: ingest.compact(name) for name in ingest.LOG_COLUMNS}
+        except ingest.UnsupportedBackend as e:
+            return jsonify({"error": str(e)}), 501
+        return jsonify({"tables": results}), 200
+    except Exception as e:
+        logger.exception("/ingest/compact failed: %s", e)
+        return jsonify({"error": "Internal Server Error"}), 500
+
+
+@app.get("/cohorts/<dimension>")
+def get_cohorts(dimension: str) -> Any:
+    """Distribution (mean, quantiles, histogram) of every metric per cohort, e.g. /cohorts/department."""
+    try:
+        if dimension not in pe.ce.COHORT_COLUMNS:
+            return jsonify({"error": f"Unknown cohort dimension. Use one of {list(pe.ce.COHORT_COLUMNS)}."}), 400
+        return jsonify({"dimension": dimension, "cohorts": pe.cohort_distributions(dimension)}), 200
+    except Exception as e:
+        logger.exception("/cohorts/%s failed: %s", dimension, e)
+        return jsonify({"error": "Internal Server Error"}), 500
+
+
 @app.post("/generate_insights")
 def generate_insights() -> Any:
     """Accepts a JSON body with student data and returns three insights.
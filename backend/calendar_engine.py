@@ -0,0 +1,288 @@
+from __future__ import annotations
+
+from typing import Dict, Hashable, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+_WORD_BITS = 64
+
+if hasattr(np, 'bitwise_count'):
+    def _popcount(words: np.ndarray) -> np.ndarray:
+        return np.bitwise_count(words)
+else:  # pragma: no cover - numpy < 2.0
+    _BYTE_COUNTS = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+    def _popcount(words: np.ndarray) -> np.ndarray:
+        return _BYTE_COUNTS[words.view(np.uint8)].reshape(*words.shape, 8).sum(axis=-1)
+
+
+def _pack(group: np.ndarray, day: np.ndarray, n_rows: int, n_words: int) -> np.ndarray:
+    """Bit matrix (n_rows, n_words) with bit `day` of row `group` set, for each pair."""
+    flat = group.astype(np.int64) * (n_words * _WORD_BITS) + day
+    out = np.zeros(n_rows * n_words * 8, dtype=np.uint8)
+    np.bitwise_or.at(out, flat >> 3, np.left_shift(1, flat & 7).astype(np.uint8))
+    return out.view('<u8').reshape(n_rows, n_words)
+
+
+def _shifted(bits: np.ndarray, days: int, n_rows: int, n_words: int) -> np.ndarray:
+    """bits moved `days` later into a zeroed (n_rows, n_words) matrix."""
+    out = np.zeros((n_rows, n_words), dtype=np.uint64)
+    whole, part = divmod(days, _WORD_BITS)
+    rows, width = bits.shape
+    if part == 0:
+        out[:rows, whole:whole + width] = bits
+    else:
+        out[:rows, whole:whole + width] = bits << np.uint64(part)
+        out[:rows, whole + 1:whole + width + 1] |= bits >> np.uint64(_WORD_BITS - part)
+    return out
+
+
+def _grown(prefix: np.ndarray, n_rows: int, n_words: int) -> np.ndarray:
+    """prefix of a bit matrix widened to n_words (the new words hold no bits) and with rows added."""
+    out = np.zeros((n_rows, n_words + 1), dtype=np.int32)
+    rows, width = prefix.shape
+    out[:rows, :width] = prefix
+    out[:rows, width:] = prefix[:, -1:]
+    return out
+
+
+def _bits(word: int) -> int:
+    return bin(word).count('1')
+
+
+def _prefix(bits: np.ndarray) -> np.ndarray:
+    """prefix[r, w] = set bits of row r in words before w."""
+    out = np.zeros((bits.shape[0], bits.shape[1] + 1), dtype=np.int32)
+    np.cumsum(_popcount(bits), axis=1, out=out[:, 1:])
+    return out
+
+
+class AttendanceCalendar:
+    """Per-student daily attendance kept as packed bits with prefix popcounts.
+
+    Every (student key, subject) pair gets one row of present bits and one row
+    of absent bits, indexed by day since the first logged date; the row for
+    subject None is the student's day-level record, where a day counts as
+    attended only if every session logged that day was. Counting the days in
+    any date range is two prefix lookups plus a popcount of the boundary words.
+    """
+
+    def __init__(self, origin: np.datetime64 | None, rows: Dict[Tuple[Hashable, object], int],
+                 present: np.ndarray, absent: np.ndarray,
+                 prefixes: Tuple[np.ndarray, np.ndarray] | None = None, last: int | None = None) -> None:
+        self.origin = origin
+        self._rows = rows
+        self._present = present
+        self._absent = absent
+        self._present_prefix, self._absent_prefix = prefixes if prefixes is not None else (_prefix(present), _prefix(absent))
+        if last is None:
+            logged = np.bitwise_or.reduce(present | absent, axis=0) if present.size else np.zeros(0, dtype=np.uint64)
+            words = np.flatnonzero(logged)
+            last = int(words[-1]) * _WORD_BITS + int(logged[words[-1]]).bit_length() - 1 if len(words) else -1
+        # Day index of the last logged date, -1 when nothing is logged
+        self.last = last
+
+    @classmethod
+    def empty(cls, span: Tuple[object, object] | None = None) -> 'AttendanceCalendar':
+        if span is not None:
+            return cls.from_codes(np.empty(0, dtype=np.intp), [], np.empty(0, dtype=np.intp), [],
+                                  np.empty(0, dtype='datetime64[D]'), np.empty(0, dtype=bool), span)
+        none = np.zeros((0, 0), dtype=np.uint64)
+        return cls(None, {}, none, none)
+
+    @classmethod
+    def build(cls, keys: np.ndarray, subjects: np.ndarray, dates: np.ndarray, present: np.ndarray,
+              span: Tuple[object, object] | None = None) -> 'AttendanceCalendar':
+        """One calendar from parallel arrays of daily log rows.
+
+        dates are datetime64 values and present is a boolean per row; rows
+        with a missing key or date must already be dropped. span, a (first,
+        last) pair of dates, pins day 0 and `last` to those of a larger log
+        the rows were taken from, e.g. one student's rows.
+        """
+        key_codes, key_values = pd.factorize(np.asarray(keys, dtype=object))
+        subject_codes, subject_values = pd.factorize(np.asarray(subjects, dtype=object))
+        return cls.from_codes(key_codes, list(key_values), subject_codes, [str(s) for s in subject_values],
+                              dates, present, span)
+
+    @classmethod
+    def from_codes(cls, key_codes: np.ndarray, keys: List[Hashable], subject_codes: np.ndarray,
+                   subjects: List[str], dates: np.ndarray, present: np.ndarray,
+                   span: Tuple[object, object] | None = None) -> 'AttendanceCalendar':
+        """Like build, for rows whose keys and subjects are already factorized.
+
+        Row i is a session of keys[key_codes[i]] in subjects[subject_codes[i]],
+        or of no subject where subject_codes[i] is -1. Callers can take the
+        codes of a categorical or integer key column instead of hashing one
+        Python key per row.
+        """
+        if len(key_codes) == 0 and span is None:
+            return cls.empty()
+        days = np.asarray(dates).astype('datetime64[D]')
+        origin = days.min() if span is None else np.datetime64(pd.Timestamp(span[0]), 'D')
+        if len(days):
+            origin = min(origin, days.min())
+        day = (days - origin).astype(np.int64)
+        n_words = int(day.max()) // _WORD_BITS + 1 if len(day) else 1
+
+        key_codes = np.asarray(key_codes, dtype=np.int64)
+        subject_codes = np.asarray(subject_codes, dtype=np.int64)
+        with_subject = subject_codes >= 0
+        pair_codes, pairs = pd.factorize(key_codes[with_subject] * max(len(subjects), 1) + subject_codes[with_subject])
+        key_rows, used_keys = pd.factorize(key_codes)
+        n_pairs = len(pairs)
+        group = np.concatenate([pair_codes, key_rows + n_pairs])
+        day = np.concatenate([day[with_subject], day])
+        present = np.concatenate([present[with_subject], present]).astype(bool)
+        n_rows = n_pairs + len(used_keys)
+
+        absent_bits = _pack(group[~present], day[~present], n_rows, n_words)
+        present_bits = _pack(group[present], day[present], n_rows, n_words) & ~absent_bits
+
+        rows: Dict[Tuple[Hashable, object], int] = {}
+        pair_keys, pair_subjects = np.divmod(pairs, max(len(subjects), 1))
+        for i, (k, s) in enumerate(zip(pair_keys, pair_subjects)):
+            rows[(keys[k], subjects[s])] = i
+        for i, k in enumerate(used_keys):
+            rows[(keys[k], None)] = n_pairs + i
+        calendar = cls(origin, rows, present_bits, absent_bits)
+        if span is not None:
+            calendar.last = max(calendar.last, calendar.day_index(span[1]))
+        return calendar
+
+    def extended(self, key_codes: np.ndarray, keys: List[Hashable], subject_codes: np.ndarray,
+                 subjects: List[str], dates: np.ndarray, present: np.ndarray) -> 'AttendanceCalendar':
+        """A new calendar with more log rows (arguments as for from_codes) ORed into a copy of these bits.
+
+        Only the rows the new sessions fall on are repacked and get their
+        prefix counts recomputed, unless a session predates the origin and
+        every row has to shift. A day stays attended only while no session
+        logged for it is absent, as in build. self is left unchanged.
+        """
+        if self.origin is None:
+            return self.from_codes(key_codes, keys, subject_codes, subjects, dates, present)
+        if len(key_codes) == 0:
+            return self
+        days = np.asarray(dates).astype('datetime64[D]')
+        origin = min(self.origin, days.min())
+        shift = int((self.origin - origin).astype(np.int64))
+        day = (days - origin).astype(np.int64)
+
+        # Calendar rows of each distinct (key, subject) among the sessions, adding the unseen ones
+        stride = len(subjects) + 1
+        combined, inverse = np.unique(np.asarray(key_codes, dtype=np.int64) * stride + np.asarray(subject_codes) + 1,
+                                      return_inverse=True)
+        rows = self._rows
+        added: Dict[Tuple[Hashable, object], int] = {}
+        old_rows = self._present.shape[0]
+
+        def row_of(label: Tuple[Hashable, object]) -> int:
+            row = rows.get(label)
+            if row is None:
+                row = added.setdefault(label, old_rows + len(added))
+            return row
+
+        pair_rows = np.empty(len(combined), dtype=np.int64)
+        day_rows = np.empty(len(combined), dtype=np.int64)
+        for i, code in enumerate(combined.tolist()):
+            k, s = divmod(code, stride)
+            day_rows[i] = row_of((keys[k], None))
+            pair_rows[i] = row_of((keys[k], subjects[s - 1])) if s else -1
+        pair_rows, day_rows = pair_rows[inverse], day_rows[inverse]
+        with_subject = pair_rows >= 0
+        group = np.concatenate([pair_rows[with_subject], day_rows])
+        day = np.concatenate([day[with_subject], day])
+        present = np.concatenate([present[with_subject], present]).astype(bool)
+
+        n_rows = old_rows + len(added)
+        old_words = self._present.shape[1]
+        n_words = max(old_words + -(-shift // _WORD_BITS), int(day.max()) // _WORD_BITS + 1)
+        present_bits = _shifted(self._present, shift, n_rows, n_words)
+        absent_bits = _shifted(self._absent, shift, n_rows, n_words)
+        touched, local = np.unique(group, return_inverse=True)
+        absent_bits[touched] |= _pack(local[~present], day[~present], len(touched), n_words)
+        present_bits[touched] = (present_bits[touched] | _pack(local[present], day[present], len(touched), n_words)) \
+            & ~absent_bits[touched]
+
+        if shift:
+            prefixes = (_prefix(present_bits), _prefix(absent_bits))
+        else:
+            prefixes = (_grown(self._present_prefix, n_rows, n_words), _grown(self._absent_prefix, n_rows, n_words))
+            prefixes[0][touched] = _prefix(present_bits[touched])
+            prefixes[1][touched] = _prefix(absent_bits[touched])
+        last = max(self.last + shift if self.last >= 0 else -1, int(day.max()))
+        return AttendanceCalendar(origin, {**rows, **added} if added else rows, present_bits, absent_bits, prefixes, last)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self._present.nbytes + self._absent.nbytes + self._present_prefix.nbytes + self._absent_prefix.nbytes)
+
+    @property
+    def days(self) -> int:
+        return self._present.shape[1] * _WORD_BITS
+
+    def date(self, day: int) -> np.datetime64 | None:
+        return None if self.origin is None else self.origin + np.timedelta64(day, 'D')
+
+    def has(self, key: Hashable, subject: str | None = None) -> bool:
+        return (key, subject) in self._rows
+
+    def subjects(self, key: Hashable) -> List[str]:
+        return sorted(s for k, s in self._rows if k == key and s is not None)
+
+    def day_index(self, date: object) -> int:
+        """Days since the calendar's origin (negative before it); blank or unparseable dates raise ValueError."""
+        try:
+            stamp = pd.Timestamp(date)
+        except (TypeError, ValueError):
+            stamp = pd.NaT
+        if pd.isna(stamp):
+            raise ValueError(f"not a date: {date!r}")
+        if self.origin is None:
+            return 0
+        return int((np.datetime64(stamp, 'D') - self.origin).astype(np.int64))
+
+    def _below(self, bits: np.ndarray, prefix: np.ndarray, row: int, day: int) -> int:
+        """Set bits of row strictly before day."""
+        day = min(max(day, 0), self.days)
+        word, bit = divmod(day, _WORD_BITS)
+        count = int(prefix[row, word])
+        if bit:
+            count += _bits(int(bits[row, word]) & ((1 << bit) - 1))
+        return count
+
+    def count(self, key: Hashable, first: int, last: int, subject: str | None = None) -> Tuple[int, int]:
+        """(days present, days absent) between two day indexes, both inclusive."""
+        row = self._rows.get((key, subject))
+        if row is None or last < first:
+            return 0, 0
+        present = self._below(self._present, self._present_prefix, row, last + 1) \
+            - self._below(self._present, self._present_prefix, row, first)
+        absent = self._below(self._absent, self._absent_prefix, row, last + 1) \
+            - self._below(self._absent, self._absent_prefix, row, first)
+        return present, absent
+
+    def streak(self, key: Hashable, last: int, subject: str | None = None) -> int:
+        """Days attended in a row up to and including day index last.
+
+        Days with nothing logged (weekends, holidays) neither extend nor
+        break a streak. The most recent absence is located by binary search
+        over the absent prefix counts, then within its word.
+        """
+        row = self._rows.get((key, subject))
+        if row is None or last < 0:
+            return 0
+        end = last + 1
+        absences = self._below(self._absent, self._absent_prefix, row, end)
+        if absences == 0:
+            return self._below(self._present, self._present_prefix, row, end)
+        prefix = self._absent_prefix[row]
+        word = int(np.searchsorted(prefix, absences, side='left')) - 1
+        bits = int(self._absent[row, word])
+        if word == min(end, self.days) // _WORD_BITS:
+            bits &= (1 << (end % _WORD_BITS)) - 1
+        last_absent = word * _WORD_BITS + bits.bit_length() - 1
+        return self._below(self._present, self._present_prefix, row, end) \
+            - self._below(self._present, self._present_prefix, row, last_absent + 1)
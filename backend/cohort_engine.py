@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+# students.csv columns that define a cohort
+COHORT_COLUMNS: Tuple[str, ...] = ('department', 'semester')
+
+QUANTILES: Tuple[float, ...] = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+# Grade points live on a 0-10 scale, attendance on 0-100
+_GRADE_BINS = np.linspace(0.0, 10.0, 11)
+_ATTENDANCE_BINS = np.linspace(0.0, 100.0, 11)
+
+
+def _bins(metric: str) -> np.ndarray:
+    return _ATTENDANCE_BINS if 'attendance' in metric else _GRADE_BINS
+
+
+def scalar(value: object) -> object:
+    """Cohort values as plain JSON-friendly Python scalars."""
+    if isinstance(value, (np.integer, np.floating)):
+        value = value.item()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+@dataclass(frozen=True)
+class Distribution:
+    """One metric across one cohort, kept as a sorted array."""
+    values: np.ndarray  # ascending
+
+    @property
+    def count(self) -> int:
+        return int(len(self.values))
+
+    @property
+    def mean(self) -> float:
+        return float(self.values.mean())
+
+    def percentile_rank(self, value: float) -> float:
+        """Share of the cohort (0-100) at or below value, found by binary search."""
+        return 100.0 * float(np.searchsorted(self.values, value, side='right')) / len(self.values)
+
+    def to_dict(self, metric: str) -> Dict:
+        counts, edges = np.histogram(self.values, bins=_bins(metric))
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'quantiles': {f"p{int(q * 100)}": float(v) for q, v in zip(QUANTILES, np.quantile(self.values, QUANTILES))},
+            'histogram': {'edges': edges.tolist(), 'counts': counts.tolist()},
+        }
+
+
+class CohortStats:
+    """Per-cohort, per-metric distributions of the per-student metrics table."""
+
+    def __init__(self, distributions: Dict[str, Dict[object, Dict[str, Distribution]]],
+                 sizes: Dict[str, Dict[object, int]]) -> None:
+        self._distributions = distributions
+        self._sizes = sizes
+
+    @classmethod
+    def build(cls, metrics: pd.DataFrame) -> 'CohortStats':
+        """Sort every (cohort, metric) group at once and keep each group's slice.
+
+        metrics has one row per student: the cohort columns plus numeric
+        metric columns (avg_grade, avg_attendance, grade:<subject>, ...).
+        """
+        dims = [d for d in COHORT_COLUMNS if d in metrics.columns]
+        metric_cols = [c for c in metrics.columns if c not in COHORT_COLUMNS]
+        distributions: Dict[str, Dict[object, Dict[str, Distribution]]] = {}
+        sizes: Dict[str, Dict[object, int]] = {}
+        values = metrics[metric_cols].to_numpy(dtype=float) if metric_cols else np.empty((len(metrics), 0))
+        metric_idx = np.broadcast_to(np.arange(len(metric_cols)), values.shape)
+        for dim in dims:
+            cohort_codes, cohort_values = pd.factorize(metrics[dim], sort=True)
+            counts = np.bincount(cohort_codes[cohort_codes >= 0], minlength=len(cohort_values))
+            sizes[dim] = {scalar(v): int(n) for v, n in zip(cohort_values, counts)}
+            # One row per (student, metric); group id = cohort * n_metrics + metric
+            codes = np.broadcast_to(cohort_codes[:, None], values.shape)
+            keep = (codes >= 0) & ~np.isnan(values)
+            group = codes[keep] * len(metric_cols) + metric_idx[keep]
+            flat = values[keep]
+            order = np.lexsort((flat, group))
+            group, flat = group[order], flat[order]
+            bounds = np.searchsorted(group, np.arange(len(cohort_values) * len(metric_cols) + 1))
+            by_cohort: Dict[object, Dict[str, Distribution]] = {}
+            for g in np.flatnonzero(np.diff(bounds)):
+                c, m = divmod(int(g), len(metric_cols))
+                by_cohort.setdefault(scalar(cohort_values[c]), {})[metric_cols[m]] = Distribution(flat[bounds[g]:bounds[g + 1]])
+            distributions[dim] = by_cohort
+        return cls(distributions, sizes)
+
+    def updated(self, metrics: pd.DataFrame, cohorts: Dict[str, np.ndarray]) -> 'CohortStats':
+        """A copy with the given cohorts of each dimension rebuilt from metrics; the others are shared.
+
+        metrics is the whole per-student table, as for build().
+        """
+        distributions = {dim: dict(by_cohort) for dim, by_cohort in self._distributions.items()}
+        sizes = {dim: dict(by_cohort) for dim, by_cohort in self._sizes.items()}
+        metric_cols = [c for c in metrics.columns if c not in COHORT_COLUMNS]
+        for dim, values in cohorts.items():
+            if dim not in metrics.columns or not len(values):
+                continue
+            rebuilt = CohortStats.build(metrics.loc[metrics[dim].isin(values), [dim, *metric_cols]])
+            for value in map(scalar, values):
+                for target, source in ((distributions, rebuilt._distributions), (sizes, rebuilt._sizes)):
+                    if value in source.get(dim, {}):
+                        target.setdefault(dim, {})[value] = source[dim][value]
+                    else:
+                        target.get(dim, {}).pop(value, None)
+        return CohortStats(distributions, sizes)
+
+    def dimensions(self) -> List[str]:
+        return list(self._distributions)
+
+    def get(self, dimension: str, cohort: object) -> Dict[str, Distribution]:
+        return self._distributions.get(dimension, {}).get(scalar(cohort), {})
+
+    def size(self, dimension: str, cohort: object) -> int:
+        return self._sizes.get(dimension, {}).get(scalar(cohort), 0)
+
+    def percentiles(self, dimension: str, cohort: object, values: Dict[str, float]) -> Dict[str, float]:
+        """Percentile rank of each given metric value within the cohort."""
+        dists = self.get(dimension, cohort)
+        return {
+            m: round(dists[m].percentile_rank(v), 1)
+            for m, v in values.items()
+            if m in dists and v is not None and not np.isnan(v)
+        }
+
+    def to_dict(self, dimension: str) -> Dict[str, Dict]:
+        """Every cohort of one dimension with the summary of each metric's distribution."""
+        return {
+            str(cohort): {
+                'size': self.size(dimension, cohort),
+                'metrics': {m: d.to_dict(m) for m, d in dists.items()},
+            }
+            for cohort, dists in self._distributions.get(dimension, {}).items()
+        }
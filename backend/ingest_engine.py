@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import csv
+import io
+import logging
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Set
+
+import pandas as pd
+
+import processing_engine as pe
+import table_engine as te
+
+try:
+    import fcntl  # type: ignore
+except Exception:  # pragma: no cover - not available on Windows
+    fcntl = None  # Appends are then only serialized between threads of one process
+
+
+logger = logging.getLogger(__name__)
+
+# Columns of each table's event log; an event fills either student_id or usn
+LOG_COLUMNS: Dict[str, List[str]] = {
+    'grades': ['student_id', 'usn', 'subject', 'grade'],
+    'attendance': ['student_id', 'usn', 'subject', 'date', 'attendance'],
+}
+
+MAX_EVENTS = 5000  # per request
+
+# A log is compacted into its columnar file once it grows past this size
+COMPACT_BYTES = int(float(os.getenv('EDUWEAVE_WAL_COMPACT_MB', '16')) * 1024 * 1024)
+
+_thread_lock = threading.Lock()
+
+
+class UnsupportedBackend(Exception):
+    """The configured storage backend cannot serve ingested events."""
+
+
+def _wal_dir() -> Path:
+    return pe.storage().data_dir / te.WAL_DIRNAME
+
+
+@contextmanager
+def _log_lock(name: str) -> Iterator[None]:
+    """Serialize appends to and compaction of one table's log across threads and processes."""
+    wal_dir = _wal_dir()
+    wal_dir.mkdir(parents=True, exist_ok=True)
+    with _thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(wal_dir / f".{name}.lock", 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _key_fields(event: Dict) -> List[object]:
+    raw = event.get('id', event.get('student_id', event.get('usn')))
+    if isinstance(raw, bool) or not isinstance(raw, (int, str)) or not str(raw).strip():
+        raise ValueError("needs an id (numeric student_id or USN)")
+    key = te.parse_student_key(raw)
+    return [key, ''] if isinstance(key, int) else ['', key]
+
+
+def _subject(event: Dict, default: str | None = None) -> str:
+    subject = event.get('subject', default)
+    if not isinstance(subject, str) or not subject.strip():
+        raise ValueError("needs a subject name")
+    return subject.strip()
+
+
+def _grade_row(event: Dict) -> List[object]:
+    grade = event.get('grade')
+    if isinstance(grade, bool) or not isinstance(grade, (int, float, str)) \
+            or pd.isna(te.grade_points(pd.Series([grade], dtype=object)).iloc[0]):
+        raise ValueError(f"unknown grade {grade!r}")
+    return [*_key_fields(event), _subject(event), grade]
+
+
+def _attendance_row(event: Dict) -> List[object]:
+    date = pd.to_datetime(event.get('date'), errors='coerce') if isinstance(event.get('date'), str) else pd.NaT
+    if pd.isna(date):
+        raise ValueError("needs a date, e.g. 2023-02-01")
+    if 'attendance' in event:
+        value = event['attendance']
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 <= value <= 100:
+            raise ValueError("attendance must be a number from 0 to 100")
+    else:
+        value = te.ATTENDANCE_STATUS.get(str(event.get('status', '')).strip().lower())
+        if value is None:
+            raise ValueError(f"unknown status {event.get('status')!r}")
+    return [*_key_fields(event), _subject(event, te.OVERALL_SUBJECT), date.strftime('%Y-%m-%d'), value]
+
+
+_ROW_BUILDERS: Dict[str, Callable[[Dict], List[object]]] = {
+    'grades': _grade_row,
+    'attendance': _attendance_row,
+}
+
+
+def _check_backend() -> None:
+    if pe.storage().name != 'pandas':
+        raise UnsupportedBackend("Event ingestion needs the pandas storage backend")
+
+
+def append(name: str, events: object) -> Dict:
+    """Validate a batch of events and append it durably to the table's log.
+
+    The batch is checked as a whole before anything is written, then
+    appended and fsynced under the log lock, so it is kept entirely or not
+    at all. The events are folded into this process's served data before
+    returning (other workers follow on their next request). Returns
+    {table, accepted, data_version}; bad batches raise ValueError, and
+    UnsupportedBackend is raised when the storage cannot take events.
+    """
+    _check_backend()
+    if name not in LOG_COLUMNS:
+        raise ValueError(f"Unknown event table {name!r}; use one of {list(LOG_COLUMNS)}")
+    if not isinstance(events, list) or not events:
+        raise ValueError('Expect JSON {"events": [{...}, ...]}')
+    if len(events) > MAX_EVENTS:
+        raise ValueError(f"At most {MAX_EVENTS} events per request")
+    rows: List[List[object]] = []
+    for i, event in enumerate(events):
+        try:
+            if not isinstance(event, dict):
+                raise ValueError("must be an object")
+            rows.append(_ROW_BUILDERS[name](event))
+        except ValueError as e:
+            raise ValueError(f"events[{i}] {e}") from None
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator='\n').writerows(rows)
+
+    with _log_lock(name):
+        # Read under the lock: a compaction may have started a new generation
+        files = te.EventFiles.read(pe.storage().data_dir, name)
+        created = not files.log.exists()
+        with open(files.log, 'a+b') as f:
+            if f.tell() == 0:
+                f.write((','.join(LOG_COLUMNS[name]) + '\n').encode('utf-8'))
+            else:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    f.write(b'\n')  # end a line left partial by a crashed writer
+            f.write(buf.getvalue().encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        if created:
+            te.fsync_path(files.log.parent)
+    if size >= COMPACT_BYTES:
+        compact(name)
+    return {'table': name, 'accepted': len(rows), 'data_version': pe.data_version(wait=True)}
+
+
+def _generation(path: Path) -> int:
+    """Generation number in a log or compacted file name, e.g. grades-compacted-3.arrow -> 3."""
+    try:
+        return int(path.name.split('.')[0].rsplit('-', 1)[1])
+    except (IndexError, ValueError):
+        return -1
+
+
+def _prune(name: str, keep_from: int, segments: Set[str]) -> None:
+    """Remove logs older than generation keep_from and compacted files not among segments."""
+    for path in _wal_dir().glob(f"{name}-[0-9]*.csv"):
+        if 0 <= _generation(path) < keep_from:
+            path.unlink(missing_ok=True)
+    for path in _wal_dir().glob(f"{name}-compacted-*"):
+        if path.name.split('.')[0] not in segments and 0 <= _generation(path) < keep_from:
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink(missing_ok=True)
+
+
+def compact(name: str) -> Dict:
+    """Move the table's event log into a new columnar segment and start the next log generation.
+
+    Only the log is written, so a compaction costs the size of the log and
+    not of every event compacted before. The segment and the next (empty)
+    log become visible together when the manifest is replaced, so readers
+    never count an event twice or miss one; a reader that had read the
+    whole log carries on without reloading. The segment is synced to disk
+    before the manifest names it. The previous log is kept for readers
+    still on it, and stands in for the segment should that be lost.
+    Returns {table, compacted, generation}.
+    """
+    _check_backend()
+    if name not in LOG_COLUMNS:
+        raise ValueError(f"Unknown event table {name!r}; use one of {list(LOG_COLUMNS)}")
+    with _log_lock(name):
+        files = te.EventFiles.read(pe.storage().data_dir, name)
+        try:
+            with open(files.log, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b''
+        data = data[:data.rfind(b'\n') + 1]
+        if data.count(b'\n') < 2:  # header only
+            return {'table': name, 'compacted': 0, 'generation': files.generation}
+        log = pd.read_csv(io.BytesIO(data), dtype=str)
+        rows = log.reindex(columns=LOG_COLUMNS[name]).astype(object)
+
+        generation = files.generation + 1
+        base = files.manifest.parent / f"{name}-compacted-{generation}"
+        te.write_snapshot(rows, base, {'table': name, 'rows': int(len(rows))})
+        segments = [{'name': seg.base.name, 'log_bytes': seg.log_bytes} for seg in files.segments]
+        segments.append({'name': base.name, 'log_bytes': len(data)})
+        te.write_json(files.manifest, {'generation': generation, 'segments': segments})
+        _prune(name, keep_from=files.generation, segments={seg['name'] for seg in segments})
+    logger.info("Compacted %d %s events into %s", len(log), name, base)
+    return {'table': name, 'compacted': int(len(log)), 'generation': generation}
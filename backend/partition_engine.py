@@ -0,0 +1,333 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from functools import reduce
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence, Tuple
+from urllib.parse import unquote
+
+import numpy as np
+import pandas as pd
+
+import calendar_engine as cal
+import table_engine as te
+
+
+logger = logging.getLogger(__name__)
+
+# Partition files whose rows are kept loaded for per-student lookups; the
+# least recently used one is dropped first
+PARTITION_CACHE_SIZE = int(os.getenv('EDUWEAVE_PARTITION_CACHE_SIZE', '16'))
+
+# Aggregates kept, one per partition file and one per set of partitions
+# merged for a request; the least recently used one is dropped first
+PARTITION_AGGREGATE_CACHE_SIZE = int(os.getenv('EDUWEAVE_PARTITION_AGGREGATE_CACHE_SIZE', '4096'))
+
+# Seconds a listing of a partition directory is trusted before the tree is
+# walked (and every file stat'ed) again; 0 walks it on every access
+PARTITION_SCAN_TTL = float(os.getenv('EDUWEAVE_PARTITION_SCAN_TTL', '2'))
+
+# Directory value Hive and Spark write for rows whose partition column is null
+_NULL_VALUE = '__HIVE_DEFAULT_PARTITION__'
+
+
+def _equal(partition: str, value: object) -> bool:
+    try:
+        return float(partition) == float(value)  # semester=5 holds 5.0
+    except (TypeError, ValueError):
+        return partition == str(value)
+
+
+def _up_to(partition: str, value: object) -> bool:
+    try:
+        return float(partition) <= float(value)
+    except (TypeError, ValueError):
+        return True
+
+
+# How the rows under a col=value directory relate to students.csv: 'equal'
+# when they all belong to students whose col is value, 'up_to' when their
+# students' col is at least value (a student in semester 5 has rows under
+# semester=1 to semester=5). Lookups for a student or a cohort skip the
+# partitions that cannot hold its rows. EDUWEAVE_PARTITION_PRUNE overrides
+# it as col=rule pairs, e.g. "department=equal"; "" turns pruning off.
+PRUNE_RULES: Dict[str, Callable[[str, object], bool]] = {
+    col.strip(): {'equal': _equal, 'up_to': _up_to}[rule.strip()]
+    for col, _, rule in (
+        pair.partition('=') for pair in
+        os.getenv('EDUWEAVE_PARTITION_PRUNE', 'department=equal,semester=up_to').split(',') if pair.strip()
+    )
+}
+
+Cohort = Dict[str, List[object]]  # column -> values a student or query may have; absent columns match anything
+
+
+def _files(root: Path) -> List[Tuple[str, Tuple[int, int]]]:
+    """(path relative to root, (mtime_ns, size)) of each CSV under root, in path order.
+
+    Hidden and _-prefixed entries (e.g. _SUCCESS markers) are skipped.
+    """
+    found: List[Tuple[str, Tuple[int, int]]] = []
+
+    def walk(directory: str, prefix: str) -> None:
+        try:
+            entries = sorted(os.scandir(directory), key=lambda e: e.name)
+        except OSError:
+            return  # removed while listing
+        for entry in entries:
+            if entry.name.startswith(('.', '_')):
+                continue
+            try:
+                if entry.is_dir():
+                    walk(entry.path, prefix + entry.name + '/')
+                elif entry.name.endswith('.csv'):
+                    st = entry.stat()
+                    found.append((prefix + entry.name, (st.st_mtime_ns, st.st_size)))
+            except OSError:
+                continue
+
+    walk(str(root), '')
+    return found
+
+
+# root -> (monotonic time of the walk, its listing)
+_listings: Dict[Path, Tuple[float, List[Tuple[str, Tuple[int, int]]]]] = {}
+_listings_lock = threading.Lock()
+
+
+def _listing(root: Path) -> List[Tuple[str, Tuple[int, int]]]:
+    """_files(root), walked again only once PARTITION_SCAN_TTL has passed."""
+    now = time.monotonic()
+    with _listings_lock:
+        cached = _listings.get(root)
+    if cached is not None and now - cached[0] < PARTITION_SCAN_TTL:
+        return cached[1]
+    files = _files(root)
+    with _listings_lock:
+        _listings[root] = (now, files)
+    return files
+
+
+def partition_values(name: str) -> Dict[str, str]:
+    """Canonical column -> value from the col=value directories of a partition file's relative path."""
+    raw: Dict[str, str] = {}
+    for part in name.split('/')[:-1]:
+        col, sep, value = part.partition('=')
+        if sep and value != _NULL_VALUE:
+            raw[unquote(col)] = unquote(value)
+    columns = te.apply_aliases(pd.DataFrame(columns=list(raw))).columns
+    return dict(zip(columns, raw.values()))
+
+
+def fingerprint(root: Path) -> Tuple[int, int]:
+    """(hash, total size) over every partition file's path, mtime and size, as last listed."""
+    files = _listing(root)
+    digest = hashlib.sha256(repr(files).encode('utf-8')).hexdigest()
+    return int(digest[:15], 16), sum(fp[1] for _, fp in files)
+
+
+def _read(table: str, path: Path, values: Dict[str, str]) -> Tuple[pd.DataFrame, te.Validation]:
+    """One partition file, validated and normalized, with its partition columns filled in.
+
+    A column the file carries itself keeps the file's values.
+    """
+    frame, report = te.load_checked(path, te.TABLES[table][1])
+    missing = {col: [value] for col, value in values.items() if col not in frame.columns}
+    if missing:
+        typed = te.normalize_frame(pd.DataFrame(missing))
+        first = np.zeros(len(frame), dtype=np.intp)
+        for col in typed.columns:
+            frame[col] = typed[col].array.take(first)
+    return frame, report
+
+
+Loaded = Tuple[pd.DataFrame, te.RowIndex, te.Validation]
+
+
+# Loaded partition files by path, versioned by fingerprint
+_frames = te.VersionedCache(PARTITION_CACHE_SIZE)
+
+
+@dataclass(frozen=True)
+class _Aggregates:
+    stats: Dict[str, te.SubjectStats]
+    rollups: te.Rollups
+    validation: te.Validation
+    span: Tuple[np.datetime64, np.datetime64] | None  # first and last logged day
+
+
+# _Aggregates of one partition file by path, versioned by fingerprint, and
+# merged aggregates of a set of files by their paths (see merged); files that
+# changed or went away age out like any other entry
+_aggregates = te.VersionedCache(PARTITION_AGGREGATE_CACHE_SIZE)
+
+
+@dataclass(frozen=True)
+class _Partition:
+    """One partition file of a catalog; its rows and aggregates are read on first use."""
+    table: str
+    path: Path
+    name: str  # path relative to the table directory
+    values: Dict[str, str]  # partition column -> value, from the directory names
+    fingerprint: Tuple[int, int]
+
+    def load(self) -> Loaded:
+        """The partition's rows, per-student row index and validation, from the frame cache when there."""
+        entry = _frames.get_many([self.path], self.fingerprint).get(self.path)
+        if entry is None:
+            logger.debug("Loading partition %s", self.path)
+            frame, report = _read(self.table, self.path, self.values)
+            entry = (frame, te.build_row_index(frame), report)
+            _frames.put_many({self.path: entry}, self.fingerprint)
+        return entry
+
+    def aggregates(self) -> _Aggregates:
+        found = _aggregates.get_many([self.path], self.fingerprint).get(self.path)
+        if found is not None:
+            return found
+        frame, _, report = self.load()
+        value_col = te.VALUE_COLUMNS[self.table]
+        span = None
+        if 'date' in frame.columns and frame['date'].notna().any():
+            span = (np.datetime64(frame['date'].min(), 'D'), np.datetime64(frame['date'].max(), 'D'))
+        found = _Aggregates(te.build_stats(frame, value_col), te.build_rollups(frame, value_col), report, span)
+        _aggregates.put_many({self.path: found}, self.fingerprint)
+        return found
+
+    def matches(self, cohort: Cohort | None) -> bool:
+        """False when, by its directory values, the partition holds no rows of the cohort's students."""
+        for col, allowed in (cohort or {}).items():
+            rule, value = PRUNE_RULES.get(col), self.values.get(col)
+            if rule is not None and value is not None and not any(rule(value, v) for v in allowed):
+                return False
+        return True
+
+    def may_hold(self, key: te.StudentKey) -> bool:
+        """False when the partition certainly has no rows for key."""
+        stats = self.aggregates().stats
+        if not stats:
+            return True  # no value column to index keys by
+        kind = stats.get(te.key_kind(key))
+        return kind is not None and kind.rows(key) is not None
+
+
+def scan(name: str, root: Path, current: Tuple[_Partition, ...] = ()) -> Tuple[_Partition, ...]:
+    """The catalog of partition files under root, as last listed; no file is read.
+
+    Partitions unchanged since current (the previous catalog) are kept.
+    """
+    known = {(p.path, p.fingerprint): p for p in current}
+    partitions = tuple(
+        known.get((root / relative, fp)) or _Partition(name, root / relative, relative, partition_values(relative), fp)
+        for relative, fp in _listing(root)
+    )
+    logger.info("%s: %d partitions, %d new or changed", root, len(partitions),
+                sum(1 for p in partitions if (p.path, p.fingerprint) not in known))
+    return partitions
+
+
+def candidates(partitions: Sequence[_Partition], cohort: Cohort | None) -> Tuple[_Partition, ...]:
+    """The partitions that may hold rows of the cohort's students (all of them for None)."""
+    return tuple(p for p in partitions if p.matches(cohort))
+
+
+def merged_stats(partitions: Sequence[_Partition]) -> Dict[str, te.SubjectStats]:
+    """Per-subject sums and counts over the partitions, in one grouped pass per key kind."""
+    by_kind: Dict[str, List[te.SubjectStats]] = {}
+    for part in partitions:
+        for kind, stats in part.aggregates().stats.items():
+            by_kind.setdefault(kind, []).append(stats)
+    merged: Dict[str, te.SubjectStats] = {}
+    for kind, parts in by_kind.items():
+        if len(parts) == 1:
+            merged[kind] = parts[0]
+            continue
+        both = pd.concat([st.frame for st in parts], ignore_index=True)
+        merged[kind] = te.SubjectStats.from_grouped(
+            both.groupby(['key', 'subject'], observed=True)[['sum', 'count']].sum().reset_index())
+    return merged
+
+
+def merged_rollups(partitions: Sequence[_Partition]) -> te.Rollups:
+    """Weekly and monthly rollups over the partitions."""
+    by_kind: Dict[Tuple[str, str], List[te.Rollup]] = {}
+    for part in partitions:
+        for period, rollups in part.aggregates().rollups.items():
+            for kind, rollup in rollups.items():
+                by_kind.setdefault((period, kind), []).append(rollup)
+    merged: te.Rollups = {}
+    for (period, kind), parts in by_kind.items():
+        if len(parts) == 1:
+            rollup = parts[0]
+        else:
+            both = pd.concat([r.frame for r in parts], ignore_index=True)
+            grouped = both.groupby(['key', 'subject', 'period'], observed=True)[['sum', 'count']].sum()
+            rollup = te.Rollup.from_grouped(grouped.reset_index())
+        merged.setdefault(period, {})[kind] = rollup
+    return merged
+
+
+def merged(partitions: Sequence[_Partition], stats: Dict[str, te.SubjectStats], rollups: te.Rollups,
+           version: object) -> Tuple[Dict[str, te.SubjectStats], te.Rollups]:
+    """merged_stats and merged_rollups of the partitions, with stats and rollups (e.g. of ingested events) on top.
+
+    The result is cached with the partitions' own aggregates; version must
+    change whenever stats or rollups do.
+    """
+    key = tuple(p.path for p in partitions)
+    version = (tuple(p.fingerprint for p in partitions), version)
+    found = _aggregates.get_many([key], version).get(key)
+    if found is None:
+        total = merged_stats(partitions)
+        for kind, extra in stats.items():
+            total[kind] = total[kind].merged(extra) if kind in total else extra
+        found = (total, te.merge_rollups(merged_rollups(partitions), rollups))
+        _aggregates.put_many({key: found}, version)
+    return found
+
+
+def merged_validation(partitions: Sequence[_Partition]) -> te.Validation:
+    return reduce(lambda report, p: report.merged(p.aggregates().validation), partitions, te.Validation())
+
+
+def student_rows(name: str, partitions: Sequence[_Partition], key: te.StudentKey) -> pd.DataFrame:
+    """Rows of one student, loading only the partitions that hold some."""
+    parts: List[pd.DataFrame] = []
+    for part in partitions:
+        if part.may_hold(key):
+            frame, index, _ = part.load()
+            pos = index.get(te.key_kind(key), {}).get(key)
+            if pos is not None:
+                parts.append(frame.iloc[pos])
+    if not parts:
+        return pd.DataFrame(columns=te.TABLES[name][1])
+    return pd.concat(parts, ignore_index=True)
+
+
+def calendar(name: str, partitions: Sequence[_Partition], key: te.StudentKey,
+             extra: pd.DataFrame | None = None,
+             span: Tuple[np.datetime64, np.datetime64] | None = None) -> cal.AttendanceCalendar:
+    """Bitset calendar of one student's rows, spanning the days of the given partitions.
+
+    Pass the partitions that may hold the student (see candidates), so
+    the others are not read. extra holds more of the student's rows (e.g.
+    ingested events) and span the first and last day they were logged on
+    for anyone; both are folded in.
+    """
+    spans = [p.aggregates().span for p in partitions] + [span]
+    spans = [s for s in spans if s is not None]
+    span = (min(s[0] for s in spans), max(s[1] for s in spans)) if spans else None
+    rows = student_rows(name, partitions, key)
+    if extra is not None and len(extra):
+        rows = pd.concat([rows.astype(object), extra.astype(object)], ignore_index=True) if len(rows) else extra
+    return te.calendar_from_frame(rows, span)
+
+
+def cache_stats() -> Dict[str, Dict[str, object]]:
+    """Size, hit/miss counters and hit rate of the loaded-partition and aggregate caches."""
+    return {'frames': _frames.stats(), 'aggregates': _aggregates.stats()}
@@ -1,27 +1,89 @@
 from __future__ import annotations
 
+import hashlib
+import io
 import json
+import logging
 import os
+import sys
+import threading
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timezone
+from functools import cached_property, reduce
 from pathlib import Path
-from typing import Dict, Tuple, List
+from typing import BinaryIO, Dict, Iterable, Tuple, List
 
+import numpy as np
 import pandas as pd
 
+import calendar_engine as cal
+import cohort_engine as ce
+import partition_engine
+import query_engine as qe
+import risk_engine as risk
+import shared_engine
+import similarity_engine as sim
+import sqlite_engine
+import table_engine as te
+from table_engine import BASE_DIR, DATA_DIR, TABLES, StudentKey, parse_student_key  # noqa: F401 - part of this module's API
 
-BASE_DIR = Path(__file__).resolve().parent
-DATA_DIR = BASE_DIR / 'data'
 
+logger = logging.getLogger(__name__)
+
+# Daily logs that only ever grow; appends are ingested from the last offset
+# once everything before it still hashes the same
+APPEND_ONLY_TABLES = ('attendance',)
+
+# 'pandas' keeps every table resident in each process (see _DataStore);
+# 'sqlite' imports the CSVs into one indexed database file and answers
+# summaries with queries (see sqlite_engine.SqliteStore)
+STORAGE_BACKEND = os.getenv('EDUWEAVE_STORAGE', 'pandas').strip().lower()
+
+# Value tables can be folded chunk by chunk into their aggregates instead of
+# being held as frames: 'auto' streams files above the size threshold,
+# 'always' / 'never' force the choice.
+STREAMING_MODE = os.getenv('EDUWEAVE_STREAMING', 'auto').strip().lower()
+STREAMING_THRESHOLD_BYTES = int(float(os.getenv('EDUWEAVE_STREAMING_THRESHOLD_MB', '512')) * 1024 * 1024)
+STREAM_CHUNK_ROWS = int(os.getenv('EDUWEAVE_STREAM_CHUNK_ROWS', '200000'))
+
+# With several worker processes, publish each normalized table once into
+# shared memory and map it read-only in every worker (see shared_engine)
+SHARED_DATA = os.getenv('EDUWEAVE_SHARED_DATA', '0').strip().lower() in ('1', 'true', 'yes')
+
+# Value tables may instead be a directory of CSVs laid out by partition, e.g.
+# <data dir>/attendance/semester=5/dept=CS/part-0.csv; the directory is used
+# when it exists and its col=value names become columns of the rows below
+# them. Files are read and aggregated when a request first needs them, and
+# requests about one student or cohort read just the partitions that may
+# hold its rows (see partition_engine). pandas backend only.
+PARTITIONED_TABLES = ('grades', 'attendance')
+
+
+def _load_table(path: Path, columns: List[str]) -> pd.DataFrame:
+    return te.load_checked(path, columns)[0]
 
-def _read_csv(path: Path, columns: List[str] | None = None) -> pd.DataFrame:
-    """Read CSV if present, else return empty DataFrame with optional columns."""
-    if path.exists():
-        try:
-            df = pd.read_csv(path)
-            return df
-        except Exception:
-            # Corrupt or unreadable file; fall back to empty
-            return pd.DataFrame(columns=columns or [])
-    return pd.DataFrame(columns=columns or [])
+
+def _concat_encoded(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """frames stacked in order without decoding the categorical columns of the first one."""
+    first, rest = frames[0].copy(deep=False), [f.copy(deep=False) for f in frames[1:]]
+    for col in first.columns:
+        if isinstance(first[col].dtype, pd.CategoricalDtype):
+            values = [f[col].dropna().unique() for f in rest if col in f.columns]
+            extra = pd.Index(np.concatenate(values) if values else []).unique().difference(first[col].cat.categories)
+            if len(extra):
+                first[col] = first[col].cat.add_categories(extra)
+            for f in rest:
+                if col in f.columns:
+                    f[col] = pd.Categorical(f[col], categories=first[col].cat.categories)
+    return pd.concat([first, *rest], ignore_index=True)
+
+
+def _plain_nbytes(series: pd.Series) -> int:
+    """Bytes a categorical column would take as a plain object column."""
+    codes = series.cat.codes.to_numpy()
+    counts = np.bincount(codes[codes >= 0], minlength=len(series.cat.categories))
+    sizes = np.fromiter((sys.getsizeof(c) for c in series.cat.categories), dtype=np.int64, count=len(counts))
+    return int(counts @ sizes) + 8 * len(series)
 
 
 def load_csvs() -> Dict[str, pd.DataFrame]:
@@ -32,32 +94,1208 @@ def load_csvs() -> Dict[str, pd.DataFrame]:
       - grades.csv: columns ~ [student_id, subject, grade]
       - attendance.csv: columns ~ [student_id, subject, attendance]
       - projects.csv: columns ~ [student_id, project_name, description, tags]
+
+    Headers are matched through te.COLUMN_ALIASES (e.g. USN -> usn, id ->
+    student_id), letter grades are converted to points and daily
+    USN,Date,Status logs to attendance percentages. Rows that fail
+    validation (see te.checked) are dropped.
+
+    Always parses from disk; request handlers should go through get_data().
+    """
+    return {name: _load_table(DATA_DIR / fname, columns) for name, (fname, columns) in TABLES.items()}
+
+
+Sources = Tuple[te.Fingerprint, te.Fingerprint, te.Fingerprint]  # source file, event manifest, event log
+
+
+def _stream_stats(path: Path, columns: List[str], value_col: str,
+                  calendar: cal.AttendanceCalendar | None = None,
+                  ) -> Tuple[pd.DataFrame, Dict[str, te.SubjectStats], te.Rollups, te.Validation, cal.AttendanceCalendar | None]:
+    """Fold a CSV into per-subject aggregates and rollups one chunk at a time.
+
+    Peak memory is one chunk plus the aggregates; the returned frame is empty
+    and only carries the header columns. When a calendar is passed, each
+    chunk's daily log is ORed into it too and the grown calendar returned.
+    """
+    header = pd.DataFrame(columns=columns)
+    sums: Dict[str, te.PartialSums] = {}
+    period_sums: Dict[Tuple[str, str], te.PartialSums] = {}
+    report = te.Validation()
+    try:
+        for chunk in pd.read_csv(path, chunksize=STREAM_CHUNK_ROWS):
+            chunk, checked = te.checked(chunk, first_line=2 + report.rows)
+            report = report.merged(checked)
+            header = chunk.iloc[0:0]
+            for kind, partial in te.subject_sums(chunk, value_col).items():
+                sums.setdefault(kind, te.PartialSums(['key', 'subject'])).add(partial)
+            for period, by_kind in te.period_sums(chunk, value_col).items():
+                for kind, partial in by_kind.items():
+                    period_sums.setdefault((period, kind), te.PartialSums(['key', 'subject', 'period'])).add(partial)
+            if calendar is not None:
+                calendar = te.extend_calendar(calendar, chunk)
+    except Exception as e:
+        logger.warning("Streaming read of %s failed: %s", path, e)
+        return pd.DataFrame(columns=columns), {}, {}, te.Validation(), None if calendar is None else cal.AttendanceCalendar.empty()
+    stats = {kind: te.SubjectStats.from_grouped(partials.result()) for kind, partials in sums.items()}
+    rollups: te.Rollups = {}
+    for (period, kind), partials in period_sums.items():
+        # Sorted and given running totals once, not once per chunk
+        rollups.setdefault(period, {})[kind] = te.Rollup.from_grouped(partials.result())
+    return header, stats, rollups, report, calendar
+
+
+def _use_streaming(name: str, fp: Tuple[int, int] | None) -> bool:
+    if name not in te.VALUE_COLUMNS or fp is None or STREAMING_MODE == 'never':
+        return False
+    return STREAMING_MODE == 'always' or fp[1] >= STREAMING_THRESHOLD_BYTES
+
+
+Chunk = Tuple[pd.DataFrame, te.RowIndex]  # rows and their per-student index
+
+
+def _joined(older: Chunk, newer: Chunk) -> Chunk:
+    """Two chunks as one, newer's rows after older's."""
+    frame = _concat_encoded([older[0], newer[0]])
+    index = {kind: dict(by_key) for kind, by_key in older[1].items()}
+    base = len(older[0])
+    for kind, by_key in newer[1].items():
+        target = index.setdefault(kind, {})
+        for key, pos in by_key.items():
+            prev = target.get(key)
+            target[key] = pos + base if prev is None else np.concatenate([prev, pos + base])
+    return frame, index
+
+
+@dataclass(frozen=True)
+class _Table:
+    """One loaded table: its rows, per-student aggregates and where on disk they came from.
+
+    Appended rows go to chunks rather than into a copy of base. A new chunk
+    is joined with the one before it (base included, unless it is shared)
+    while that is no bigger, so each row is copied O(log n) times however
+    the appends come; frame stacks what is left on first use.
+    """
+    base: pd.DataFrame  # empty (header only) when streamed
+    fingerprint: Tuple[int, int] | None
+    index: te.RowIndex  # of base
+    stats: Dict[str, te.SubjectStats]
+    tags: te.ProjectTags | None = None
+    offset: int = -1  # bytes of the file reflected in frame; -1 when unknown
+    digest: str = ''  # sha256 of the first offset bytes
+    streamed: bool = False  # rows were folded into stats and not kept
+    rollups: te.Rollups | None = None  # dated value tables only
+    events_fingerprint: Tuple[int, int] | None = None  # event manifest folded in (te.EVENT_TABLES)
+    events_generation: int = 0  # of the log the log_* fields refer to
+    log_fingerprint: Tuple[int, int] | None = None
+    log_offset: int = 0  # bytes of the event log reflected in frame
+    log_digest: str = ''  # sha256 of the first log_offset bytes
+    validation: te.Validation = field(default_factory=te.Validation)  # of the source file
+    partitions: Tuple = ()  # partition_engine._Partition per file, for PARTITIONED_TABLES read from a directory
+    calendar: cal.AttendanceCalendar | None = None  # attendance only; grown with the rows, streamed or not
+    chunks: Tuple[Chunk, ...] = ()  # rows appended after base, oldest first
+    shared: bool = False  # base is a read-only map shared with other workers (SHARED_DATA)
+
+    def sources(self) -> Sources:
+        return self.fingerprint, self.events_fingerprint, self.log_fingerprint
+
+    def _parts(self) -> Tuple[Chunk, ...]:
+        return ((self.base, self.index),) + self.chunks
+
+    @cached_property
+    def frame(self) -> pd.DataFrame:
+        """base and the chunks as one frame."""
+        if not self.chunks:
+            return self.base
+        return _concat_encoded([frame for frame, _ in self._parts()])
+
+    @cached_property
+    def members(self) -> pd.DataFrame:
+        """te.cohort_members of the rows; meaningful for students only."""
+        return te.cohort_members(self.frame)
+
+    @cached_property
+    def cohort_values(self) -> Dict[StudentKey, Dict[str, object]]:
+        """Each student key's known cohort values (see ce.COHORT_COLUMNS); meaningful for students only."""
+        members = self.members
+        dims = [d for d in ce.COHORT_COLUMNS if d in members.columns]
+        return {
+            te.as_key(key): {d: ce.scalar(v) for d, v in zip(dims, values) if not pd.isna(v)}
+            for key, *values in zip(members['key'], *(members[d] for d in dims))
+        }
+
+    def _merged(self, cohort: partition_engine.Cohort | None) -> Tuple[Dict[str, te.SubjectStats], te.Rollups]:
+        # Ingested events (all that stats holds for a partitioned table) go on top of the files
+        return partition_engine.merged(partition_engine.candidates(self.partitions, cohort),
+                                       self.stats, self.rollups or {}, self.sources())
+
+    def stats_for(self, cohort: partition_engine.Cohort | None = None) -> Dict[str, te.SubjectStats]:
+        """Per-subject aggregates, complete for the students of cohort (everyone for None).
+
+        For a table read from partition files only the partitions that may
+        hold those students' rows are read and merged (see
+        partition_engine.PRUNE_RULES); other students' aggregates are partial.
+        """
+        return self._merged(cohort)[0] if self.partitions else self.stats
+
+    def rollups_for(self, cohort: partition_engine.Cohort | None = None) -> te.Rollups:
+        """Weekly and monthly rollups, complete for the students of cohort as with stats_for."""
+        return self._merged(cohort)[1] if self.partitions else (self.rollups or {})
+
+    def keys(self) -> List[StudentKey]:
+        """Every student key with rows in the table."""
+        found: Dict[StudentKey, None] = {}
+        for _, index in self._parts():
+            for by_key in index.values():
+                found.update(dict.fromkeys(by_key))
+        return list(found)
+
+    def appended(self, rows: pd.DataFrame) -> '_Table':
+        """The table with rows added as a new chunk."""
+        base, chunks = (self.base, self.index), self.chunks + ((rows, te.build_row_index(rows)),)
+        while len(chunks) > 1 and len(chunks[-2][0]) <= len(chunks[-1][0]):
+            chunks = chunks[:-2] + (_joined(chunks[-2], chunks[-1]),)
+        if len(chunks) == 1 and not self.shared and len(base[0]) <= len(chunks[0][0]):
+            base, chunks = _joined(base, chunks[0]), ()
+        return replace(self, base=base[0], index=base[1], chunks=chunks)
+
+    def rows(self, key: StudentKey) -> pd.DataFrame:
+        """Rows for one student, sliced by position instead of a full-column scan."""
+        kind = te.key_kind(key)
+        parts = []
+        for frame, index in self._parts():
+            pos = index.get(kind, {}).get(key)
+            if pos is not None:
+                parts.append(frame.iloc[pos])
+        if not parts:
+            return self.base.iloc[0:0]
+        return parts[0] if len(parts) == 1 else _concat_encoded(parts)
+
+    def gather(self, keys: List[StudentKey]) -> Tuple[pd.DataFrame, np.ndarray]:
+        if not self.chunks:
+            return te.gather(self.base, self.index, keys)
+        found = [te.gather(frame, index, keys) for frame, index in self._parts()]
+        return _concat_encoded([rows for rows, _ in found]), np.concatenate([owner for _, owner in found])
+
+    def gather_positions(self, keys: List[StudentKey]) -> Tuple[np.ndarray, np.ndarray]:
+        """Positions in frame of the rows of all keys, plus the position in keys that owns each row."""
+        if not self.chunks:
+            return te.gather_positions(self.index, keys)
+        offsets = np.cumsum([0] + [len(frame) for frame, _ in self._parts()])
+        found = [te.gather_positions(index, keys) for _, index in self._parts()]
+        return (np.concatenate([pos + offset for (pos, _), offset in zip(found, offsets)]),
+                np.concatenate([owner for _, owner in found]))
+
+
+def _build_table(name: str, path: Path, fp: Tuple[int, int] | None) -> _Table:
+    columns = TABLES[name][1]
+    calendar = cal.AttendanceCalendar.empty() if name == 'attendance' else None
+    if _use_streaming(name, fp):
+        frame, stats, rollups, report, calendar = _stream_stats(path, columns, te.VALUE_COLUMNS[name], calendar)
+        table = _Table(frame, fp, {}, stats, streamed=True, rollups=rollups, validation=report, calendar=calendar)
+    else:
+        shared = SHARED_DATA and fp is not None
+        if shared:
+            frame, report = shared_engine.load_table(name, path, fp, columns)
+        else:
+            frame, report = te.load_checked(path, columns)
+        table = _Table(frame, fp, te.build_row_index(frame), te.build_stats(frame, te.VALUE_COLUMNS.get(name)),
+                       tags=te.build_project_tags(frame) if name == 'projects' else None,
+                       rollups=te.build_rollups(frame, te.VALUE_COLUMNS.get(name)), validation=report,
+                       calendar=te.calendar_from_frame(frame) if calendar is not None else None, shared=shared)
+    if fp is not None and te.file_fingerprint(path) == fp:
+        # File did not move while it was read, so frame covers exactly fp[1] bytes
+        with open(path, 'rb') as f:
+            digest = _prefix_hash(f, fp[1]).hexdigest()
+        table = replace(table, offset=fp[1], digest=digest)
+    return table
+
+
+def _partition_dir(data_dir: Path, name: str) -> Path | None:
+    """The directory of partition files the table is read from, if it has one."""
+    root = data_dir / name
+    return root if name in PARTITIONED_TABLES and root.is_dir() else None
+
+
+def _partitioned_table(name: str, root: Path, fp: Tuple[int, int] | None, current: _Table | None) -> _Table:
+    """The table read from the partition files under root, as a streamed table.
+
+    Only the catalog of files is built here; stats_for and rollups_for read
+    and aggregate the files a request needs, and an aggregated file stays
+    aggregated until it changes. The rows, stats, rollups and calendar of
+    the table itself hold ingested events only.
+    """
+    partitions = partition_engine.scan(name, root, current.partitions if current is not None else ())
+    calendar = cal.AttendanceCalendar.empty() if name == 'attendance' else None
+    return _Table(pd.DataFrame(columns=TABLES[name][1]), fp, {}, {}, streamed=True, partitions=partitions,
+                  calendar=calendar)
+
+
+def _prefix_hash(f: BinaryIO, size: int) -> hashlib._Hash:
+    """sha256 of the first size bytes of f, leaving f positioned just after them."""
+    f.seek(0)
+    running = hashlib.sha256()
+    while size > 0:
+        block = f.read(min(size, 1 << 20))
+        if not block:
+            break
+        running.update(block)
+        size -= len(block)
+    return running
+
+
+def _read_appended(path: Path, offset: int, digest: str,
+                   fp: Tuple[int, int] | None) -> Tuple[pd.DataFrame | None, int, str] | None:
+    """Complete CSV lines appended to path since offset, parsed with its header.
+
+    Returns the rows (None when no full line was added), the new offset and
+    the digest of everything before it; or None when the file did not just
+    grow: it shrank, changed without growing, or its first offset bytes no
+    longer hash to digest. Offset 0 reads everything after the header.
+    """
+    if offset < 0 or fp is None or fp[1] < offset or (offset > 0 and fp[1] == offset):
+        return None
+    with open(path, 'rb') as f:
+        header = f.readline()
+        if offset == 0:
+            if not header.endswith(b'\n'):
+                return None, 0, ''
+            running, offset = hashlib.sha256(header), len(header)
+        else:
+            running = _prefix_hash(f, offset)
+            if running.hexdigest() != digest:
+                return None
+        data = f.read(max(0, fp[1] - offset))
+    end = data.rfind(b'\n') + 1  # leave a partially written last line for next time
+    running.update(data[:end])
+    if end == 0:
+        return None, offset, running.hexdigest()
+    return pd.read_csv(io.BytesIO(header + data[:end])), offset + end, running.hexdigest()
+
+
+def _append_rows(name: str, table: _Table, tail: pd.DataFrame) -> Tuple[_Table, List[StudentKey]]:
+    """table with normalized rows added, and the student keys they touched."""
+    touched: Dict[StudentKey, None] = {}
+    for by_key in te.build_row_index(tail).values():
+        touched.update(dict.fromkeys(by_key))
+    if (not table.streamed or table.partitions) and len(tail):
+        table = table.appended(tail)
+    stats = dict(table.stats)
+    for kind, delta in te.build_stats(tail, te.VALUE_COLUMNS.get(name)).items():
+        stats[kind] = stats[kind].merged(delta) if kind in stats else delta
+    rollups = te.merge_rollups(table.rollups or {}, te.build_rollups(tail, te.VALUE_COLUMNS.get(name)))
+    calendar = te.extend_calendar(table.calendar, tail) if table.calendar is not None else None
+    return replace(table, stats=stats, rollups=rollups, calendar=calendar), list(touched)
+
+
+def _ingest_tail(name: str, path: Path, table: _Table,
+                 fp: Tuple[int, int] | None) -> Tuple[_Table, List[StudentKey]] | None:
+    """Fold rows appended since table.offset into a new table.
+
+    Returns the new table and the student keys it touched, or None when the
+    file was truncated or rewritten and needs a full reload.
     """
-    students = _read_csv(DATA_DIR / 'students.csv', columns=['student_id', 'name', 'usn', 'semester', 'dob'])
-    grades = _read_csv(DATA_DIR / 'grades.csv', columns=['student_id', 'subject', 'grade'])
-    attendance = _read_csv(DATA_DIR / 'attendance.csv', columns=['student_id', 'subject', 'attendance'])
-    projects = _read_csv(DATA_DIR / 'projects.csv', columns=['student_id', 'project_name', 'description', 'tags'])
+    read = _read_appended(path, table.offset if table.offset > 0 else -1, table.digest, fp)
+    if read is None:
+        return None
+    rows, offset, digest = read
+    table = replace(table, fingerprint=fp, offset=offset, digest=digest)
+    if rows is None:
+        return table, []
+    tail, checked = te.checked(rows, first_line=2 + table.validation.rows)
+    if not set(tail.columns) <= set(table.base.columns):
+        return None
+    return _append_rows(name, replace(table, validation=table.validation.merged(checked)), tail)
+
+
+def _checked_events(path: Path, rows: pd.DataFrame) -> pd.DataFrame:
+    """Ingested events, normalized; they were validated when posted, so rejects are only logged."""
+    events, checked = te.checked(rows)
+    if checked.rejected:
+        logger.warning("%s: dropped %d malformed events %s", path.name, checked.rejected, checked.counts)
+    return events
+
+
+def _ingest_log(name: str, log: Path, table: _Table,
+                fp: Tuple[int, int] | None) -> Tuple[_Table, List[StudentKey]] | None:
+    """Fold events appended to the event log since table.log_offset; None when the log was rewritten."""
+    if fp is None:
+        return (replace(table, log_fingerprint=None), []) if table.log_offset == 0 else None
+    read = _read_appended(log, table.log_offset, table.log_digest, fp)
+    if read is None:
+        return None
+    rows, offset, digest = read
+    table = replace(table, log_fingerprint=fp, log_offset=offset, log_digest=digest)
+    if rows is None:
+        return table, []
+    return _append_rows(name, table, _checked_events(log, rows))
+
+
+def _after_compaction(table: _Table, files: te.EventFiles) -> _Table | None:
+    """table moved on to the generation in files, or None when it needs a reload.
+
+    A compaction writes the log of the previous generation into a new
+    segment. When table had read exactly that log, its rows already hold
+    the segment and only the log of the new generation is left to read.
+    """
+    last = files.segments[-1] if files.segments else None
+    if files.generation != table.events_generation + 1 or last is None or last.log_bytes != table.log_offset:
+        return None
+    return replace(table, events_fingerprint=files.fingerprint, events_generation=files.generation,
+                   log_fingerprint=None, log_offset=0, log_digest='')
+
+
+def _with_events(name: str, table: _Table, files: te.EventFiles) -> _Table:
+    """A freshly loaded table with its compacted events and event log folded in."""
+    compacted = files.compacted_rows()
+    if compacted is not None and len(compacted):
+        table, _ = _append_rows(name, table, _checked_events(files.manifest, compacted))
+    table = replace(table, events_fingerprint=files.fingerprint, events_generation=files.generation)
+    table, _ = _ingest_log(name, files.log, table, te.file_fingerprint(files.log))
+    return table
+
+
+@dataclass(frozen=True)
+class _Snapshot:
+    """Everything derived from one consistent set of loaded tables.
+
+    Its read API (version, metrics, cohorts, scoped, cohort_of, rollups,
+    rollup, tag_index, attendance_calendar, summarize, validation_report,
+    frames, memory_stats) is shared with sqlite_engine.SqliteView, so
+    request handlers do not care which storage serves them.
+
+    When a table is read from partition files nothing is derived up front:
+    summaries are computed per request, and metrics and cohorts per scope
+    (see scoped) from just the partitions that scope needs.
+    """
+    tables: Dict[str, _Table]
+    summaries: Dict[StudentKey, Dict]
+    prebuilt: Tuple[pd.DataFrame, ce.CohortStats] | None  # metrics and cohorts, unless partitioned
+    calendar: cal.AttendanceCalendar  # daily attendance as bitsets
+    version: str  # see te.version_hash
+    _scopes: Dict[Tuple, Tuple[pd.DataFrame, ce.CohortStats]] = field(default_factory=dict, init=False, repr=False, compare=False)
+    _scopes_lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False, compare=False)
+
+    @property
+    def metrics(self) -> pd.DataFrame:
+        """One row per student key; see te.metrics_from_means."""
+        return self.scoped()[0]
+
+    @property
+    def cohorts(self) -> ce.CohortStats:
+        return self.scoped()[1]
+
+    def scoped(self, cohort: partition_engine.Cohort | None = None) -> Tuple[pd.DataFrame, ce.CohortStats]:
+        """metrics and cohorts, exact for the students of cohort (everyone for None).
+
+        Built up front they cover everyone. Otherwise each scope is built on
+        first use from the partitions that may hold its students, holds the
+        rows of those students only and is kept with the snapshot.
+        """
+        if self.prebuilt is not None:
+            return self.prebuilt
+        scope = tuple((col, tuple(values)) for col, values in sorted((cohort or {}).items()))
+        with self._scopes_lock:
+            found = self._scopes.get(scope) or self._scopes.get(())
+            if found is None:
+                metrics = _build_metrics(self.tables, cohort=cohort)
+                found = self._scopes[scope] = (metrics, te.build_cohorts(metrics))
+        return found
+
+    def cohort_of(self, key: StudentKey) -> Dict[str, object]:
+        """key's known cohort values (department, semester) from students.csv."""
+        return self.tables['students'].cohort_values.get(key, {})
+
+    def _pruning(self, key: StudentKey) -> partition_engine.Cohort:
+        return {dim: [value] for dim, value in self.cohort_of(key).items()}
+
+    @property
+    def rollups(self) -> te.Rollups:
+        """Weekly and monthly attendance rollups."""
+        return self.tables['attendance'].rollups_for()
+
+    def rollup(self, period: str, key: StudentKey) -> te.Rollup | None:
+        """The rollup holding key's rows for period, merged from key's partitions only."""
+        table = self.tables['attendance']
+        return table.rollups_for(self._pruning(key) if table.partitions else None).get(period, {}).get(te.key_kind(key))
+
+    @property
+    def tag_index(self) -> Dict[str, Dict[str, np.ndarray]]:
+        """Inverted tag index (see te.build_tag_index)."""
+        tags = self.tables['projects'].tags
+        return tags.students if tags is not None else {}
+
+    def attendance_calendar(self, key: StudentKey) -> cal.AttendanceCalendar:
+        """A calendar holding key's attendance.
+
+        When attendance is read from partition files, only the partitions
+        that may hold the student's rows are read, and the calendar spans
+        their days and those of the ingested events, which are folded in
+        (see partition_engine.calendar).
+        """
+        table = self.tables['attendance']
+        if table.partitions:
+            events = self.calendar
+            span = (events.origin, events.date(events.last)) if events.last >= 0 else None
+            return partition_engine.calendar(
+                'attendance', partition_engine.candidates(table.partitions, self._pruning(key)), key,
+                table.rows(key), span)
+        return self.calendar
+
+    def summarize(self, keys: List[StudentKey]) -> Dict[StudentKey, Dict]:
+        """Summaries without the cohorts block: materialized ones where present, the rest computed now."""
+        missing = [k for k in keys if k not in self.summaries]
+        live = _summarize(self.tables, missing) if missing else {}
+        return {key: self.summaries[key] if key in self.summaries else live[key] for key in keys}
+
+    def validation_report(self) -> Dict[str, Dict]:
+        out: Dict[str, Dict] = {}
+        for name, table in self.tables.items():
+            if not table.partitions:
+                out[name] = table.validation.as_dict()
+                continue
+            out[name] = partition_engine.merged_validation(table.partitions).as_dict()
+            # The table-wide sample lines do not say which file they are in
+            found = {p.name: p.aggregates().validation for p in table.partitions}
+            out[name]['partitions'] = {name: report.as_dict() for name, report in found.items() if report.counts}
+        return out
+
+    def frames(self) -> Dict[str, pd.DataFrame]:
+        return {name: t.frame for name, t in self.tables.items()}
+
+    def memory_stats(self) -> Dict[str, Dict]:
+        out: Dict[str, Dict] = {}
+        for name, table in self.tables.items():
+            frame = table.base
+            usage = frame.memory_usage(deep=True, index=False)
+            encoded = [c for c in frame.columns if isinstance(frame[c].dtype, pd.CategoricalDtype)]
+            out[name] = {
+                'rows': int(len(frame)),
+                'bytes': int(usage.sum()),
+                'bytes_unencoded': int(usage.drop(encoded).sum()) + sum(_plain_nbytes(frame[c]) for c in encoded),
+                'encoded_columns': {c: int(len(frame[c].cat.categories)) for c in encoded},
+            }
+            for chunk, _ in table.chunks:
+                # Appended rows are not encoded until merged into base
+                nbytes = int(chunk.memory_usage(deep=True, index=False).sum())
+                out[name]['rows'] += len(chunk)
+                out[name]['bytes'] += nbytes
+                out[name]['bytes_unencoded'] += nbytes
+            if table.partitions:
+                out[name]['partitions'] = len(table.partitions)
+        out['attendance']['calendar_bytes'] = self.calendar.nbytes
+        return out
+
+
+class _DataStore:
+    """The 'pandas' storage: the parsed CSVs, kept resident and published as immutable snapshots.
+
+    Frames are parsed once and kept resident together with their per-student
+    row index. Each access stats the files and re-reads (and re-indexes) only
+    those whose mtime or size changed since they were loaded; rows appended
+    to an append-only table or to an event log are folded in without a
+    reload, and of a partitioned table only the changed files are re-read.
+    Whenever any table changes, the summaries of the affected students, the
+    per-student metrics and the cohort distributions are recomputed and
+    published together with the tables, whose attendance calendar grows with
+    the appended rows, as a new snapshot.
+
+    Reads take no lock. A reload builds the next snapshot off to the side
+    from the current one, which it never mutates, and publishes it with a
+    single reference assignment. While one thread reloads, other readers
+    keep getting the current snapshot, and requests that already hold it
+    finish on it. A snapshot's frames are freed once the last request
+    referencing it is done.
+    """
+
+    name = 'pandas'
+
+    def __init__(self, data_dir: Path) -> None:
+        self.data_dir = data_dir
+        self._reload_lock = threading.Lock()
+        self._snapshot: _Snapshot | None = None
+        self._events: Dict[str, te.EventFiles] = {}
+
+    def _event_files(self, name: str) -> te.EventFiles:
+        """Event files of a table, re-reading its manifest only when that changed."""
+        files = self._events.get(name)
+        if files is None or te.file_fingerprint(files.manifest) != files.fingerprint:
+            files = self._events[name] = te.EventFiles.read(self.data_dir, name)
+        return files
+
+    def _fingerprints(self) -> Dict[str, Sources]:
+        fps: Dict[str, Sources] = {}
+        for name, (fname, _) in TABLES.items():
+            root = _partition_dir(self.data_dir, name)
+            if root is not None:
+                fp = partition_engine.fingerprint(root)
+            else:
+                fp = te.file_fingerprint(self.data_dir / fname)
+            if name in te.EVENT_TABLES:
+                files = self._event_files(name)
+                fps[name] = (fp, files.fingerprint, te.file_fingerprint(files.log))
+            else:
+                fps[name] = (fp, None, None)
+        return fps
+
+    @staticmethod
+    def _stale(snap: _Snapshot | None, fps: Dict[str, Sources]) -> bool:
+        return snap is None or any(snap.tables[name].sources() != sources for name, sources in fps.items())
+
+    def _refresh(self, name: str, current: _Table | None, sources: Sources) -> Tuple[_Table, List[StudentKey] | None]:
+        """current brought up to date with sources, and the keys that changed (None after a full load)."""
+        if current is not None and current.sources() == sources:
+            return current, []
+        path = self.data_dir / TABLES[name][0]
+        root = _partition_dir(self.data_dir, name)
+        files = self._event_files(name) if name in te.EVENT_TABLES else None
+        table, touched = current, {}
+        if table is not None and files is not None and table.events_fingerprint != files.fingerprint:
+            table = _after_compaction(table, files)
+        # Shared frames are read-only maps; a grown file is republished instead
+        if table is not None and table.fingerprint != sources[0]:
+            appended = _ingest_tail(name, path, table, sources[0]) \
+                if name in APPEND_ONLY_TABLES and not SHARED_DATA and root is None else None
+            table, keys = appended if appended is not None else (None, [])
+            touched.update(dict.fromkeys(keys))
+        if table is not None and files is not None and table.log_fingerprint != sources[2]:
+            applied = _ingest_log(name, files.log, table, sources[2])
+            table, keys = applied if applied is not None else (None, [])
+            touched.update(dict.fromkeys(keys))
+        if table is not None:
+            return table, list(touched)
+        if root is not None:
+            logger.info("Loading partitions of %s", root)
+            table = _partitioned_table(name, root, sources[0], current)
+        else:
+            logger.info("Loading %s", path)
+            table = _build_table(name, path, sources[0])
+        return (_with_events(name, table, files) if files is not None else table), None
+
+    def _build(self, previous: _Snapshot | None, fps: Dict[str, Sources]) -> _Snapshot:
+        """The snapshot for fps, reusing whatever of previous is still current."""
+        tables: Dict[str, _Table] = dict(previous.tables) if previous is not None else {}
+        touched: Dict[StudentKey, None] | None = {}  # None means everyone
+        for name in TABLES:
+            tables[name], keys = self._refresh(name, tables.get(name), fps[name])
+            if keys is None:
+                touched = None
+            elif touched is not None:
+                touched.update(dict.fromkeys(keys))
+        version = te.version_hash((name, t.sources()) for name, t in tables.items())
+        if previous is not None and touched is not None and not touched:
+            # Only fingerprints moved (e.g. a partial line or a rejected row was appended)
+            return replace(previous, tables=tables, version=version)
+        if any(t.partitions for t in tables.values()):
+            # Derived per request from just the partitions it needs (see _Snapshot.scoped)
+            summaries, prebuilt = {}, None
+        elif touched is None or previous is None or previous.prebuilt is None:
+            summaries = _materialize_summaries(tables)
+            metrics = _build_metrics(tables)
+            prebuilt = metrics, te.build_cohorts(metrics)
+        else:
+            # Rows were only appended: redo just the students they touched
+            summaries = dict(previous.summaries)
+            summaries.update(_summarize(tables, list(touched)))
+            metrics = _updated_metrics(previous.metrics, tables, list(touched))
+            prebuilt = metrics, te.update_cohorts(previous.cohorts, metrics, list(touched))
+        calendar = tables['attendance'].calendar or cal.AttendanceCalendar.empty()
+        return _Snapshot(tables, summaries, prebuilt, calendar, version)
+
+    def snapshot(self, wait: bool = False) -> _Snapshot:
+        """The current snapshot, reloading first if a file changed and nobody else is.
+
+        With wait, a reload already running is waited for and followed by
+        another if needed, so the result reflects every change made to the
+        files before the call.
+        """
+        snap = self._snapshot
+        if not self._stale(snap, self._fingerprints()):
+            return snap
+        # Without a snapshot there is nothing to serve meanwhile, so wait for the load
+        if not self._reload_lock.acquire(blocking=wait or snap is None):
+            return snap
+        try:
+            snap = self._snapshot  # another thread may have published while we waited
+            fps = self._fingerprints()
+            if self._stale(snap, fps):
+                snap = self._build(snap, fps)
+                self._snapshot = snap
+            return snap
+        finally:
+            self._reload_lock.release()
+
+    def clear(self) -> None:
+        with self._reload_lock:
+            self._snapshot = None
+
+
+def open_storage(data_dir: Path = DATA_DIR, backend: str = STORAGE_BACKEND,
+                 db_path: Path | None = None) -> '_DataStore | sqlite_engine.SqliteStore':
+    """The storage serving data_dir with one of the STORAGE_BACKEND choices.
+
+    Either kind has a data_dir, a name and snapshot(), which returns the
+    current read-only view of the data (a _Snapshot or a
+    sqlite_engine.SqliteView). db_path is the SQLite database file, by
+    default sqlite_engine.DB_PATH. Unknown backends raise ValueError.
+    """
+    if backend == 'pandas':
+        return _DataStore(data_dir)
+    if backend == 'sqlite':
+        return sqlite_engine.SqliteStore(data_dir, db_path or sqlite_engine.DB_PATH)
+    raise ValueError(f"unknown storage backend {backend!r}; use 'pandas' or 'sqlite'")
+
+
+# Chosen once at startup; every request reads through it
+_storage = open_storage()
+
+
+def storage() -> '_DataStore | sqlite_engine.SqliteStore':
+    """The storage requests are served from."""
+    return _storage
+
+
+def use_storage(new: '_DataStore | sqlite_engine.SqliteStore') -> None:
+    """Serve every request from new from now on (e.g. another data directory), dropping cached results."""
+    global _storage
+    _storage = new
+    _summary_cache.clear()
+    _dashboard_cache.clear()
+
+
+def get_data() -> Dict[str, pd.DataFrame]:
+    """Return the frames of every table, re-reading any CSV that changed on disk.
+
+    The returned frames are shared between requests; treat them as read-only.
+    Tables loaded in streaming mode or from partition files come back empty
+    (header only).
+    """
+    return _storage.snapshot().frames()
+
 
-    # Normalize dtypes where applicable
-    for df, col in ((students, 'student_id'), (grades, 'student_id'), (attendance, 'student_id'), (projects, 'student_id')):
-        if col in df.columns:
-            with pd.option_context('mode.chained_assignment', None):
-                try:
-                    df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int64')
-                except Exception:
-                    pass
+def _subject_means(table: _Table, keys: List[StudentKey], students: _Table) -> List[Dict[str, float]]:
+    """Per-subject means for every key, from the table's sums and counts.
 
+    Of a partitioned table, the keys of each cohort (see students'
+    cohort_values) are looked up in the partitions that may hold them only.
+    """
+    groups: Dict[Tuple, List[int]] = {}
+    for i, key in enumerate(keys):
+        cohort = tuple(students.cohort_values.get(key, {}).items()) if table.partitions else ()
+        groups.setdefault(cohort, []).append(i)
+    details: List[Dict[str, float]] = [{} for _ in keys]
+    for cohort, owners in groups.items():
+        for stats in table.stats_for({dim: [value] for dim, value in cohort}).values():
+            rows, owner = stats.gather([keys[i] for i in owners])
+            means = rows['sum'].to_numpy(dtype=float) / rows['count'].to_numpy(dtype=float)
+            for i, subject, v in zip(owner, rows['subject'].to_numpy(), means):
+                details[owners[i]][str(subject)] = float(v)
+    return details
+
+
+def _student_infos(table: _Table, keys: List[StudentKey]) -> List[Dict | None]:
+    infos: List[Dict | None] = [None] * len(keys)
+    rows, owner = table.gather(keys)
+    for i, record in zip(owner, rows.to_dict('records')):
+        if infos[i] is None:
+            infos[i] = te.student_info(record, keys[i])
+    return infos
+
+
+def _student_projects(table: _Table, keys: List[StudentKey]) -> Tuple[List[List[Dict]], List[List[str]]]:
+    projects: List[List[Dict]] = [[] for _ in keys]
+    tag_slices: List[List[np.ndarray]] = [[] for _ in keys]
+    positions, owner = table.gather_positions(keys)
+    frame = table.frame
+    names = frame['project_name'].to_numpy(dtype=object) if 'project_name' in frame.columns else None
+    descs = frame['description'].to_numpy(dtype=object) if 'description' in frame.columns else None
+    pt = table.tags
+    for i, p in zip(owner, positions):
+        row_tags = pt.tag[pt.starts[p]:pt.starts[p + 1]] if pt is not None else np.empty(0, dtype=object)
+        tag_slices[i].append(row_tags)
+        projects[i].append({
+            'name': str(names[p]) if names is not None else None,
+            'description': str(descs[p]) if descs is not None else None,
+            'tags': list(row_tags),
+        })
+    tags = [np.unique(np.concatenate(sl)).tolist() if sl else [] for sl in tag_slices]
+    return projects, tags
+
+
+def _summarize(tables: Dict[str, _Table], keys: List[StudentKey]) -> Dict[StudentKey, Dict]:
+    infos = _student_infos(tables['students'], keys)
+    subject_details = _subject_means(tables['grades'], keys, tables['students'])
+    attendance_details = _subject_means(tables['attendance'], keys, tables['students'])
+    projects, tags = _student_projects(tables['projects'], keys)
+    return {
+        key: te.summary_dict(infos[i], subject_details[i], attendance_details[i], projects[i], tags[i])
+        for i, key in enumerate(keys)
+    }
+
+
+def _materialize_summaries(tables: Dict[str, _Table]) -> Dict[StudentKey, Dict]:
+    """Summaries for every student key present in any table."""
+    keys: Dict[StudentKey, None] = {}
+    for table in tables.values():
+        keys.update(dict.fromkeys(table.keys()))
+    return _summarize(tables, list(keys))
+
+
+_METRIC_PREFIXES = (('grade', 'grades'), ('attendance', 'attendance'))
+
+
+def _build_metrics(tables: Dict[str, _Table], keys: List[StudentKey] | None = None,
+                   cohort: partition_engine.Cohort | None = None) -> pd.DataFrame:
+    """The metrics table of every student key, of keys and the other keys of the same students, or of cohort's students.
+
+    A cohort is {column: allowed values} over the cohort columns; with one,
+    only the partitions that may hold its students are read.
+    """
+    members = tables['students'].members
+    if cohort:
+        wanted = [(dim, 'in', list(values)) for dim, values in cohort.items() if dim in members.columns]
+        members = members[qe.matching(members, wanted)]
+        keys = list(members['key'])
+    elif keys is not None:
+        mine = members['key'].isin(keys)
+        members = members[mine | members['student_row'].isin(members.loc[mine, 'student_row'])]
+        keys = list(dict.fromkeys([*keys, *members['key']]))
+    means: Dict[str, pd.DataFrame] = {}
+    for prefix, name in _METRIC_PREFIXES:
+        frames = []
+        for st in tables[name].stats_for(cohort).values():
+            rows = st.frame if keys is None else st.gather(keys)[0]
+            frames.append(pd.DataFrame({
+                'key': rows['key'].astype(object),
+                'subject': rows['subject'].astype(str),
+                'mean': rows['sum'].to_numpy(dtype=float) / rows['count'].to_numpy(dtype=float),
+            }))
+        means[prefix] = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['key', 'subject', 'mean'])
+    return te.metrics_from_means(means, members)
+
+
+def _column_rank(column: str) -> Tuple[int, int, str]:
+    """Sort key putting metric columns in the order te.metrics_from_means gives them."""
+    for i, (prefix, _) in enumerate(_METRIC_PREFIXES):
+        if column == f"avg_{prefix}":
+            return i, 0, ''
+        if column.startswith(f"{prefix}:"):
+            return i, 1, column
+    return len(_METRIC_PREFIXES), 0, ''
+
+
+def _updated_metrics(metrics: pd.DataFrame, tables: Dict[str, _Table], keys: List[StudentKey]) -> pd.DataFrame:
+    """metrics with the rows of keys recomputed and the other rows kept."""
+    fresh = _build_metrics(tables, keys)
+    added = fresh.index[~fresh.index.isin(metrics.index)]
+    updated = pd.concat([metrics[~metrics.index.isin(fresh.index)], fresh]).reindex(metrics.index.append(added))
+    if len(added):
+        updated = updated.iloc[te.key_order(updated.index)]
+    if len(updated.columns) > len(metrics.columns):
+        # A subject new to the table: its column goes where a full rebuild puts it
+        updated = updated[sorted(updated.columns, key=_column_rank)]
+    return updated
+
+
+def _with_cohorts(summaries: Dict[StudentKey, Dict], view: '_Snapshot | sqlite_engine.SqliteView') -> Dict[StudentKey, Dict]:
+    """Copies of the summaries with each student's percentile rank in their cohorts."""
+    out: Dict[StudentKey, Dict] = {}
+    for key, summary in summaries.items():
+        block: Dict[str, Dict] = {}
+        for dim, cohort in view.cohort_of(key).items():
+            metrics, cohorts = view.scoped({dim: [cohort]})
+            if key not in metrics.index:
+                continue
+            row = metrics.loc[key]
+            block[dim] = {
+                'value': cohort,
+                'size': cohorts.size(dim, cohort),
+                'percentiles': cohorts.percentiles(dim, cohort, {m: row[m] for m in te.metric_columns(metrics)}),
+            }
+        out[key] = dict(summary, cohorts=block)
+    return out
+
+
+def cohort_distributions(dimension: str) -> Dict[str, Dict]:
+    """Mean, quantiles and histogram of every metric for each cohort of one dimension."""
+    return _storage.snapshot().cohorts.to_dict(dimension)
+
+
+def attendance_window(student_id: StudentKey, start: object = None, end: object = None,
+                      days: int | None = None, subject: str | None = None) -> Dict:
+    """Attendance of one student over a date range, from the bitset calendar.
+
+    end defaults to the last logged date; the range starts at start, or days
+    - 1 days before end, or at the first logged date. Without a subject the
+    count is of whole days, where a day is attended only if every session
+    logged for it was. Returns {subject, start, end, days_present,
+    days_absent, percentage, streak}, where streak is the run of attended
+    days ending at end. Dates that cannot be parsed, and a start after the
+    end (given or defaulted), raise ValueError.
+
+    When attendance is read from partition files, only the partitions
+    holding the student's rows are loaded (see partition_engine).
+    """
+    key = parse_student_key(student_id)
+    calendar = _storage.snapshot().attendance_calendar(key)
+    start_day = _parse_day(start, 'start') if start is not None else None
+    if end is not None:
+        end_day = _parse_day(end, 'end')
+    else:
+        end_day = calendar.date(calendar.last) if calendar.last >= 0 else None
+    if start_day is not None and end_day is not None and start_day > end_day:
+        raise ValueError("start must not be after end")
+    last = calendar.day_index(end_day) if end is not None else calendar.last
+    if days is not None:
+        first = last - int(days) + 1
+    else:
+        first = calendar.day_index(start_day) if start_day is not None else 0
+    present, absent = calendar.count(key, first, last, subject)
+    return {
+        'subject': subject,
+        'start': str(calendar.date(first)) if calendar.origin is not None else None,
+        'end': str(calendar.date(last)) if calendar.origin is not None else None,
+        'days_present': present,
+        'days_absent': absent,
+        'percentage': 100.0 * present / (present + absent) if present + absent else None,
+        'streak': calendar.streak(key, last, subject),
+    }
+
+
+def _parse_day(value: object, name: str) -> np.datetime64:
+    """A date query parameter as a day; blank or unparseable values raise ValueError."""
+    try:
+        stamp = pd.Timestamp(value)
+    except (TypeError, ValueError):
+        stamp = pd.NaT
+    if pd.isna(stamp):
+        raise ValueError(f"{name} must be a date like 2023-01-31")
+    return np.datetime64(stamp, 'D')
+
+
+def _trend(rollup: te.Rollup | None, key: StudentKey, subject: str | None,
+           first: np.datetime64 | None, last: np.datetime64 | None) -> Dict:
+    """Per-period series and whole-range mean for one student from one rollup."""
+    rows = rollup.rows(key) if rollup is not None else None
+    if rows is None:
+        return {'series': {}, 'range': {}}
+    subjects = rows['subject'].astype(str).to_numpy()
+    periods = rows['period'].to_numpy(dtype='datetime64[D]')
+    keep = np.ones(len(rows), dtype=bool)
+    if subject is not None:
+        keep &= subjects == subject
+    if first is not None:
+        keep &= periods >= first
+    if last is not None:
+        keep &= periods <= last
+    sums = rows['sum'].to_numpy(dtype=float)
+    counts = rows['count'].to_numpy(dtype=float)
+    cum_sums = rows['cum_sum'].to_numpy(dtype=float)
+    cum_counts = rows['cum_count'].to_numpy(dtype=float)
+    series: Dict[str, List[Dict]] = {}
+    span: Dict[str, float] = {}
+    for subj in dict.fromkeys(subjects[keep]):
+        # Rows of one subject are contiguous and in period order
+        sel = np.flatnonzero(keep & (subjects == subj))
+        lo, hi = sel[0], sel[-1]
+        before_sum = cum_sums[lo] - sums[lo]
+        before_count = cum_counts[lo] - counts[lo]
+        span[subj] = float((cum_sums[hi] - before_sum) / (cum_counts[hi] - before_count))
+        series[subj] = [
+            {'period': str(periods[i]), 'attendance': float(sums[i] / counts[i]), 'sessions': int(counts[i])}
+            for i in sel
+        ]
+    return {'series': series, 'range': span}
+
+
+def attendance_trend(student_id: StudentKey, period: str = 'week', subject: str | None = None,
+                     start: object = None, end: object = None) -> Dict:
+    """Weekly or monthly attendance of one student per subject.
+
+    Periods are labelled by their first day (Monday for weeks); start and end
+    keep the periods that overlap them. Returns {period, series:
+    {subject: [{period, attendance, sessions}]}, range: {subject: mean over
+    the kept periods}}. Unknown periods, blank or unparseable dates and a
+    start after end raise ValueError.
+    """
+    if period not in te.ROLLUP_PERIODS:
+        raise ValueError(f"period must be one of {list(te.ROLLUP_PERIODS)}")
+    key = parse_student_key(student_id)
+    first = _parse_day(start, 'start') if start is not None else None
+    last = _parse_day(end, 'end') if end is not None else None
+    if first is not None and last is not None and first > last:
+        raise ValueError("start must not be after end")
+    if first is not None:
+        first = te.ROLLUP_PERIODS[period](first)
+    rollup = _storage.snapshot().rollup(period, key)
+    return {'period': period, **_trend(rollup, key, subject, first, last)}
+
+
+def query_students(where: object = None, sort: str | None = None, limit: int = 50, offset: int = 0,
+                   fields: List[str] | None = None) -> Dict:
+    """Filter, sort and page every student's metrics in one vectorized pass.
+
+    where is a list of {"field", "op", "value"} predicates that must all
+    hold, e.g. [{"field": "avg_attendance", "op": "<", "value": 75},
+    {"field": "department", "op": "==", "value": "CS"}]. Fields are the
+    metrics columns: avg_grade, avg_attendance, grade:<subject>,
+    attendance:<subject>, department and semester. Each student is counted
+    once, under the key carrying their metrics. See query_engine.run for
+    sort, paging and the result; malformed queries raise ValueError.
+
+    When grades or attendance are read from partition files, a query
+    pinning department or semester with == or in only reads the partitions
+    that may hold those students (see partition_engine.PRUNE_RULES).
+    """
+    cohort: partition_engine.Cohort = {}
+    for field_name, op, value in qe.parse_predicates(where):
+        if field_name in ce.COHORT_COLUMNS and field_name in partition_engine.PRUNE_RULES and op in ('==', 'in'):
+            cohort.setdefault(field_name, value if op == 'in' else [value])
+    metrics = _storage.snapshot().scoped(cohort)[0]
+    return qe.run(metrics, where, sort, limit, offset, fields, rows=metrics['primary'].to_numpy(dtype=bool))
+
+
+# (metrics it was built from, index); rebuilt when a refresh publishes new metrics
+_similarity: Tuple[pd.DataFrame, sim.SimilarityIndex] | None = None
+
+
+def _similarity_index(metrics: pd.DataFrame) -> sim.SimilarityIndex:
+    global _similarity
+    cached = _similarity
+    if cached is None or cached[0] is not metrics:
+        cached = (metrics, sim.SimilarityIndex.build(metrics[metrics['primary']]))
+        _similarity = cached
+    return cached[1]
+
+
+def similar_students(student_id: StudentKey, k: int = 5) -> List[Dict]:
+    """The k students whose per-subject grade and attendance profile is closest.
+
+    Returns [{id, similarity, avg_grade, avg_attendance}] best first, with
+    cosine similarity in [-1, 1]. Uses FAISS when installed and batched
+    NumPy dot products otherwise. Raises KeyError when the student has no
+    grades or attendance to compare.
+    """
+    key = parse_student_key(student_id)
+    metrics = _storage.snapshot().metrics
+    index = _similarity_index(metrics)
+    if key not in index:
+        raise KeyError(key)
+    found = index.neighbours([key], k)[key]
+    rows = metrics.loc[[other for other, _ in found], ['avg_grade', 'avg_attendance']]
+    return [
+        {
+            'id': other,
+            'similarity': score,
+            'avg_grade': None if pd.isna(grade) else float(grade),
+            'avg_attendance': None if pd.isna(att) else float(att),
+        }
+        for (other, score), grade, att in zip(found, rows['avg_grade'], rows['avg_attendance'])
+    ]
+
+
+# Ranked risk table of the last scoring pass; rewritten whenever it is recomputed
+RISK_TABLE_PATH = Path(os.getenv('EDUWEAVE_RISK_TABLE', str(BASE_DIR / 'cache' / 'risk_scores.csv')))
+
+
+@dataclass(frozen=True)
+class _RiskTable:
+    computed_at: str  # ISO 8601, UTC
+    weights: Dict[str, float]
+    frame: pd.DataFrame  # see risk_engine.rank
+
+
+# (metrics it was scored from, table) for the configured weights
+_risk: Tuple[pd.DataFrame, _RiskTable] | None = None
+
+
+def _attendance_trend(rollups: te.Rollups) -> pd.Series:
+    """Latest month's attendance minus the mean of earlier months, per key (NaN with one month)."""
+    parts: List[pd.Series] = []
+    for rollup in rollups.get('month', {}).values():
+        by_period = rollup.frame.groupby(['key', 'period'], observed=True)[['sum', 'count']].sum()
+        last = by_period.groupby(level='key', observed=True).tail(1).droplevel('period')
+        total = by_period.groupby(level='key', observed=True).sum()
+        earlier = (total - last).reindex(last.index)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            trend = last['sum'] / last['count'] - earlier['sum'] / earlier['count'].where(earlier['count'] > 0)
+        parts.append(pd.Series(trend.to_numpy(dtype=float), index=[te.as_key(k) for k in trend.index]))
+    return pd.concat(parts) if parts else pd.Series(dtype=float)
+
+
+def _score(weights: Dict[str, float] | None) -> _RiskTable:
+    view = _storage.snapshot()
+    metrics, rollups = view.metrics, view.rollups
+    global _risk
+    cached = _risk
+    if weights is None and cached is not None and cached[0] is metrics:
+        return cached[1]
+    primary = metrics[metrics['primary']]
+    table = _RiskTable(
+        datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        {**risk.WEIGHTS, **(weights or {})},
+        risk.rank(primary, _attendance_trend(rollups), weights),
+    )
+    if weights is None:
+        _risk = (metrics, table)
+        _write_risk_table(table)
+    return table
+
+
+def _write_risk_table(table: _RiskTable) -> None:
+    try:
+        RISK_TABLE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp = RISK_TABLE_PATH.with_name(RISK_TABLE_PATH.name + '.tmp')
+        table.frame.rename_axis('id').assign(computed_at=table.computed_at).to_csv(tmp)
+        os.replace(tmp, RISK_TABLE_PATH)
+    except Exception as e:
+        logger.warning("Could not write risk table to %s: %s", RISK_TABLE_PATH, e)
+
+
+def at_risk_students(limit: int = 50, offset: int = 0, min_score: float = 0.0,
+                     weights: Dict[str, float] | None = None) -> Dict:
+    """Students ranked by risk score, highest first, without calling the LLM.
+
+    Every student is scored in one vectorized pass over the metrics table
+    and the monthly attendance rollups (see risk_engine). The ranking for the
+    configured weights is kept until the data changes and is also written
+    to RISK_TABLE_PATH; passing weights scores afresh with those
+    overrides. Returns {computed_at, weights, total, offset, limit,
+    students: [{rank, id, score, <features>, avg_grade, avg_attendance,
+    attendance_trend}]}, where total counts students at or above min_score.
+    """
+    if weights is not None:
+        weights = risk.validate_weights(weights)
+    table = _score(weights)
+    frame = table.frame
+    total = int(np.searchsorted(-frame['score'].to_numpy(), -min_score, side='right'))
+    page = frame.iloc[offset:min(offset + limit, total)]
+    records = page.astype(object).where(page.notna(), None).to_dict('records')
     return {
-        'students': students,
-        'grades': grades,
-        'attendance': attendance,
-        'projects': projects,
+        'computed_at': table.computed_at,
+        'weights': table.weights,
+        'total': total,
+        'offset': offset,
+        'limit': limit,
+        'students': [{'id': key, **rec} for key, rec in zip(page.index.tolist(), records)],
     }
 
 
-def summarize_student(student_id: int) -> Dict:
+TAG_MATCH_MODES = ('all', 'any')
+
+
+def _match_tags(index: Dict[str, Dict[str, np.ndarray]], tags: List[str], mode: str) -> List[StudentKey]:
+    """Keys of students whose projects carry all (or any) of tags, in key order.
+
+    Intersections start from the rarest tag so they shrink as early as
+    possible. Keys come from the first key kind the projects table has
+    (student_id before USN).
+    """
+    if mode not in TAG_MATCH_MODES:
+        raise ValueError(f"mode must be one of {list(TAG_MATCH_MODES)}")
+    wanted = list(dict.fromkeys(te.normalize_tags(pd.Series(tags, dtype=object)).dropna()))
+    kind = next((k for k in te.STUDENT_KEY_COLUMNS if k in index), None)
+    if kind is None or not wanted:
+        return []
+    empty = np.empty(0, dtype=np.int64 if kind == 'student_id' else str)
+    arrays = [index[kind].get(t, empty) for t in wanted]
+    if mode == 'all':
+        arrays.sort(key=len)
+        matched = reduce(lambda a, b: np.intersect1d(a, b, assume_unique=True) if len(a) else a, arrays)
+    else:
+        matched = np.unique(np.concatenate(arrays))
+    return [te.as_key(k) for k in matched]
+
+
+def students_with_tags(tags: Iterable[str], mode: str = 'all') -> List[StudentKey]:
+    """Students with a project tagged with all (mode='all') or any (mode='any') of tags.
+
+    Tags match case- and whitespace-insensitively. Returns sorted keys,
+    student_ids when projects.csv has them and USNs otherwise. An unknown
+    mode raises ValueError.
+    """
+    return _match_tags(_storage.snapshot().tag_index, list(tags), mode)
+
+
+def memory_stats() -> Dict[str, Dict]:
+    """Resident memory per table, with and without dictionary encoding.
+
+    bytes is what the frame takes now; bytes_unencoded is what it would take
+    if the encoded columns were plain Python strings. The attendance entry
+    also reports calendar_bytes, the size of its bitset calendar, and tables
+    read from partition files the number of files. Empty with SQLite
+    storage, which holds no tables in memory.
+    """
+    return _storage.snapshot().memory_stats()
+
+
+def validation_report() -> Dict[str, Dict]:
+    """Rows checked, accepted and rejected per source CSV, with counts and sample lines per rule.
+
+    A table read from partition files also reports each file with findings
+    under 'partitions'.
+    """
+    return _storage.snapshot().validation_report()
+
+
+# Finished summaries kept per (student key, data version)
+SUMMARY_CACHE_SIZE = int(os.getenv('EDUWEAVE_SUMMARY_CACHE_SIZE', '10000'))
+
+
+_summary_cache = te.VersionedCache(SUMMARY_CACHE_SIZE)
+
+
+def data_version(wait: bool = False) -> str:
+    """Version of the data currently served; see te.version_hash.
+
+    With wait, the data first catches up with every file change made
+    before the call, even while another request is reloading.
+    """
+    return _storage.snapshot(wait=wait).version
+
+
+def summary_cache_stats() -> Dict[str, object]:
+    """Size, hit/miss counters and hit rate of the summary cache, plus the current data version."""
+    return {**_summary_cache.stats(), 'data_version': data_version()}
+
+
+def _compute_summaries(keys: List[StudentKey], view: '_Snapshot | sqlite_engine.SqliteView') -> Dict[StudentKey, Dict]:
+    """Summaries for keys from view, bypassing the summary cache."""
+    return _with_cohorts(view.summarize(keys), view)
+
+
+def summarize_students(student_ids: Iterable[StudentKey]) -> Dict[StudentKey, Dict]:
+    """Summarize many students at once.
+
+    Keys may be numeric student_ids or USNs; the result maps each normalized
+    key (see parse_student_key) to the same dict summarize_student returns,
+    in first-seen order. Summaries are first looked up in an LRU keyed by
+    (key, data version); on a miss, known students are served from the
+    materialized summaries and the rest are computed with one pass over each
+    table. Each summary gets a 'cohorts' block with the student's percentile
+    rank per metric within their department and semester. Nested values are
+    shared between requests; treat them as read-only.
+
+    With EDUWEAVE_STORAGE=sqlite the summaries come from indexed queries
+    against the SQLite database instead (see sqlite_engine).
+    """
+    keys = list(dict.fromkeys(parse_student_key(k) for k in student_ids))
+    # One snapshot for the whole batch, even if a reload publishes meanwhile
+    view = _storage.snapshot()
+    version = view.version
+    cached = _summary_cache.get_many(keys, version)
+    missing = [k for k in keys if k not in cached]
+    if missing:
+        computed = _compute_summaries(missing, view)
+        _summary_cache.put_many(computed, version)
+        cached.update(computed)
+    return {key: cached[key] for key in keys}
+
+
+def summarize_student(student_id: StudentKey) -> Dict:
     """Compute a summary for a student across grades, attendance, and projects.
 
+    student_id may be the numeric student_id or the student's USN.
+
     Returns a JSON-serializable dict with keys:
       - student: {student_id, name, usn, semester, dob}
       - avg_grade: float | None
@@ -66,84 +1304,96 @@ def summarize_student(student_id: int) -> Dict:
       - attendance_details: {subject: attendance}
       - projects: [ {name, description, tags[]} ]
       - tags: [unique tags]
+      - cohorts: {department|semester: {value, size, percentiles: {metric: rank}}}
     """
-    data = load_csvs()
-    students = data['students']
-    grades = data['grades']
-    attendance = data['attendance']
-    projects = data['projects']
-
-    # Base student info
-    student_info = None
-    if not students.empty and 'student_id' in students.columns:
-        srow = students.loc[students['student_id'] == student_id]
-        if not srow.empty:
-            sr = srow.iloc[0]
-            student_info = {
-                'student_id': int(student_id),
-                'name': str(sr.get('name')) if 'name' in srow.columns else None,
-                'usn': str(sr.get('usn')) if 'usn' in srow.columns else None,
-                'semester': int(sr.get('semester')) if 'semester' in srow.columns and pd.notna(sr.get('semester')) else None,
-                'dob': str(sr.get('dob')) if 'dob' in srow.columns else None,
-            }
+    key = parse_student_key(student_id)
+    return summarize_students([key])[key]
+
+
+# Months of attendance history in a dashboard's trend series
+DASHBOARD_TREND_PERIODS = 12
 
-    # Grades per subject
-    subject_details: Dict[str, float] = {}
-    avg_grade = None
-    if not grades.empty and {'student_id', 'subject', 'grade'}.issubset(grades.columns):
-        gsub = grades.loc[grades['student_id'] == student_id]
-        if not gsub.empty:
-            # Convert numeric safely
-            gsub = gsub.copy()
-            gsub['grade'] = pd.to_numeric(gsub['grade'], errors='coerce')
-            grouped = gsub.groupby('subject', dropna=True)['grade'].mean()
-            subject_details = {str(k): float(v) for k, v in grouped.items() if pd.notna(v)}
-            if len(subject_details) > 0:
-                avg_grade = float(pd.Series(subject_details.values()).mean())
-
-    # Attendance per subject
-    attendance_details: Dict[str, float] = {}
-    avg_attendance = None
-    if not attendance.empty and {'student_id', 'subject', 'attendance'}.issubset(attendance.columns):
-        asub = attendance.loc[attendance['student_id'] == student_id]
-        if not asub.empty:
-            asub = asub.copy()
-            asub['attendance'] = pd.to_numeric(asub['attendance'], errors='coerce')
-            agrouped = asub.groupby('subject', dropna=True)['attendance'].mean()
-            attendance_details = {str(k): float(v) for k, v in agrouped.items() if pd.notna(v)}
-            if len(attendance_details) > 0:
-                avg_attendance = float(pd.Series(attendance_details.values()).mean())
-
-    # Projects list and tags aggregation
-    projects_list = []
-    tags_set = set()
-    if not projects.empty and 'student_id' in projects.columns:
-        psub = projects.loc[projects['student_id'] == student_id]
-        for _, row in psub.iterrows():
-            name = str(row.get('project_name')) if 'project_name' in psub.columns else None
-            desc = str(row.get('description')) if 'description' in psub.columns else None
-            tags_raw = row.get('tags') if 'tags' in psub.columns else None
-            row_tags: List[str] = []
-            if isinstance(tags_raw, str) and tags_raw.strip():
-                row_tags = [t.strip() for t in tags_raw.split(',') if t.strip()]
-            for t in row_tags:
-                tags_set.add(t)
-            projects_list.append({
-                'name': name,
-                'description': desc,
-                'tags': row_tags,
-            })
-
-    summary = {
-        'student': student_info,
-        'avg_grade': avg_grade,
-        'avg_attendance': avg_attendance,
-        'subject_details': subject_details,
-        'attendance_details': attendance_details,
-        'projects': projects_list,
-        'tags': sorted(tags_set),
+_dashboard_cache = te.VersionedCache(SUMMARY_CACHE_SIZE)
+
+
+def _rounded(value: object) -> float | None:
+    return None if value is None or pd.isna(value) else round(float(value), 2)
+
+
+def _monthly_attendance(rollup: te.Rollup | None, key: StudentKey) -> Dict:
+    """The student's attendance per month across all subjects, for the last DASHBOARD_TREND_PERIODS months."""
+    rows = rollup.rows(key) if rollup is not None else None
+    if rows is None:
+        return {'labels': [], 'values': []}
+    months, owner = np.unique(rows['period'].to_numpy(dtype='datetime64[M]'), return_inverse=True)
+    sums = np.bincount(owner, weights=rows['sum'].to_numpy(dtype=float), minlength=len(months))
+    counts = np.bincount(owner, weights=rows['count'].to_numpy(dtype=float), minlength=len(months))
+    keep = slice(-DASHBOARD_TREND_PERIODS, None)
+    return {
+        'labels': [str(m) for m in months[keep]],
+        'values': [_rounded(v) for v in (sums / counts)[keep]],
     }
-    return summary
+
+
+def _dashboard(key: StudentKey, summary: Dict, view: '_Snapshot | sqlite_engine.SqliteView') -> Dict:
+    cohorts = {}
+    for dim, cohort in view.cohort_of(key).items():
+        stats = view.scoped({dim: [cohort]})[1]
+        if stats.size(dim, cohort):
+            # Each metric's cohort mean, from the distributions the percentiles use
+            cohorts[dim] = (cohort, {m: d.mean for m, d in stats.get(dim, cohort).items()})
+
+    def chart(prefix: str, details: Dict[str, float]) -> Dict:
+        labels = sorted(details)
+        return {
+            'labels': labels,
+            'values': [_rounded(details[s]) for s in labels],
+            'cohort': {dim: [_rounded(m.get(f"{prefix}:{s}")) for s in labels] for dim, (_, m) in cohorts.items()},
+        }
+
+    tag_counts: Dict[str, int] = {}
+    for project in summary['projects']:
+        for tag in project['tags']:
+            tag_counts[tag] = tag_counts.get(tag, 0) + 1
+    skills = sorted(tag_counts)
+    return {
+        'id': key,
+        'student': summary['student'],
+        'avg_grade': _rounded(summary['avg_grade']),
+        'avg_attendance': _rounded(summary['avg_attendance']),
+        'cohorts': {dim: value for dim, (value, _) in cohorts.items()},
+        'grades': chart('grade', summary['subject_details']),
+        'attendance': chart('attendance', summary['attendance_details']),
+        'trend': _monthly_attendance(view.rollup('month', key), key),
+        'skills': {'labels': skills, 'values': [tag_counts[t] for t in skills]},
+    }
+
+
+def dashboard_payload(student_id: StudentKey) -> Dict:
+    """Chart-ready data for one student's dashboard, cached per data version.
+
+    Every chart is a pair of parallel label/value arrays (values rounded to
+    two decimals):
+      - grades / attendance: per-subject means, plus 'cohort': {dimension:
+        the cohort's mean for each label} for the student's department and
+        semester
+      - trend: monthly attendance across all subjects, last
+        DASHBOARD_TREND_PERIODS months
+      - skills: number of the student's projects per tag
+    alongside student, avg_grade, avg_attendance and cohorts {dimension:
+    value}. Raises KeyError for a student found in no table.
+    """
+    key = parse_student_key(student_id)
+    view = _storage.snapshot()
+    cached = _dashboard_cache.get_many([key], view.version)
+    if key in cached:
+        return cached[key]
+    summary = view.summarize([key])[key]
+    if summary['student'] is None and not (summary['subject_details'] or summary['attendance_details'] or summary['projects']):
+        raise KeyError(key)
+    payload = _dashboard(key, summary, view)
+    _dashboard_cache.put_many({key: payload}, view.version)
+    return payload
 
 
 if __name__ == '__main__':
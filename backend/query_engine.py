@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import operator
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+# Comparison operators accepted in a predicate
+OPERATORS: Dict[str, Callable[[np.ndarray, object], np.ndarray]] = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '==': operator.eq,
+    '!=': operator.ne,
+    'in': lambda column, values: np.isin(column, values),
+}
+
+_ORDERED = ('<', '<=', '>', '>=')
+
+# Columns returned for every matching student when no fields are requested
+DEFAULT_FIELDS = ('avg_grade', 'avg_attendance', 'department', 'semester')
+
+# Fields a query may filter, sort on or return: these plus the per-subject
+# means under these prefixes. Other columns of the metrics table (e.g.
+# 'primary') are internal and rejected like unknown fields.
+PUBLIC_FIELDS = ('avg_grade', 'avg_attendance', 'department', 'semester')
+PUBLIC_PREFIXES = ('grade:', 'attendance:')
+
+MAX_LIMIT = 500
+
+Predicate = Tuple[str, str, object]
+
+
+def parse_predicates(where: object) -> List[Predicate]:
+    """[{"field", "op", "value"}, ...] (or [field, op, value] triples) as predicate tuples."""
+    if where is None:
+        return []
+    if not isinstance(where, list):
+        raise ValueError('where must be a list of {"field", "op", "value"} objects')
+    out: List[Predicate] = []
+    for item in where:
+        if isinstance(item, dict):
+            item = (item.get('field'), item.get('op'), item.get('value'))
+        if not isinstance(item, (list, tuple)) or len(item) != 3 or not isinstance(item[0], str):
+            raise ValueError(f"Malformed predicate: {item!r}")
+        field, op, value = item
+        if op not in OPERATORS:
+            raise ValueError(f"Unknown operator {op!r}; use one of {list(OPERATORS)}")
+        if op == 'in' and not isinstance(value, list):
+            raise ValueError(f"'in' needs a list of values for {field}")
+        out.append((field, op, value))
+    return out
+
+
+def is_public(field: str) -> bool:
+    return field in PUBLIC_FIELDS or field.startswith(PUBLIC_PREFIXES)
+
+
+def _column(metrics: pd.DataFrame, field: str) -> Tuple[np.ndarray, bool]:
+    """Column values as an array, and whether they are numeric (NaN for missing)."""
+    if field not in metrics.columns or not is_public(field):
+        raise ValueError(f"Unknown field {field!r}")
+    series = metrics[field]
+    if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+        return series.to_numpy(dtype=float, na_value=np.nan), True
+    return series.astype(object).to_numpy(), False
+
+
+def matching(metrics: pd.DataFrame, predicates: Sequence[Predicate], mask: np.ndarray | None = None) -> np.ndarray:
+    """AND of every predicate (and the starting mask) as one boolean mask; missing values never match."""
+    mask = np.ones(len(metrics), dtype=bool) if mask is None else mask.copy()
+    for field, op, value in predicates:
+        column, numeric = _column(metrics, field)
+        values = value if op == 'in' else [value]
+        if numeric:
+            try:
+                value = [float(v) for v in values] if op == 'in' else float(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{field} is numeric; cannot compare it with {value!r}") from None
+            with np.errstate(invalid='ignore'):
+                mask &= OPERATORS[op](column, value) & ~np.isnan(column)
+        else:
+            if op in _ORDERED:
+                raise ValueError(f"{field} is not numeric; use ==, != or in")
+            present = pd.notna(column)
+            mask &= OPERATORS[op](column.astype(str), [str(v) for v in values] if op == 'in' else str(value)) & present
+    return mask
+
+
+def _top(values: np.ndarray, rows: np.ndarray, k: int) -> np.ndarray:
+    """The k rows with the smallest values, in (value, row) order.
+
+    Only the rows at or below the k-th smallest value are sorted, found with
+    np.partition, so pages stay stable when values tie.
+    """
+    if k <= 0 or not len(rows):
+        return rows[:0]
+    if k < len(rows):
+        kth = np.partition(values, k - 1)[k - 1]
+        keep = values <= kth
+        values, rows = values[keep], rows[keep]
+    return rows[np.lexsort((rows, values))][:k]
+
+
+def run(metrics: pd.DataFrame, where: object = None, sort: str | None = None, limit: int = 50,
+        offset: int = 0, fields: Sequence[str] | None = None, rows: np.ndarray | None = None) -> Dict:
+    """Filter, sort and page the per-student metrics table.
+
+    sort is a field name, prefixed with '-' for descending order; students
+    missing that field sort last. rows optionally restricts the query to a
+    boolean mask of metrics rows. Returns {total, offset, limit, next_offset,
+    students}, where next_offset is None on the last page and
+    each student is {id, <field>: value, ...} for the requested fields
+    (DEFAULT_FIELDS plus every field filtered or sorted on by default).
+    Malformed queries, and fields that are unknown or not public (see
+    PUBLIC_FIELDS), raise ValueError.
+    """
+    predicates = parse_predicates(where)
+    if not 0 < limit <= MAX_LIMIT or offset < 0:
+        raise ValueError(f"limit must be 1..{MAX_LIMIT} and offset must be >= 0")
+    if fields is not None:
+        unknown = [f for f in fields if f not in metrics.columns or not is_public(f)]
+        if unknown:
+            raise ValueError(f"Unknown fields {unknown}")
+    rows = np.flatnonzero(matching(metrics, predicates, rows))
+    total = len(rows)
+    if sort:
+        descending = sort.startswith('-')
+        field = sort.lstrip('-+')
+        column, numeric = _column(metrics, field)
+        if not numeric:
+            raise ValueError(f"Can only sort on numeric fields, not {field!r}")
+        values = -column[rows] if descending else column[rows]
+        rows = _top(np.where(np.isnan(values), np.inf, values), rows, offset + limit)[offset:]
+    else:
+        rows = rows[offset:offset + limit]
+
+    if fields is None:
+        fields = list(dict.fromkeys([*DEFAULT_FIELDS, *(p[0] for p in predicates), *([sort.lstrip('-+')] if sort else [])]))
+        fields = [f for f in fields if f in metrics.columns]
+    page = metrics.iloc[rows]
+    columns = {f: page[f].astype(object).where(page[f].notna(), None).tolist() for f in fields}
+    students = [
+        {'id': key, **{f: _plain(columns[f][i]) for f in fields}}
+        for i, key in enumerate(page.index.tolist())
+    ]
+    next_offset = offset + limit if offset + limit < total else None
+    return {'total': total, 'offset': offset, 'limit': limit, 'next_offset': next_offset, 'students': students}
+
+
+def _plain(value: object) -> object:
+    if isinstance(value, (np.integer, np.floating, np.bool_)):
+        return value.item()
+    return value
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+# Feature -> weight in the risk score. Deployments can override any of them
+# with a JSON object in EDUWEAVE_RISK_WEIGHTS, e.g. '{"attendance": 0.6}'.
+DEFAULT_WEIGHTS: Dict[str, float] = {
+    'attendance': 0.4,  # shortfall below ATTENDANCE_TARGET
+    'grade': 0.3,       # average grade points below the top of the scale
+    'trend': 0.2,       # drop in the latest month's attendance
+    'failing': 0.1,     # share of subjects below PASS_GRADE_POINTS
+}
+
+ATTENDANCE_TARGET = float(os.getenv('EDUWEAVE_ATTENDANCE_TARGET', '75'))
+PASS_GRADE_POINTS = 4.0
+MAX_GRADE_POINTS = 10.0
+
+
+def _load_weights() -> Dict[str, float]:
+    weights = dict(DEFAULT_WEIGHTS)
+    raw = os.getenv('EDUWEAVE_RISK_WEIGHTS')
+    if raw:
+        try:
+            weights.update(validate_weights(json.loads(raw)))
+        except Exception as e:
+            logger.warning("Ignoring EDUWEAVE_RISK_WEIGHTS: %s", e)
+    return weights
+
+
+def validate_weights(weights: object) -> Dict[str, float]:
+    """Non-negative numeric weights for known features; raises ValueError otherwise."""
+    if not isinstance(weights, dict):
+        raise ValueError("weights must be an object of feature -> number")
+    unknown = set(weights) - set(DEFAULT_WEIGHTS)
+    if unknown:
+        raise ValueError(f"Unknown risk features {sorted(unknown)}; use {list(DEFAULT_WEIGHTS)}")
+    out = {}
+    for name, w in weights.items():
+        if isinstance(w, bool) or not isinstance(w, (int, float)) or w < 0:
+            raise ValueError(f"Weight for {name} must be a non-negative number")
+        out[name] = float(w)
+    return out
+
+
+WEIGHTS = _load_weights()
+
+
+def features(metrics: pd.DataFrame, attendance_trend: pd.Series) -> pd.DataFrame:
+    """Risk features in [0, 1] for every metrics row; missing data contributes 0.
+
+    attendance_trend maps key to the latest month's attendance minus the
+    mean of the earlier months, in percentage points.
+    """
+    n = len(metrics)
+
+    def column(name: str) -> np.ndarray:
+        return metrics[name].to_numpy(dtype=float, na_value=np.nan) if name in metrics.columns else np.full(n, np.nan)
+
+    grades = metrics[[c for c in metrics.columns if str(c).startswith('grade:')]].to_numpy(dtype=float)
+    graded = (~np.isnan(grades)).sum(axis=1)
+    with np.errstate(invalid='ignore'):
+        failing = np.where(graded > 0, (grades < PASS_GRADE_POINTS).sum(axis=1) / np.maximum(graded, 1), 0.0)
+    trend = attendance_trend.reindex(metrics.index).to_numpy(dtype=float)
+    out = pd.DataFrame({
+        'attendance': (ATTENDANCE_TARGET - column('avg_attendance')) / ATTENDANCE_TARGET,
+        'grade': (MAX_GRADE_POINTS - column('avg_grade')) / MAX_GRADE_POINTS,
+        'trend': -trend / 100.0,
+        'failing': failing,
+    }, index=metrics.index)
+    return out.clip(0.0, 1.0).fillna(0.0)
+
+
+def rank(metrics: pd.DataFrame, attendance_trend: pd.Series, weights: Dict[str, float] | None = None) -> pd.DataFrame:
+    """Every student scored with the weighted formula, highest risk first.
+
+    The score is the weighted mean of the features, in [0, 1]. The result
+    is indexed by key with columns rank, score, one column per feature,
+    avg_grade, avg_attendance and attendance_trend.
+    """
+    weights = {**WEIGHTS, **(weights or {})}
+    feats = features(metrics, attendance_trend)
+    w = np.array([weights[name] for name in feats.columns])
+    total = w.sum()
+    score = feats.to_numpy() @ (w / total if total > 0 else w)
+    order = np.lexsort((np.arange(len(score)), -score))
+    table = feats.iloc[order].copy()
+    table.insert(0, 'score', score[order])
+    table.insert(0, 'rank', np.arange(1, len(order) + 1))
+    for name in ('avg_grade', 'avg_attendance'):
+        table[name] = metrics[name].iloc[order].to_numpy(dtype=float) if name in metrics.columns else np.nan
+    table['attendance_trend'] = attendance_trend.reindex(table.index).to_numpy(dtype=float)
+    return table
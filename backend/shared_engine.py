@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas.core.dtypes.dtypes import BaseMaskedDtype
+
+import table_engine as te
+
+try:
+    import fcntl  # type: ignore
+except Exception:  # pragma: no cover - not available on Windows
+    fcntl = None  # Concurrent first loads may then parse the same CSV more than once
+
+
+logger = logging.getLogger(__name__)
+
+# tmpfs when the OS has one, so segments live in shared memory rather than on disk
+_DEFAULT_DIR = Path('/dev/shm/eduweave') if Path('/dev/shm').is_dir() else te.BASE_DIR / 'cache' / 'shared'
+SHARED_DIR = Path(os.getenv('EDUWEAVE_SHARED_DIR', str(_DEFAULT_DIR)))
+
+# Published versions kept per table; older ones are unlinked, which does not
+# disturb processes that still have them mapped
+KEEP_VERSIONS = 2
+
+
+def _segment(name: str, path: Path, fp: Tuple[int, int]) -> Path:
+    """Directory of one published version of a table."""
+    tag = hashlib.sha1(repr((str(path.resolve()), tuple(fp))).encode('utf-8')).hexdigest()[:16]
+    return SHARED_DIR / f"{name}-{tag}"
+
+
+def _save(target: Path, stem: str, values: np.ndarray) -> str:
+    np.save(target / f"{stem}.npy", np.ascontiguousarray(values), allow_pickle=False)
+    return stem
+
+
+def _write_columns(frame: pd.DataFrame, target: Path) -> List[Dict]:
+    """Each column as .npy arrays that can be mapped back without a copy.
+
+    Categoricals keep their codes in the segment; plain string columns are
+    encoded the same way first. Their categories are small and are loaded by
+    each process.
+    """
+    columns: List[Dict] = []
+    for i, col in enumerate(frame.columns):
+        series = frame[col]
+        entry: Dict = {'name': str(col)}
+        if isinstance(series.dtype, pd.CategoricalDtype) or series.dtype == object or pd.api.types.is_string_dtype(series.dtype):
+            cat = series if isinstance(series.dtype, pd.CategoricalDtype) else series.astype(object).astype('category')
+            entry.update(kind='category', codes=_save(target, f"{i}.codes", cat.cat.codes.to_numpy()),
+                         categories=_save(target, f"{i}.categories", cat.cat.categories.to_numpy(dtype=str)))
+        elif isinstance(series.dtype, BaseMaskedDtype):
+            values = series.to_numpy(dtype=series.dtype.numpy_dtype, na_value=0)
+            entry.update(kind='masked', dtype=str(series.dtype),
+                         values=_save(target, f"{i}.values", values),
+                         mask=_save(target, f"{i}.mask", series.isna().to_numpy()))
+        else:
+            entry.update(kind='array', values=_save(target, f"{i}.values", series.to_numpy()))
+        columns.append(entry)
+    return columns
+
+
+def _read_columns(target: Path, columns: List[Dict]) -> pd.DataFrame:
+    """Read-only frame over the mapped arrays of a segment."""
+    def load(stem: str) -> np.ndarray:
+        return np.load(target / f"{stem}.npy", mmap_mode='r', allow_pickle=False)
+
+    data: Dict[str, object] = {}
+    for entry in columns:
+        if entry['kind'] == 'category':
+            categories = pd.Index(np.load(target / f"{entry['categories']}.npy", allow_pickle=False).astype(object))
+            data[entry['name']] = pd.Categorical.from_codes(load(entry['codes']), categories=categories, validate=False)
+        elif entry['kind'] == 'masked':
+            array_type = pd.api.types.pandas_dtype(entry['dtype']).construct_array_type()
+            data[entry['name']] = array_type(load(entry['values']), load(entry['mask']), copy=False)
+        else:
+            data[entry['name']] = load(entry['values'])
+    return pd.DataFrame(data, copy=False)
+
+
+@contextmanager
+def _publish_lock(name: str) -> Iterator[None]:
+    """Serialize publishing of one table across processes (no-op without fcntl)."""
+    SHARED_DIR.mkdir(parents=True, exist_ok=True)
+    if fcntl is None:
+        yield
+        return
+    with open(SHARED_DIR / f".{name}.lock", 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _attach(segment: Path) -> Tuple[pd.DataFrame, te.Validation] | None:
+    try:
+        with open(segment / 'manifest.json', 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        return _read_columns(segment, manifest['columns']), te.Validation(**manifest.get('validation', {}))
+    except FileNotFoundError:
+        return None
+
+
+def _publish(name: str, segment: Path, frame: pd.DataFrame, report: te.Validation) -> None:
+    """Write frame into a fresh directory and rename it into place in one step."""
+    tmp = SHARED_DIR / f".{segment.name}.{uuid.uuid4().hex}.tmp"
+    tmp.mkdir(parents=True)
+    try:
+        columns = _write_columns(frame, tmp)
+        with open(tmp / 'manifest.json', 'w', encoding='utf-8') as f:
+            json.dump({'table': name, 'rows': int(len(frame)), 'columns': columns, 'validation': asdict(report)}, f)
+        os.rename(tmp, segment)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    _prune(name, keep=segment)
+
+
+def _prune(name: str, keep: Path) -> None:
+    versions = sorted(SHARED_DIR.glob(f"{name}-*"), key=lambda p: p.stat().st_mtime, reverse=True)
+    for old in [p for p in versions if p != keep][KEEP_VERSIONS - 1:]:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def load_table(name: str, path: Path, fp: Tuple[int, int], columns: List[str]) -> Tuple[pd.DataFrame, te.Validation]:
+    """The normalized table for this version of the file, mapped from shared memory.
+
+    The first process to ask for a version parses, validates and normalizes
+    the CSV and publishes it with its validation report; every other
+    process, and later reloads of the same version, map the published
+    arrays read-only without copying them.
+    """
+    segment = _segment(name, path, fp)
+    loaded = _attach(segment)
+    if loaded is not None:
+        return loaded
+    with _publish_lock(name):
+        loaded = _attach(segment)  # published while we waited for the lock
+        if loaded is not None:
+            return loaded
+        logger.info("Publishing %s to %s", path, segment)
+        _publish(name, segment, *te.load_checked(path, columns))
+    return _attach(segment)
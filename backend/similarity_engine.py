@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+from typing import Dict, Hashable, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    import faiss  # type: ignore
+except Exception:  # pragma: no cover
+    faiss = None  # Nearest neighbours fall back to NumPy dot products
+
+# Metrics columns that make up a student's profile vector
+FEATURE_PREFIXES = ('grade:', 'attendance:')
+
+# Rows of the matrix scored per matrix product when searching without FAISS
+_BLOCK_ROWS = 8192
+
+
+class SimilarityIndex:
+    """Students as unit vectors of standardized per-subject grade and attendance means.
+
+    Each feature column is z-scored across the students that have it, and a
+    missing subject becomes 0 (the cohort mean), so cosine similarity is a
+    dot product between rows.
+    """
+
+    def __init__(self, keys: List[Hashable], features: List[str], matrix: np.ndarray) -> None:
+        self.keys = keys
+        self.features = features
+        self.matrix = matrix  # float32, (students, features), rows of unit length
+        self._rows = {key: i for i, key in enumerate(keys)}
+        self._faiss = None
+        if faiss is not None and len(keys):
+            self._faiss = faiss.IndexFlatIP(matrix.shape[1])
+            self._faiss.add(matrix)
+
+    @classmethod
+    def build(cls, metrics: pd.DataFrame) -> 'SimilarityIndex':
+        """One profile per metrics row that has at least one per-subject mean."""
+        features = [c for c in metrics.columns if str(c).startswith(FEATURE_PREFIXES)]
+        values = metrics[features].to_numpy(dtype=float) if features else np.empty((len(metrics), 0))
+        has_any = ~np.isnan(values).all(axis=1) if features else np.zeros(len(metrics), dtype=bool)
+        values = values[has_any]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.nanmean(values, axis=0) if len(values) else np.zeros(len(features))
+            std = np.nanstd(values, axis=0) if len(values) else np.ones(len(features))
+            z = (values - mean) / np.where(std > 0, std, 1.0)
+        z = np.nan_to_num(z, nan=0.0)
+        norms = np.linalg.norm(z, axis=1, keepdims=True)
+        matrix = np.ascontiguousarray(z / np.where(norms > 0, norms, 1.0), dtype=np.float32)
+        return cls(metrics.index[has_any].tolist(), features, matrix)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._rows
+
+    def _search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(scores, rows) of the k best rows per query, best first."""
+        if self._faiss is not None:
+            return self._faiss.search(queries, k)
+        scores = np.empty((len(queries), len(self.keys)), dtype=np.float32)
+        for start in range(0, len(self.keys), _BLOCK_ROWS):
+            block = self.matrix[start:start + _BLOCK_ROWS]
+            scores[:, start:start + len(block)] = queries @ block.T
+        if k < len(self.keys):
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(len(self.keys)), (len(queries), len(self.keys)))
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        return np.take_along_axis(top_scores, order, axis=1), np.take_along_axis(top, order, axis=1)
+
+    def neighbours(self, keys: Sequence[Hashable], k: int) -> Dict[Hashable, List[Tuple[Hashable, float]]]:
+        """Up to k most similar other students for each known key, as (key, cosine similarity)."""
+        known = [key for key in keys if key in self._rows]
+        if not known or k <= 0:
+            return {key: [] for key in known}
+        rows = np.array([self._rows[key] for key in known])
+        # One extra result per query, since a student is their own best match
+        scores, found = self._search(self.matrix[rows], min(k + 1, len(self.keys)))
+        out: Dict[Hashable, List[Tuple[Hashable, float]]] = {}
+        for key, row, row_scores, row_found in zip(known, rows, scores, found):
+            out[key] = [
+                (self.keys[j], float(s)) for s, j in zip(row_scores, row_found) if j != row and j >= 0
+            ][:k]
+        return out
@@ -0,0 +1,368 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from dataclasses import asdict
+from functools import cached_property
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+import calendar_engine as cal
+import cohort_engine as ce
+import table_engine as te
+
+
+logger = logging.getLogger(__name__)
+
+# Shared by every worker process, so tables are not held in memory per process
+DB_PATH = Path(os.getenv('EDUWEAVE_SQLITE_PATH', str(te.BASE_DIR / 'cache' / 'eduweave.sqlite3')))
+
+# Bound parameters per IN (...) clause, well under SQLite's variable limit
+_MAX_PARAMS = 500
+
+# Rollup period -> SQL expression for the first day of the period holding "date"
+_PERIOD_SQL = {
+    'week': "date(date, 'weekday 0', '-6 days')",
+    'month': "strftime('%Y-%m-01', date)",
+}
+
+
+def _sql_type(series: pd.Series) -> str:
+    kind = series.dtype.kind
+    if kind in 'biu' or isinstance(series.dtype, pd.Int64Dtype):
+        return 'INTEGER'
+    if kind == 'f':
+        return 'REAL'
+    return 'TEXT'
+
+
+def _write_frame(conn: sqlite3.Connection, name: str, frame: pd.DataFrame) -> None:
+    frame = frame.copy(deep=False)
+    for col in frame.columns:
+        if frame[col].dtype.kind == 'M':
+            frame[col] = frame[col].dt.strftime('%Y-%m-%d')
+    cols = [str(c) for c in frame.columns]
+    decl = ', '.join(f'"{c}" {_sql_type(frame[c])}' for c in frame.columns)
+    conn.execute(f'DROP TABLE IF EXISTS "{name}"')
+    conn.execute(f'CREATE TABLE "{name}" ({decl})')
+    values = frame.astype(object).where(frame.notna(), None)
+    placeholders = ', '.join('?' * len(cols))
+    conn.executemany(f'INSERT INTO "{name}" VALUES ({placeholders})', values.itertuples(index=False, name=None))
+
+
+def _value(v: object) -> object:
+    """SQL NULL as the NaN a pandas record would carry."""
+    return float('nan') if v is None else v
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> Set[str]:
+    return {r['name'] for r in conn.execute(f'PRAGMA table_info("{table}")')}
+
+
+def _chunks(values: List, size: int = _MAX_PARAMS) -> Iterator[List]:
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _by_kind(keys: List[te.StudentKey]) -> Dict[str, List[te.StudentKey]]:
+    grouped: Dict[str, List[te.StudentKey]] = {}
+    for key in keys:
+        grouped.setdefault(te.key_kind(key), []).append(key)
+    return grouped
+
+
+def _query(conn: sqlite3.Connection, sql: str, col: str, keys: List[te.StudentKey]) -> Iterable[sqlite3.Row]:
+    """Run sql once per chunk of keys; sql has a {keys} placeholder for the IN list."""
+    for chunk in _chunks(keys):
+        yield from conn.execute(sql.format(col=col, keys=', '.join('?' * len(chunk))), chunk)
+
+
+class SqliteStore:
+    """The CSVs imported into one indexed SQLite database, served as read-only views.
+
+    Every worker process opens the same database file, so tables are not
+    held in memory per process. Each access re-imports the files whose
+    mtime or size changed; summaries are answered with indexed aggregate
+    queries, and the metrics, rollups, calendar and tag index are built
+    once per imported version (see SqliteView).
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, data_dir: Path, db_path: Path = DB_PATH) -> None:
+        self.data_dir = data_dir
+        self.db_path = db_path
+        self._local = threading.local()
+        self._import_lock = threading.Lock()
+        self._view: SqliteView | None = None
+
+    def connect(self) -> sqlite3.Connection:
+        """Per-thread connection; sqlite3 connections must not be shared across threads."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS _sources '
+                '(name TEXT PRIMARY KEY, path TEXT, mtime_ns INTEGER, size INTEGER)'
+            )
+            conn.execute('CREATE TABLE IF NOT EXISTS _validation (name TEXT PRIMARY KEY, report TEXT)')
+            self._local.conn = conn
+        return conn
+
+    def _import_table(self, conn: sqlite3.Connection, name: str, path: Path, fp: Tuple[int, int] | None) -> None:
+        """Replace one table (and its indexes) with the normalized contents of its CSV."""
+        logger.info("Importing %s into %s", path, self.db_path)
+        frame, report = te.load_checked(path, te.TABLES[name][1])
+        _write_frame(conn, name, frame)
+        for col in te.STUDENT_KEY_COLUMNS:
+            if col in frame.columns:
+                conn.execute(f'CREATE INDEX "ix_{name}_{col}" ON "{name}" ("{col}")')
+                if 'subject' in frame.columns:
+                    conn.execute(f'CREATE INDEX "ix_{name}_{col}_subject" ON "{name}" ("{col}", subject)')
+        if name == 'projects':
+            # rowid - 1 of a projects row is its position in the CSV, which is what pairs.row refers to
+            tags = te.build_project_tags(frame)
+            pairs = tags.pairs[['row', 'tag']] if tags is not None else pd.DataFrame({'row': [], 'tag': []})
+            _write_frame(conn, 'project_tags', pairs)
+            conn.execute('CREATE INDEX "ix_project_tags_row" ON project_tags ("row")')
+        conn.execute('INSERT OR REPLACE INTO _validation (name, report) VALUES (?, ?)', (name, json.dumps(asdict(report))))
+        conn.execute(
+            'INSERT OR REPLACE INTO _sources (name, path, mtime_ns, size) VALUES (?, ?, ?, ?)',
+            (name, str(path), fp[0] if fp else None, fp[1] if fp else None),
+        )
+
+    def _stale(self, conn: sqlite3.Connection) -> Dict[str, Tuple[Path, Tuple[int, int] | None]]:
+        known = {r['name']: (r['path'], r['mtime_ns'], r['size']) for r in conn.execute('SELECT * FROM _sources')}
+        stale = {}
+        for name, (fname, _) in te.TABLES.items():
+            path = self.data_dir / fname
+            fp = te.file_fingerprint(path)
+            if known.get(name) != (str(path), fp[0] if fp else None, fp[1] if fp else None):
+                stale[name] = (path, fp)
+        return stale
+
+    def sync(self) -> None:
+        """Re-import every CSV whose mtime or size differs from what the database holds."""
+        conn = self.connect()
+        if not self._stale(conn):
+            return
+        with self._import_lock:
+            # IMMEDIATE takes the write lock up front, so concurrent workers import once
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                for name, (path, fp) in self._stale(conn).items():
+                    self._import_table(conn, name, path, fp)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    def snapshot(self, wait: bool = False) -> 'SqliteView':
+        """The view of the database after syncing, reused until the next import.
+
+        Syncing always finishes before the view is returned, so wait changes nothing.
+        """
+        self.sync()
+        sources = tuple(tuple(r) for r in self.connect().execute(
+            'SELECT name, path, mtime_ns, size FROM _sources ORDER BY name'))
+        view = self._view
+        if view is None or view.sources != sources:
+            view = self._view = SqliteView(self, sources)
+        return view
+
+
+class SqliteView:
+    """One imported version of the database, with the same read API as a pandas snapshot.
+
+    Derived structures are built from the database on first use and kept
+    for as long as the view is current.
+    """
+
+    def __init__(self, store: SqliteStore, sources: Tuple) -> None:
+        self.store = store
+        self.sources = sources  # _sources rows the view was built from
+        self.version = te.version_hash(
+            (name, (mtime_ns, size) if mtime_ns is not None else None) for name, _, mtime_ns, size in sources
+        )
+
+    def summarize(self, keys: List[te.StudentKey]) -> Dict[te.StudentKey, Dict]:
+        """Summaries without the cohorts block, from indexed aggregate queries.
+
+        keys must already be normalized with table_engine.parse_student_key.
+        """
+        conn = self.store.connect()
+        owner = {key: i for i, key in enumerate(keys)}
+        infos: List[Dict | None] = [None] * len(keys)
+        details = {table: [{} for _ in keys] for table in te.VALUE_COLUMNS}
+        projects: List[List[Dict]] = [[] for _ in keys]
+        tags: List[Set[str]] = [set() for _ in keys]
+        cols = {table: _columns(conn, table) for table in te.TABLES}
+
+        for kind, kind_keys in _by_kind(keys).items():
+            if kind in cols['students']:
+                sql = 'SELECT * FROM students WHERE "{col}" IN ({keys}) ORDER BY rowid'
+                for row in _query(conn, sql, kind, kind_keys):
+                    i = owner[te.as_key(row[kind])]
+                    if infos[i] is None:
+                        record = {k: _value(row[k]) for k in row.keys()}
+                        infos[i] = te.student_info(record, keys[i])
+
+            for table, value_col in te.VALUE_COLUMNS.items():
+                if not {kind, 'subject', value_col}.issubset(cols[table]):
+                    continue
+                sql = (
+                    f'SELECT "{{col}}" AS k, subject, SUM("{value_col}") AS total, COUNT("{value_col}") AS n '
+                    f'FROM "{table}" WHERE "{{col}}" IN ({{keys}}) AND subject IS NOT NULL '
+                    'GROUP BY k, subject HAVING n > 0 ORDER BY subject'
+                )
+                for row in _query(conn, sql, kind, kind_keys):
+                    details[table][owner[te.as_key(row['k'])]][str(row['subject'])] = row['total'] / row['n']
+
+            if kind in cols['projects']:
+                sql = 'SELECT rowid - 1 AS row, "{col}" AS k, * FROM projects WHERE "{col}" IN ({keys}) ORDER BY rowid'
+                project_rows = list(_query(conn, sql, kind, kind_keys))
+                row_tags: Dict[int, List[str]] = {}
+                tag_sql = 'SELECT "row", tag FROM project_tags WHERE {col} IN ({keys}) ORDER BY rowid'
+                for t in _query(conn, tag_sql, '"row"', [r['row'] for r in project_rows]):
+                    row_tags.setdefault(t['row'], []).append(t['tag'])
+                for r in project_rows:
+                    i = owner[te.as_key(r['k'])]
+                    these = row_tags.get(r['row'], [])
+                    tags[i].update(these)
+                    projects[i].append({
+                        'name': str(_value(r['project_name'])) if 'project_name' in cols['projects'] else None,
+                        'description': str(_value(r['description'])) if 'description' in cols['projects'] else None,
+                        'tags': these,
+                    })
+
+        return {
+            key: te.summary_dict(infos[i], details['grades'][i], details['attendance'][i], projects[i], sorted(tags[i]))
+            for i, key in enumerate(keys)
+        }
+
+    def validation_report(self) -> Dict[str, Dict]:
+        """The validation report recorded by the last import of each file."""
+        rows = self.store.connect().execute('SELECT name, report FROM _validation ORDER BY name')
+        return {r['name']: te.Validation(**json.loads(r['report'])).as_dict() for r in rows if r['name'] in te.TABLES}
+
+    @cached_property
+    def _metrics(self) -> Tuple[pd.DataFrame, ce.CohortStats]:
+        conn = self.store.connect()
+        cols = {table: _columns(conn, table) for table in te.TABLES}
+        means: Dict[str, pd.DataFrame] = {}
+        for prefix, table in (('grade', 'grades'), ('attendance', 'attendance')):
+            value_col = te.VALUE_COLUMNS[table]
+            frames = [
+                pd.read_sql_query(
+                    f'SELECT "{kind}" AS key, subject, AVG("{value_col}") AS mean FROM "{table}" '
+                    f'WHERE "{kind}" IS NOT NULL AND subject IS NOT NULL AND "{value_col}" IS NOT NULL '
+                    'GROUP BY key, subject',
+                    conn,
+                ).astype({'key': object, 'subject': str})
+                for kind in te.STUDENT_KEY_COLUMNS
+                if {kind, 'subject', value_col}.issubset(cols[table])
+            ]
+            means[prefix] = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['key', 'subject', 'mean'])
+        students = pd.read_sql_query('SELECT * FROM students', conn)
+        table = te.metrics_from_means(means, te.cohort_members(students))
+        return table, te.build_cohorts(table)
+
+    @property
+    def metrics(self) -> pd.DataFrame:
+        """Per-student metrics table (see table_engine.metrics_from_means)."""
+        return self._metrics[0]
+
+    @property
+    def cohorts(self) -> ce.CohortStats:
+        return self._metrics[1]
+
+    def scoped(self, cohort: Dict[str, List[object]] | None = None) -> Tuple[pd.DataFrame, ce.CohortStats]:
+        """metrics and cohorts for the students of cohort; here those of everyone."""
+        return self._metrics
+
+    def cohort_of(self, key: te.StudentKey) -> Dict[str, object]:
+        """key's known cohort values, from its metrics row."""
+        if key not in self.metrics.index:
+            return {}
+        row = self.metrics.loc[key]
+        return {dim: ce.scalar(row[dim]) for dim in self.cohorts.dimensions() if not pd.isna(row[dim])}
+
+    @cached_property
+    def calendar(self) -> cal.AttendanceCalendar:
+        """Bitset attendance calendar of every student."""
+        conn = self.store.connect()
+        cols = _columns(conn, 'attendance')
+        if not {'date', 'attendance'}.issubset(cols):
+            return cal.AttendanceCalendar.empty()
+        wanted = [c for c in (*te.STUDENT_KEY_COLUMNS, 'subject', 'date', 'attendance') if c in cols]
+        select = ', '.join(f'"{c}"' for c in wanted)
+        frame = pd.read_sql_query(f'SELECT {select} FROM attendance WHERE date IS NOT NULL ORDER BY rowid', conn)
+        return te.calendar_from_frame(te.normalize_frame(frame))
+
+    def attendance_calendar(self, key: te.StudentKey) -> cal.AttendanceCalendar:
+        """A calendar holding key's attendance; here the calendar of every student."""
+        return self.calendar
+
+    @cached_property
+    def rollups(self) -> te.Rollups:
+        """Weekly and monthly attendance rollups."""
+        conn = self.store.connect()
+        cols = _columns(conn, 'attendance')
+        value_col = te.VALUE_COLUMNS['attendance']
+        if not {'date', 'subject', value_col}.issubset(cols):
+            return {}
+        rollups: te.Rollups = {}
+        for period, start_sql in _PERIOD_SQL.items():
+            for kind in te.STUDENT_KEY_COLUMNS:
+                if kind not in cols:
+                    continue
+                frame = pd.read_sql_query(
+                    f'SELECT "{kind}" AS key, subject, {start_sql} AS period, SUM("{value_col}") AS sum, '
+                    f'COUNT("{value_col}") AS count FROM attendance '
+                    f'WHERE "{kind}" IS NOT NULL AND subject IS NOT NULL AND date IS NOT NULL '
+                    'GROUP BY key, subject, period HAVING count > 0',
+                    conn,
+                )
+                frame['period'] = pd.to_datetime(frame['period'])
+                rollups.setdefault(period, {})[kind] = te.Rollup.from_grouped(frame)
+        return rollups
+
+    def rollup(self, period: str, key: te.StudentKey) -> te.Rollup | None:
+        """The rollup holding key's rows for period."""
+        return self.rollups.get(period, {}).get(te.key_kind(key))
+
+    @cached_property
+    def tag_index(self) -> Dict[str, Dict[str, np.ndarray]]:
+        """Inverted tag index (see table_engine.build_tag_index)."""
+        conn = self.store.connect()
+        cols = _columns(conn, 'projects')
+        keys = [k for k in te.STUDENT_KEY_COLUMNS if k in cols]
+        if not keys or 'tag' not in _columns(conn, 'project_tags'):
+            return {}
+        select = ', '.join(f'p."{k}"' for k in keys)
+        pairs = pd.read_sql_query(
+            f'SELECT {select}, t.tag FROM project_tags t JOIN projects p ON p.rowid - 1 = t."row"', conn,
+        )
+        if 'student_id' in pairs.columns:
+            pairs['student_id'] = pairs['student_id'].astype('Int64')
+        return te.build_tag_index(pairs)
+
+    def frames(self) -> Dict[str, pd.DataFrame]:
+        """Every table read back from the database, normalized."""
+        conn = self.store.connect()
+        return {name: te.normalize_frame(pd.read_sql_query(f'SELECT * FROM "{name}" ORDER BY rowid', conn))
+                for name in te.TABLES}
+
+    def memory_stats(self) -> Dict[str, Dict]:
+        """Nothing is held in memory per table; the tables live in the database file."""
+        return {}
+
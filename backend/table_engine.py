@@ -0,0 +1,1154 @@
+from __future__ import annotations
+
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import cached_property, reduce
+from pathlib import Path
+from typing import ClassVar, Dict, Hashable, Iterable, List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+import calendar_engine as cal
+import cohort_engine as ce
+
+try:
+    import pyarrow.feather as feather  # type: ignore
+except Exception:  # pragma: no cover
+    feather = None  # Snapshots fall back to one .npy file per column
+
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent
+DATA_DIR = BASE_DIR / 'data'
+SNAPSHOT_DIR = BASE_DIR / 'cache' / 'columnar'
+
+# Source CSVs with a snapshot kept under SNAPSHOT_DIR; when one is written,
+# snapshots of CSVs that no longer exist are removed, then the least
+# recently written beyond this many
+SNAPSHOT_CACHE_SIZE = int(os.getenv('EDUWEAVE_SNAPSHOT_CACHE_SIZE', '64'))
+
+
+def read_csv(path: Path, columns: List[str] | None = None) -> pd.DataFrame:
+    """Read CSV if present, else return empty DataFrame with optional columns."""
+    if path.exists():
+        try:
+            try:
+                df = pd.read_csv(path)
+            except pd.errors.ParserError:
+                df = None
+            if df is None or not isinstance(df.index, pd.RangeIndex):
+                # Rows carry more fields than the header (e.g. unquoted tag lists)
+                df = _read_spilled_csv(path)
+            return df
+        except Exception:
+            # Corrupt or unreadable file; fall back to empty
+            return pd.DataFrame(columns=columns or [])
+    return pd.DataFrame(columns=columns or [])
+
+
+def _read_spilled_csv(path: Path) -> pd.DataFrame:
+    """Read a CSV whose rows may have more fields than its header.
+
+    Overflow fields are joined back onto the last header column with ','.
+    """
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        header = next(csv.reader(f))
+    raw = np.fromfile(path, dtype=np.uint8)
+    line_ends = np.concatenate([[0], np.flatnonzero(raw == ord('\n')), [len(raw)]])
+    commas_per_line = np.diff(np.searchsorted(np.flatnonzero(raw == ord(',')), line_ends))
+    # Quoted commas only overestimate the width, which yields all-empty columns
+    width = max(int(commas_per_line.max()) + 1, len(header))
+    body = pd.read_csv(path, header=None, skiprows=1, names=list(range(width)))
+    last = len(header) - 1
+    spill = body.iloc[:, last:].astype('string')
+    joined = spill.iloc[:, 0].str.cat([spill.iloc[:, j] for j in range(1, spill.shape[1])], sep=',', na_rep='')
+    joined = joined.str.rstrip(',').replace('', pd.NA)
+    df = body.iloc[:, :last].set_axis(header[:last], axis=1)
+    df[header[last]] = joined
+    return df
+
+
+def _file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def fsync_path(path: Path) -> None:
+    """Flush a file, or the entries of a directory, to disk (no-op where path cannot be opened)."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_json(path: Path, obj: Dict) -> None:
+    """Replace path with obj as JSON, durably: a crash leaves the old file or the new one."""
+    tmp = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    fsync_path(path.parent)
+
+
+def _snapshot_base(path: Path) -> Path:
+    tag = hashlib.sha1(str(path.resolve()).encode('utf-8')).hexdigest()[:10]
+    return SNAPSHOT_DIR / f"{path.stem}-{tag}"
+
+
+def _write_npy_columns(df: pd.DataFrame, target: Path) -> Dict[str, str]:
+    """One .npy per column (strings as fixed-width unicode plus a null mask)."""
+    target.mkdir(parents=True, exist_ok=True)
+    dtypes: Dict[str, str] = {}
+    for i, col in enumerate(df.columns):
+        series = df[col]
+        if series.dtype.kind in 'biuf':
+            np.save(target / f"{i}.npy", series.to_numpy(), allow_pickle=False)
+        else:
+            mask = series.isna().to_numpy()
+            np.save(target / f"{i}.npy", series.astype(object).where(~mask, '').to_numpy(dtype=str), allow_pickle=False)
+            np.save(target / f"{i}.mask.npy", mask, allow_pickle=False)
+            fsync_path(target / f"{i}.mask.npy")
+        fsync_path(target / f"{i}.npy")
+        dtypes[str(col)] = str(series.dtype)
+    return dtypes
+
+
+def _read_npy_columns(target: Path, dtypes: Dict[str, str]) -> pd.DataFrame:
+    data: Dict[str, object] = {}
+    for i, (col, dtype) in enumerate(dtypes.items()):
+        values = np.load(target / f"{i}.npy", mmap_mode='r', allow_pickle=False)
+        mask_path = target / f"{i}.mask.npy"
+        if mask_path.exists():
+            obj = values.astype(object)
+            obj[np.load(mask_path, allow_pickle=False)] = np.nan
+            data[col] = pd.Series(obj).astype(dtype)
+        else:
+            data[col] = values
+    return pd.DataFrame(data, copy=False)
+
+
+def _remove_snapshot(base: Path) -> None:
+    """Delete a snapshot, manifest first so no reader trusts a half-removed one."""
+    for suffix in ('.json', '.arrow', '.npy', '.json.tmp', '.arrow.tmp', '.npy.tmp'):
+        target = base.with_suffix(suffix)
+        if target.is_dir():
+            shutil.rmtree(target, ignore_errors=True)
+        else:
+            target.unlink(missing_ok=True)
+
+
+def _prune_snapshots(keep: Path) -> None:
+    """Bound SNAPSHOT_DIR to SNAPSHOT_CACHE_SIZE sources, never removing the snapshot at keep."""
+    bases = {entry.parent / entry.name.split('.', 1)[0] for entry in SNAPSHOT_DIR.iterdir()}
+    bases.discard(keep)
+    live: List[Tuple[int, Path]] = []
+    for base in bases:
+        try:
+            written = base.with_suffix('.json').stat().st_mtime_ns
+            with open(base.with_suffix('.json'), 'r', encoding='utf-8') as f:
+                source = json.load(f).get('source')
+        except FileNotFoundError:
+            continue  # still being written; a crashed write is redone by the next one for its source
+        except (OSError, ValueError):
+            source = None
+        if source is None or not Path(source).exists():
+            _remove_snapshot(base)
+        else:
+            live.append((written, base))
+    live.sort()
+    for _, base in live[:max(0, len(live) - SNAPSHOT_CACHE_SIZE + 1)]:
+        _remove_snapshot(base)
+
+
+def write_snapshot(df: pd.DataFrame, base: Path, manifest: Dict) -> None:
+    """Write df in a columnar format at base, then manifest as base.json.
+
+    Each file is written under a temporary name, synced and renamed into
+    place, and the manifest goes last, so once base.json names a snapshot
+    that snapshot is complete on disk. Only frames with a RangeIndex and
+    unique column names round-trip; anything else raises ValueError.
+    """
+    if not isinstance(df.index, pd.RangeIndex) or not df.columns.is_unique:
+        raise ValueError("only frames with a RangeIndex and unique column names can be snapshotted")
+    base.parent.mkdir(parents=True, exist_ok=True)
+    if feather is not None:
+        tmp = base.with_suffix('.arrow.tmp')
+        feather.write_feather(df, tmp, compression='uncompressed')
+        fsync_path(tmp)
+        os.replace(tmp, base.with_suffix('.arrow'))
+        shutil.rmtree(base.with_suffix('.npy'), ignore_errors=True)
+        manifest['format'] = 'arrow'
+    else:
+        tmp = base.with_suffix('.npy.tmp')
+        shutil.rmtree(tmp, ignore_errors=True)
+        manifest['dtypes'] = _write_npy_columns(df, tmp)
+        fsync_path(tmp)
+        shutil.rmtree(base.with_suffix('.npy'), ignore_errors=True)
+        os.replace(tmp, base.with_suffix('.npy'))
+        base.with_suffix('.arrow').unlink(missing_ok=True)
+        manifest['format'] = 'npy'
+    fsync_path(base.parent)
+    write_json(base.with_suffix('.json'), manifest)
+
+
+def read_snapshot(base: Path, manifest: Dict) -> pd.DataFrame:
+    if manifest.get('format') == 'arrow' and feather is not None:
+        # Uncompressed Feather is memory-mapped; numeric columns convert without a copy
+        return feather.read_table(base.with_suffix('.arrow'), memory_map=True).to_pandas()
+    if manifest.get('format') == 'npy':
+        return _read_npy_columns(base.with_suffix('.npy'), manifest['dtypes'])
+    raise ValueError(f"unsupported snapshot format {manifest.get('format')!r}")
+
+
+def read_csv_cached(path: Path, columns: List[str] | None = None) -> pd.DataFrame:
+    """Like read_csv, but served from a columnar snapshot of the file when valid.
+
+    The snapshot under cache/columnar/ is trusted while the CSV keeps the same
+    mtime and size, or failing that the same content hash. Otherwise the CSV
+    is parsed and the snapshot rewritten, and the directory pruned (see
+    SNAPSHOT_CACHE_SIZE).
+    """
+    if not path.exists():
+        return read_csv(path, columns)
+    base = _snapshot_base(path)
+    st = path.stat()
+    try:
+        with open(base.with_suffix('.json'), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        digest = None
+        if (manifest.get('mtime_ns'), manifest.get('size')) != (st.st_mtime_ns, st.st_size):
+            digest = _file_sha256(path)
+            if digest != manifest.get('sha256'):
+                raise ValueError('source changed')
+        df = read_snapshot(base, manifest)
+        if digest is not None:
+            # Same bytes under a new mtime (e.g. touched or re-copied); refresh the manifest
+            manifest.update(mtime_ns=st.st_mtime_ns, size=st.st_size)
+            write_json(base.with_suffix('.json'), manifest)
+        return df
+    except Exception:
+        pass
+
+    df = read_csv(path, columns)
+    try:
+        write_snapshot(df, base, {
+            'source': str(path),
+            'mtime_ns': st.st_mtime_ns,
+            'size': st.st_size,
+            'sha256': _file_sha256(path),
+        })
+        _prune_snapshots(keep=base)
+    except Exception as e:
+        logger.warning("Columnar snapshot write failed for %s: %s", path, e)
+    return df
+
+
+# Table name -> (file name under DATA_DIR, default columns when the file is missing)
+TABLES: Dict[str, Tuple[str, List[str]]] = {
+    'students': ('students.csv', ['student_id', 'name', 'usn', 'semester', 'dob']),
+    'grades': ('grades.csv', ['student_id', 'subject', 'grade']),
+    'attendance': ('attendance.csv', ['student_id', 'subject', 'attendance']),
+    'projects': ('projects.csv', ['student_id', 'project_name', 'description', 'tags']),
+}
+
+# Canonical column -> source headers accepted for it, matched case-insensitively.
+# Deployments can extend these and the two conversion maps below with a JSON
+# file named by EDUWEAVE_SCHEMA:
+#   {"column_aliases": {"grade": ["sgpa"]}, "grade_points": {"S": 10},
+#    "attendance_status": {"late": 100}}
+# Grades are points on a 0-10 scale, so headers such as 'marks' or 'score'
+# that usually hold 0-100 values are deliberately not aliased to grade.
+COLUMN_ALIASES: Dict[str, Tuple[str, ...]] = {
+    'student_id': ('student_id', 'id', 'sid'),
+    'usn': ('usn',),
+    'subject': ('subject', 'course', 'subject_name'),
+    'grade': ('grade', 'grade_points'),
+    'attendance': ('attendance', 'attendance_pct', 'attendance_percentage'),
+    'status': ('status',),
+    'date': ('date', 'day'),
+    'project_name': ('project_name', 'project', 'title'),
+    'tags': ('tags', 'skills'),
+    'department': ('department', 'dept', 'branch'),
+    'semester': ('semester', 'sem'),
+}
+
+# Letter grade -> grade points (10-point CBCS scale); numeric grades pass through
+GRADE_POINTS: Dict[str, float] = {
+    'O': 10.0, 'A+': 9.0, 'A': 8.0, 'B+': 7.0, 'B': 6.0, 'C': 5.0, 'P': 4.0, 'F': 0.0,
+}
+
+# Daily attendance status -> attendance percentage for that row
+ATTENDANCE_STATUS: Dict[str, float] = {
+    'present': 100.0, 'p': 100.0, 'yes': 100.0, '1': 100.0,
+    'absent': 0.0, 'a': 0.0, 'no': 0.0, '0': 0.0,
+}
+
+# Subject used for daily status logs that do not name one
+OVERALL_SUBJECT = 'Overall'
+
+
+def _load_schema_overrides() -> None:
+    path = os.getenv('EDUWEAVE_SCHEMA')
+    if not path:
+        return
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cfg = json.load(f)
+    except Exception as e:
+        logger.warning("Could not read schema overrides from %s: %s", path, e)
+        return
+    for canonical, aliases in (cfg.get('column_aliases') or {}).items():
+        COLUMN_ALIASES[canonical] = tuple(str(a).lower() for a in aliases) + COLUMN_ALIASES.get(canonical, ())
+    GRADE_POINTS.update({str(k).upper(): float(v) for k, v in (cfg.get('grade_points') or {}).items()})
+    ATTENDANCE_STATUS.update({str(k).lower(): float(v) for k, v in (cfg.get('attendance_status') or {}).items()})
+
+
+_load_schema_overrides()
+
+# Repeated string columns stored as categoricals (int codes plus one lookup table)
+ENCODED_COLUMNS = ('usn', 'USN', 'subject', 'tags', 'department')
+
+# Tables summarized per subject, and the value column that is averaged
+VALUE_COLUMNS: Dict[str, str] = {
+    'grades': 'grade',
+    'attendance': 'attendance',
+}
+
+# Tables that also take events posted to the API (see ingest_engine). Events
+# are appended to a write-ahead log under <data dir>/wal/ and folded into the
+# loaded table as the log grows; compaction moves the log into a columnar
+# file there, so the source CSVs are never rewritten.
+EVENT_TABLES = ('grades', 'attendance')
+WAL_DIRNAME = 'wal'
+
+
+def load_checked(path: Path, columns: List[str]) -> Tuple[pd.DataFrame, Validation]:
+    """Read one table, normalize its dtypes and drop the rows that fail validation."""
+    frame, report = checked(read_csv_cached(path, columns=columns))
+    if report.counts:
+        logger.warning("%s: rejected %d of %d rows %s", path, report.rejected, report.rows, report.counts)
+    return frame, report
+
+
+def apply_aliases(df: pd.DataFrame) -> pd.DataFrame:
+    """Rename source headers to their canonical column names."""
+    by_lower: Dict[str, object] = {}
+    for col in df.columns:
+        by_lower.setdefault(str(col).strip().lower(), col)
+    rename: Dict[object, str] = {}
+    for canonical, aliases in COLUMN_ALIASES.items():
+        if canonical in df.columns:
+            continue
+        src = next((by_lower[a] for a in aliases if a in by_lower and by_lower[a] not in rename), None)
+        if src is not None and src not in COLUMN_ALIASES:
+            rename[src] = canonical
+    return df.rename(columns=rename) if rename else df
+
+
+def grade_points(grades: pd.Series) -> pd.Series:
+    """Numeric grades as floats, letter grades through GRADE_POINTS, anything else NaN."""
+    numeric = pd.to_numeric(grades, errors='coerce')
+    letters = grades.astype('string').str.strip().str.upper().map(GRADE_POINTS)
+    return numeric.fillna(pd.to_numeric(letters, errors='coerce')).astype(float)
+
+
+def normalize_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Map the source schema onto canonical columns and dtypes in one vectorized pass.
+
+    Besides renaming aliased headers, letter grades become grade points and
+    daily Present/Absent rows become 100/0 attendance values (under
+    OVERALL_SUBJECT when the log has no subject), so per-subject means are
+    attendance percentages.
+    """
+    df = apply_aliases(df)
+    with pd.option_context('mode.chained_assignment', None):
+        if 'grade' in df.columns:
+            df['grade'] = grade_points(df['grade'])
+        if 'status' in df.columns and 'attendance' not in df.columns:
+            status = df.pop('status').astype('string').str.strip().str.lower()
+            df['attendance'] = pd.to_numeric(status.map(ATTENDANCE_STATUS), errors='coerce').astype(float)
+            if 'subject' not in df.columns:
+                df['subject'] = OVERALL_SUBJECT
+        elif 'attendance' in df.columns:
+            df['attendance'] = pd.to_numeric(df['attendance'], errors='coerce').astype(float)
+        if 'date' in df.columns:
+            df['date'] = pd.to_datetime(df['date'], errors='coerce')
+        for col in ('student_id', 'semester'):
+            if col in df.columns:
+                try:
+                    df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int64')
+                except Exception:
+                    pass
+        for col in ENCODED_COLUMNS:
+            if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+                values = df[col].astype('string').str.strip()
+                if col in STUDENT_KEY_COLUMNS['usn']:
+                    values = values.str.upper()
+                df[col] = values.astype(object).astype('category')
+    return df
+
+
+# Rows failing these checks are dropped at load; the other checks only null
+# the offending field (e.g. a malformed semester on an otherwise usable student)
+REJECTING_RULES = frozenset({
+    'missing_key', 'missing_subject', 'missing_grade', 'bad_grade', 'missing_attendance',
+    'bad_attendance', 'bad_status', 'attendance_out_of_range', 'grade_out_of_range', 'bad_date',
+})
+VALIDATION_SAMPLE_LINES = 5
+
+
+@dataclass(frozen=True)
+class Validation:
+    """What the load-time checks found in one source file.
+
+    counts and lines are per rule; lines holds the first few CSV line
+    numbers flagged, counting the header as line 1 and one line per record.
+    """
+    rows: int = 0
+    rejected: int = 0
+    counts: Dict[str, int] = field(default_factory=dict)
+    lines: Dict[str, List[int]] = field(default_factory=dict)
+
+    def merged(self, other: 'Validation') -> 'Validation':
+        counts, lines = dict(self.counts), dict(self.lines)
+        for rule, n in other.counts.items():
+            counts[rule] = counts.get(rule, 0) + n
+            lines[rule] = (lines.get(rule, []) + other.lines.get(rule, []))[:VALIDATION_SAMPLE_LINES]
+        return Validation(self.rows + other.rows, self.rejected + other.rejected, counts, lines)
+
+    def as_dict(self) -> Dict:
+        return {
+            'rows': self.rows,
+            'accepted': self.rows - self.rejected,
+            'rejected': self.rejected,
+            'rules': {
+                rule: {
+                    'count': n,
+                    'action': 'rejected' if rule in REJECTING_RULES else 'nulled',
+                    'sample_lines': self.lines.get(rule, []),
+                }
+                for rule, n in sorted(self.counts.items())
+            },
+        }
+
+
+def _blank(raw: pd.Series) -> np.ndarray:
+    """Missing or whitespace-only source values."""
+    text = raw.astype('string').str.strip()
+    return (text.isna() | (text == '')).to_numpy(dtype=bool, na_value=True)
+
+
+def _rule_masks(raw: pd.DataFrame, typed: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Rows violating each rule, found by comparing the source columns with their typed values."""
+    raw = apply_aliases(raw)
+    masks: Dict[str, np.ndarray] = {}
+
+    def unparsed(src: str, col: str) -> np.ndarray:
+        return ~_blank(raw[src]) & typed[col].isna().to_numpy()
+
+    keys = key_columns(typed)
+    if keys:
+        masks['missing_key'] = np.logical_and.reduce([typed[col].isna().to_numpy() for col in keys.values()])
+    for col in ('student_id', 'semester', 'date'):
+        if col in raw.columns:
+            masks[f'bad_{col}'] = unparsed(col, col)
+    for col, src in (('grade', 'grade'), ('attendance', 'attendance' if 'attendance' in raw.columns else 'status')):
+        if col in typed.columns and src in raw.columns:
+            masks[f'missing_{col}'] = _blank(raw[src])
+            masks[f'bad_{src}'] = unparsed(src, col)
+            if 'subject' in raw.columns:
+                masks['missing_subject'] = _blank(raw['subject'])
+    for col, top in (('attendance', 100), ('grade', 10)):
+        if col in typed.columns:
+            values = typed[col].to_numpy(dtype=float, na_value=np.nan)
+            with np.errstate(invalid='ignore'):
+                masks[f'{col}_out_of_range'] = (values < 0) | (values > top)
+    return masks
+
+
+def checked(raw: pd.DataFrame, first_line: int = 2) -> Tuple[pd.DataFrame, Validation]:
+    """raw normalized (see normalize_frame) without the rows that fail validation.
+
+    Every rule is one vectorized comparison of a source column with its
+    typed value, so values are coerced exactly once, here. first_line is
+    the CSV line of raw's first row.
+    """
+    typed = normalize_frame(raw.copy(deep=False))
+    masks = {rule: mask for rule, mask in _rule_masks(raw, typed).items() if mask.any()}
+    reject = np.zeros(len(typed), dtype=bool)
+    for rule, mask in masks.items():
+        if rule in REJECTING_RULES:
+            reject |= mask
+    report = Validation(
+        len(typed), int(reject.sum()),
+        {rule: int(mask.sum()) for rule, mask in masks.items()},
+        {rule: (np.flatnonzero(mask)[:VALIDATION_SAMPLE_LINES] + first_line).tolist() for rule, mask in masks.items()},
+    )
+    if reject.any():
+        typed = typed[~reject].reset_index(drop=True)
+    return typed, report
+
+
+def file_fingerprint(path: Path) -> Tuple[int, int] | None:
+    """(mtime_ns, size) of a file, or None when it does not exist."""
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+# Index kind -> columns that may carry that student key, in order of preference
+STUDENT_KEY_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    'student_id': ('student_id',),
+    'usn': ('usn', 'USN'),
+}
+
+StudentKey = Union[int, str]
+RowIndex = Dict[str, Dict[StudentKey, np.ndarray]]
+Fingerprint = Union[Tuple[int, int], None]
+
+
+def parse_student_key(raw: StudentKey) -> StudentKey:
+    """Normalize a numeric student_id or a USN into the form used by the index."""
+    if isinstance(raw, str):
+        raw = raw.strip()
+        if raw.isdigit():
+            return int(raw)
+        return raw.upper()
+    return int(raw)
+
+
+def key_kind(key: StudentKey) -> str:
+    return 'usn' if isinstance(key, str) else 'student_id'
+
+
+def as_key(value: object) -> StudentKey:
+    return int(value) if isinstance(value, (int, np.integer)) else str(value)
+
+
+def key_columns(df: pd.DataFrame) -> Dict[str, str]:
+    """Column carrying each student key kind present in df."""
+    found: Dict[str, str] = {}
+    for kind, candidates in STUDENT_KEY_COLUMNS.items():
+        col = next((c for c in candidates if c in df.columns), None)
+        if col is not None:
+            found[kind] = col
+    return found
+
+
+def student_keys(df: pd.DataFrame, kind: str, col: str) -> pd.Series:
+    keys = df[col]
+    if kind == 'usn' and not isinstance(keys.dtype, pd.CategoricalDtype):
+        keys = keys.astype('string').str.strip().str.upper()
+    return keys
+
+
+def positions_by_key(keys: pd.Series) -> Dict[StudentKey, np.ndarray]:
+    groups = keys.groupby(keys, sort=False, dropna=True, observed=True).indices
+    return {as_key(k): pos for k, pos in groups.items()}
+
+
+def build_row_index(df: pd.DataFrame) -> RowIndex:
+    """Map each student key to the row positions holding it, per key kind."""
+    if df.empty:
+        return {}
+    return {kind: positions_by_key(student_keys(df, kind, col)) for kind, col in key_columns(df).items()}
+
+
+def gather_positions(index: RowIndex, keys: List[StudentKey]) -> Tuple[np.ndarray, np.ndarray]:
+    """Row positions for all keys at once, plus the position in `keys` that owns each row."""
+    positions: List[np.ndarray] = []
+    owners: List[np.ndarray] = []
+    for i, key in enumerate(keys):
+        pos = index.get(key_kind(key), {}).get(key)
+        if pos is not None:
+            positions.append(pos)
+            owners.append(np.full(len(pos), i, dtype=np.intp))
+    if not positions:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    return np.concatenate(positions), np.concatenate(owners)
+
+
+def gather(frame: pd.DataFrame, index: RowIndex, keys: List[StudentKey]) -> Tuple[pd.DataFrame, np.ndarray]:
+    positions, owners = gather_positions(index, keys)
+    return frame.iloc[positions], owners
+
+
+@dataclass(frozen=True)
+class ProjectTags:
+    """Normalized (student, project, tag) rows parsed once from the tags column.
+
+    The tags of project row r are tag[starts[r]:starts[r + 1]]. students is
+    the inverted index: per key kind, normalized tag -> sorted unique keys of
+    the students with a project carrying it.
+    """
+    pairs: pd.DataFrame  # columns: row, <student key columns>, tag
+    tag: np.ndarray
+    starts: np.ndarray
+    students: Dict[str, Dict[str, np.ndarray]] = field(default_factory=dict)
+
+
+def normalize_tags(tags: pd.Series) -> pd.Series:
+    """Case- and whitespace-insensitive form of each tag used for lookups."""
+    return tags.astype('string').str.replace(r'\s+', ' ', regex=True).str.strip().str.casefold()
+
+
+def build_tag_index(pairs: pd.DataFrame) -> Dict[str, Dict[str, np.ndarray]]:
+    """Inverted index from normalized tag to the sorted keys of students using it."""
+    tags = normalize_tags(pairs['tag'])
+    index: Dict[str, Dict[str, np.ndarray]] = {}
+    for kind, col in key_columns(pairs).items():
+        keys = student_keys(pairs, kind, col)
+        ok = (keys.notna() & tags.notna() & (tags != '')).to_numpy()
+        values = keys[ok].to_numpy(dtype=np.int64 if kind == 'student_id' else str)
+        codes, uniques = pd.factorize(tags[ok].to_numpy(dtype=object))
+        order = np.lexsort((values, codes))
+        codes, values = codes[order], values[order]
+        # Drop repeated (tag, key) pairs; each tag's keys are then sorted and unique
+        first = np.ones(len(codes), dtype=bool)
+        first[1:] = (codes[1:] != codes[:-1]) | (values[1:] != values[:-1])
+        codes, values = codes[first], values[first]
+        bounds = np.searchsorted(codes, np.arange(len(uniques) + 1))
+        index[kind] = {str(t): values[bounds[i]:bounds[i + 1]] for i, t in enumerate(uniques)}
+    return index
+
+
+def build_project_tags(df: pd.DataFrame) -> ProjectTags | None:
+    if 'tags' not in df.columns:
+        return None
+    split = df['tags'].astype('string').str.split(',').explode().str.strip()
+    split = split[split.notna() & (split != '')]
+    rows = split.index.to_numpy(dtype=np.intp)
+    pairs = pd.DataFrame({'row': rows})
+    for col in key_columns(df).values():
+        pairs[col] = df[col].to_numpy()[rows]
+    pairs['tag'] = pd.Categorical(split.to_numpy(dtype=object))
+    tag = split.to_numpy(dtype=object)
+    return ProjectTags(pairs, tag, np.searchsorted(rows, np.arange(len(df) + 1)), build_tag_index(pairs))
+
+
+Layer = Tuple[pd.DataFrame, Dict[StudentKey, np.ndarray]]  # grouped rows and each key's positions in them
+
+
+def _shadowed(older: Layer, newer: Layer) -> Layer:
+    """One layer holding newer's rows plus older's rows of the keys newer lacks."""
+    frame, index = older
+    stale = [index[key] for key in newer[1] if key in index]
+    keep = np.ones(len(frame), dtype=bool)
+    if stale:
+        keep[np.concatenate(stale)] = False
+    both = pd.concat([frame[keep], newer[0]], ignore_index=True)
+    return both, positions_by_key(both['key'])
+
+
+@dataclass(frozen=True)
+class KeyedGroups:
+    """Sums and counts grouped per student key, held as a stack of layers.
+
+    A key's rows live in the newest layer holding it. merged() regroups only
+    the keys of the delta and pushes them as a new layer, folding it into the
+    one below while that is no bigger; over any run of merges a row is then
+    copied O(log n) times and a lookup probes O(log n) layers. frame and
+    index fold all layers into one on first use.
+    """
+    layers: Tuple[Layer, ...]
+
+    by: ClassVar[Tuple[str, ...]] = ('key', 'subject')
+
+    @classmethod
+    def _finish(cls, grouped: pd.DataFrame) -> pd.DataFrame:
+        return grouped.reset_index(drop=True)
+
+    @classmethod
+    def from_grouped(cls, frame: pd.DataFrame) -> 'KeyedGroups':
+        frame = cls._finish(frame)
+        return cls(((frame, positions_by_key(frame['key'])),))
+
+    @cached_property
+    def _folded(self) -> Layer:
+        return reduce(_shadowed, self.layers)
+
+    @property
+    def frame(self) -> pd.DataFrame:
+        return self._folded[0]
+
+    @property
+    def index(self) -> Dict[StudentKey, np.ndarray]:
+        return self._folded[1]
+
+    def rows(self, key: StudentKey) -> pd.DataFrame | None:
+        """The key's rows, or None when it has none."""
+        for frame, index in reversed(self.layers):
+            pos = index.get(key)
+            if pos is not None:
+                return frame.iloc[pos]
+        return None
+
+    def gather(self, keys: List[StudentKey]) -> Tuple[pd.DataFrame, np.ndarray]:
+        """Rows of all keys at once, plus the position in keys that owns each row."""
+        positions: List[List[np.ndarray]] = [[] for _ in self.layers]
+        owners: List[List[np.ndarray]] = [[] for _ in self.layers]
+        for i, key in enumerate(keys):
+            for layer in range(len(self.layers) - 1, -1, -1):
+                pos = self.layers[layer][1].get(key)
+                if pos is not None:
+                    positions[layer].append(pos)
+                    owners[layer].append(np.full(len(pos), i, dtype=np.intp))
+                    break
+        found = [layer for layer in range(len(self.layers)) if positions[layer]]
+        if not found:
+            return self.layers[0][0].iloc[0:0], np.empty(0, dtype=np.intp)
+        parts = [self.layers[layer][0].iloc[np.concatenate(positions[layer])] for layer in found]
+        rows = parts[0] if len(parts) == 1 else pd.concat(parts, ignore_index=True)
+        return rows, np.concatenate([np.concatenate(owners[layer]) for layer in found])
+
+    def merged(self, delta: 'KeyedGroups') -> 'KeyedGroups':
+        """These groups with delta's sums and counts added; only delta's keys are regrouped."""
+        columns = [*self.by, 'sum', 'count']
+        current, _ = self.gather(list(delta.index))
+        both = pd.concat([current[columns], delta.frame[columns]], ignore_index=True)
+        frame = self._finish(both.groupby(list(self.by), observed=True)[['sum', 'count']].sum().reset_index())
+        layers = self.layers + ((frame, positions_by_key(frame['key'])),)
+        while len(layers) > 1 and len(layers[-2][0]) <= len(layers[-1][0]):
+            layers = layers[:-2] + (_shadowed(layers[-2], layers[-1]),)
+        return type(self)(layers)
+
+
+class SubjectStats(KeyedGroups):
+    """Per-student, per-subject sum and count of one value column (one key kind).
+
+    frame columns: key, subject, sum, count; each key's rows sorted by subject.
+    """
+
+
+def subject_sums(df: pd.DataFrame, value_col: str | None) -> Dict[str, pd.DataFrame]:
+    """(key, subject, sum, count) of a value table per key kind, sorted by key, subject."""
+    if value_col is None or df.empty or not {'subject', value_col}.issubset(df.columns):
+        return {}
+    values = df[value_col]
+    sums: Dict[str, pd.DataFrame] = {}
+    for kind, col in key_columns(df).items():
+        keys = student_keys(df, kind, col).rename('key')
+        agg = values.groupby([keys, df['subject'].rename('subject')], dropna=True, observed=True).agg(['sum', 'count'])
+        sums[kind] = agg[agg['count'] > 0].reset_index()
+    return sums
+
+
+def build_stats(df: pd.DataFrame, value_col: str | None) -> Dict[str, SubjectStats]:
+    return {kind: SubjectStats.from_grouped(sums) for kind, sums in subject_sums(df, value_col).items()}
+
+
+class PartialSums:
+    """Grouped sums and counts collected chunk by chunk, reduced in few passes.
+
+    Per-chunk partials wait in a list and are summed into the running total
+    only once they hold at least as many rows as it. Each reduction then
+    costs at most twice the rows it folds in, so the total work stays linear
+    in the partials, where merging every chunk into the total regroups the
+    whole total once per chunk.
+    """
+
+    def __init__(self, by: List[str]) -> None:
+        self.by = by
+        self._total: pd.DataFrame | None = None
+        self._pending: List[pd.DataFrame] = []
+        self._pending_rows = 0
+
+    def add(self, partial: pd.DataFrame) -> None:
+        self._pending.append(partial)
+        self._pending_rows += len(partial)
+        if self._pending_rows >= (len(self._total) if self._total is not None else 0):
+            self._reduce()
+
+    def _reduce(self) -> None:
+        parts = ([self._total] if self._total is not None else []) + self._pending
+        self._pending, self._pending_rows = [], 0
+        if len(parts) == 1:
+            self._total = parts[0]
+            return
+        both = pd.concat(parts, ignore_index=True)
+        self._total = both.groupby(self.by, observed=True)[['sum', 'count']].sum().reset_index()
+
+    def result(self) -> pd.DataFrame | None:
+        """The summed partials, sorted by the group columns; None when nothing was added."""
+        if self._pending:
+            self._reduce()
+        return self._total
+
+
+# Rollup period -> start date of the period holding each day
+ROLLUP_PERIODS = {
+    'week': lambda days: days - ((days - np.datetime64('1970-01-05')).astype(np.int64) % 7).astype('timedelta64[D]'),
+    'month': lambda days: days.astype('datetime64[M]').astype('datetime64[D]'),
+}
+
+Rollups = Dict[str, Dict[str, 'Rollup']]  # period -> key kind -> rollup
+
+
+class Rollup(KeyedGroups):
+    """Per-student, per-subject sum and count of one value column per period.
+
+    frame columns: key, subject, period, sum, count, cum_sum, cum_count.
+    cum_sum / cum_count run over each (key, subject) group in period order, so
+    the mean over any span of periods is a difference of two running totals.
+    """
+
+    by = ('key', 'subject', 'period')
+
+    @classmethod
+    def _finish(cls, grouped: pd.DataFrame) -> pd.DataFrame:
+        frame = grouped.sort_values(['key', 'subject', 'period'], kind='stable').reset_index(drop=True)
+        running = frame.groupby(['key', 'subject'], observed=True)[['sum', 'count']].cumsum()
+        frame['cum_sum'] = running['sum']
+        frame['cum_count'] = running['count']
+        return frame
+
+
+def period_sums(df: pd.DataFrame, value_col: str | None) -> Dict[str, Dict[str, pd.DataFrame]]:
+    """(key, subject, period, sum, count) of a dated value table per period and key kind.
+
+    One grouped pass per period and key kind; the running totals of a
+    rollup are left to Rollup.from_grouped.
+    """
+    if value_col is None or df.empty or not {'date', 'subject', value_col}.issubset(df.columns):
+        return {}
+    values = df[value_col]
+    days = df['date'].to_numpy(dtype='datetime64[D]')
+    sums: Dict[str, Dict[str, pd.DataFrame]] = {}
+    for period, start_of in ROLLUP_PERIODS.items():
+        starts = pd.Series(start_of(days), index=df.index, name='period')
+        for kind, col in key_columns(df).items():
+            keys = student_keys(df, kind, col).rename('key')
+            agg = values.groupby([keys, df['subject'].rename('subject'), starts], dropna=True, observed=True).agg(['sum', 'count'])
+            sums.setdefault(period, {})[kind] = agg[agg['count'] > 0].reset_index()
+    return sums
+
+
+def build_rollups(df: pd.DataFrame, value_col: str | None) -> Rollups:
+    """Weekly and monthly rollups of a dated value table."""
+    return {
+        period: {kind: Rollup.from_grouped(sums) for kind, sums in by_kind.items()}
+        for period, by_kind in period_sums(df, value_col).items()
+    }
+
+
+def merge_rollups(rollups: Rollups, delta: Rollups) -> Rollups:
+    merged = {period: dict(by_kind) for period, by_kind in rollups.items()}
+    for period, by_kind in delta.items():
+        target = merged.setdefault(period, {})
+        for kind, rollup in by_kind.items():
+            target[kind] = target[kind].merged(rollup) if kind in target else rollup
+    return merged
+
+
+class MissingSegment(Exception):
+    """A compacted event segment named by a manifest can be read neither from itself nor from its log."""
+
+
+@dataclass(frozen=True)
+class EventSegment:
+    """Columnar file holding the events of one compacted log generation."""
+    base: Path  # snapshot base (see write_snapshot)
+    log_bytes: int | None  # bytes of the log it was compacted from; None in the older single-file layout
+
+    @property
+    def log(self) -> Path | None:
+        """The log this segment was compacted from; kept until the next compaction."""
+        table, _, generation = self.base.name.rpartition('-compacted-')
+        if self.log_bytes is None or not generation.isdigit():
+            return None
+        return self.base.with_name(f"{table}-{int(generation) - 1}.csv")
+
+    def rows(self) -> pd.DataFrame:
+        """The segment's events; read from its log instead when the segment is unreadable.
+
+        Raises MissingSegment when neither can be read.
+        """
+        try:
+            with open(self.base.with_suffix('.json'), 'r', encoding='utf-8') as f:
+                return read_snapshot(self.base, json.load(f))
+        except (OSError, ValueError, KeyError) as e:
+            error = e
+        log = self.log
+        if log is not None:
+            try:
+                with open(log, 'rb') as f:
+                    data = f.read(self.log_bytes)
+            except OSError:
+                data = b''
+            if len(data) == self.log_bytes:
+                logger.error("Event segment %s is unreadable (%s); serving its events from %s",
+                             self.base, error, log)
+                return pd.read_csv(io.BytesIO(data), dtype=str).astype(object)
+        raise MissingSegment(f"Event segment {self.base} is missing or corrupt ({error}) and the log it was "
+                             f"compacted from is gone; restore it, or drop it from the manifest in "
+                             f"{self.base.parent}") from error
+
+
+@dataclass(frozen=True)
+class EventFiles:
+    """Where one table's ingested events live, as named by its manifest.
+
+    The manifest names the log generation being appended to and the
+    segments holding the events compacted before it, one per earlier
+    generation. Compaction adds a segment and starts the next log with one
+    atomic replace of the manifest, so readers see each event once.
+    """
+    manifest: Path
+    fingerprint: Tuple[int, int] | None  # of the manifest; None before the first compaction
+    generation: int
+    log: Path
+    segments: Tuple[EventSegment, ...]  # oldest first
+
+    @classmethod
+    def read(cls, data_dir: Path, name: str) -> 'EventFiles':
+        wal_dir = data_dir / WAL_DIRNAME
+        manifest = wal_dir / f"{name}.json"
+        fp, state = None, {}
+        try:
+            with open(manifest, 'r', encoding='utf-8') as f:
+                st = os.fstat(f.fileno())
+                fp, state = (st.st_mtime_ns, st.st_size), json.load(f)
+        except FileNotFoundError:
+            pass
+        generation = int(state.get('generation', 0))
+        if 'segments' in state:
+            segments = tuple(EventSegment(wal_dir / seg['name'], seg.get('log_bytes')) for seg in state['segments'])
+        else:
+            # One file with every event compacted so far
+            segments = (EventSegment(wal_dir / state['compacted'], None),) if state.get('compacted') else ()
+        return cls(manifest, fp, generation, wal_dir / f"{name}-{generation}.csv", segments)
+
+    def compacted_rows(self) -> pd.DataFrame | None:
+        """The compacted events as raw log rows (not yet normalized)."""
+        if not self.segments:
+            return None
+        parts = [seg.rows() for seg in self.segments]
+        return parts[0] if len(parts) == 1 else pd.concat([p.astype(object) for p in parts], ignore_index=True)
+
+
+def student_info(row: Dict, key: StudentKey) -> Dict:
+    """The summary's student block from one students.csv record."""
+    sid = row.get('student_id')
+    return {
+        'student_id': int(sid) if pd.notna(sid) else None,
+        'name': str(row.get('name')) if 'name' in row else None,
+        'usn': str(row.get('usn')) if 'usn' in row else (key if isinstance(key, str) else None),
+        'semester': int(row.get('semester')) if 'semester' in row and pd.notna(row.get('semester')) else None,
+        'dob': str(row.get('dob')) if 'dob' in row else None,
+    }
+
+
+def summary_dict(info: Dict | None, subject_details: Dict[str, float], attendance_details: Dict[str, float],
+                 projects: List[Dict], tags: List[str]) -> Dict:
+    return {
+        'student': info,
+        'avg_grade': float(np.mean(list(subject_details.values()))) if subject_details else None,
+        'avg_attendance': float(np.mean(list(attendance_details.values()))) if attendance_details else None,
+        'subject_details': subject_details,
+        'attendance_details': attendance_details,
+        'projects': projects,
+        'tags': tags,
+    }
+
+
+def metrics_from_means(means: Dict[str, pd.DataFrame], members: pd.DataFrame) -> pd.DataFrame:
+    """Per-student metrics table, one row per student key.
+
+    means maps 'grade' / 'attendance' to frames of (key, subject, mean);
+    members maps key to the cohort columns and the student's row in
+    students.csv. The result has avg_grade, avg_attendance, one
+    '<prefix>:<subject>' column per subject mean, the cohort columns, and
+    'primary', which marks one row per student: a student listed with both
+    a student_id and a USN has two keys, and only the one carrying the most
+    metrics counts towards cohort statistics. Rows are in key_order.
+    """
+    parts: List[pd.DataFrame] = []
+    for prefix, frame in means.items():
+        wide = frame.set_index(['key', 'subject'])['mean'].unstack() if not frame.empty else pd.DataFrame()
+        wide.columns = [f"{prefix}:{c}" for c in wide.columns]
+        wide.insert(0, f"avg_{prefix}", wide.mean(axis=1) if len(wide.columns) else pd.Series(dtype=float))
+        parts.append(wide)
+    metrics = pd.concat(parts, axis=1)
+    metrics = metrics.join(members.set_index('key'), how='outer')
+    metrics.index.name = 'key'
+    filled = metrics[metric_columns(metrics)].notna().sum(axis=1).to_numpy()
+    student_row = metrics.pop('student_row').to_numpy(dtype=float)
+    order = np.lexsort((-filled, student_row))
+    first = np.ones(len(metrics), dtype=bool)
+    first[order] = ~pd.Series(student_row[order]).duplicated().to_numpy() | np.isnan(student_row[order])
+    metrics['primary'] = first
+    return metrics.iloc[key_order(metrics.index)]
+
+
+def key_order(keys: pd.Index) -> np.ndarray:
+    """Positions putting keys in a fixed order: USNs, then student ids, each ascending."""
+    usn = np.fromiter((isinstance(k, str) for k in keys), dtype=bool, count=len(keys))
+    parts = []
+    for mask, dtype in ((usn, str), (~usn, np.int64)):
+        pos = np.flatnonzero(mask)
+        parts.append(pos[np.argsort(keys[pos].to_numpy(dtype=dtype), kind='stable')])
+    return np.concatenate(parts)
+
+
+def metric_columns(metrics: pd.DataFrame) -> List[str]:
+    return [c for c in metrics.columns if c not in ce.COHORT_COLUMNS and c not in ('primary', 'student_row')]
+
+
+def cohort_members(students: pd.DataFrame) -> pd.DataFrame:
+    """(key, student_row, cohort columns...) for every student key in students.csv."""
+    dims = [c for c in ce.COHORT_COLUMNS if c in students.columns]
+    parts = [
+        pd.DataFrame({
+            'key': students[col].astype(object),
+            'student_row': np.arange(len(students)),
+            **{d: students[d] for d in dims},
+        })
+        for col in key_columns(students).values()
+    ]
+    if not parts:
+        return pd.DataFrame(columns=['key', 'student_row', *dims])
+    return pd.concat(parts, ignore_index=True).dropna(subset=['key']).drop_duplicates('key')
+
+
+def build_cohorts(metrics: pd.DataFrame) -> ce.CohortStats:
+    return ce.CohortStats.build(metrics[metrics['primary']].drop(columns='primary'))
+
+
+def update_cohorts(cohorts: ce.CohortStats, metrics: pd.DataFrame, keys: List[StudentKey]) -> ce.CohortStats:
+    """cohorts with every cohort holding one of keys rebuilt from metrics."""
+    changed = metrics[metrics.index.isin(keys)]
+    values = {dim: changed[dim].dropna().unique() for dim in ce.COHORT_COLUMNS if dim in metrics.columns}
+    return cohorts.updated(metrics[metrics['primary']].drop(columns='primary'), values)
+
+
+def calendar_rows(frame: pd.DataFrame) -> Tuple | None:
+    """Arguments for AttendanceCalendar.from_codes from a daily attendance log; None when rows carry no date.
+
+    Key and subject columns are factorized, so only their distinct values are
+    turned into Python keys. A row counts as attended when its attendance
+    value is above zero.
+    """
+    if frame.empty or not {'date', 'attendance'}.issubset(frame.columns):
+        return None
+    dates = frame['date'].to_numpy(dtype='datetime64[ns]')
+    values = frame['attendance'].to_numpy(dtype=float, na_value=np.nan)
+    if 'subject' in frame.columns:
+        subject_codes, subject_values = pd.factorize(frame['subject'])
+        subjects = [str(s) for s in subject_values]
+    else:
+        subject_codes, subjects = np.full(len(frame), -1, dtype=np.intp), []
+    seen: Dict[StudentKey, int] = {}
+    parts = []
+    for kind, col in key_columns(frame).items():
+        codes, uniques = pd.factorize(student_keys(frame, kind, col))
+        # The same key may be spelt in more than one key column
+        remap = np.array([seen.setdefault(as_key(k), len(seen)) for k in uniques], dtype=np.intp)
+        ok = (codes >= 0) & ~np.isnat(dates) & ~np.isnan(values)
+        parts.append((remap[codes[ok]], subject_codes[ok], dates[ok], values[ok] > 0))
+    if not parts:
+        return None
+    key_codes, codes, day, present = (np.concatenate(arrays) for arrays in zip(*parts))
+    return key_codes, list(seen), codes, subjects, day, present
+
+
+def calendar_from_frame(frame: pd.DataFrame, span: Tuple[object, object] | None = None) -> cal.AttendanceCalendar:
+    """Bitset calendar of a daily attendance log; empty when rows carry no date.
+
+    span is passed on to AttendanceCalendar.from_codes when frame holds part
+    of a larger log.
+    """
+    rows = calendar_rows(frame)
+    if rows is None:
+        return cal.AttendanceCalendar.empty(span)
+    return cal.AttendanceCalendar.from_codes(*rows, span=span)
+
+
+def extend_calendar(calendar: cal.AttendanceCalendar, frame: pd.DataFrame) -> cal.AttendanceCalendar:
+    """calendar with the rows of frame ORed in; only the calendar rows they touch are repacked."""
+    rows = calendar_rows(frame)
+    return calendar if rows is None else calendar.extended(*rows)
+
+
+def version_hash(fingerprints: Iterable[Tuple[str, Tuple | None]]) -> str:
+    """Hash of every source file's (mtime, size); changes whenever any CSV or event log does."""
+    h = hashlib.sha256()
+    for name, fp in sorted(fingerprints, key=lambda item: item[0]):
+        h.update(repr((name, tuple(fp) if fp else None)).encode('utf-8'))
+    return h.hexdigest()[:16]
+
+
+class VersionedCache:
+    """Bounded LRU of values keyed by (key, data version), e.g. summaries by student key.
+
+    Entries of an older data version are never returned again and age out
+    as newer ones are added, so a data change invalidates the cache without
+    an explicit flush.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._entries: OrderedDict[Tuple[Hashable, Hashable], object] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys: List[Hashable], version: Hashable) -> Dict[Hashable, object]:
+        found: Dict[Hashable, object] = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get((key, version))
+                if entry is None:
+                    self.misses += 1
+                    continue
+                self._entries.move_to_end((key, version))
+                self.hits += 1
+                found[key] = entry
+        return found
+
+    def put_many(self, values: Dict[Hashable, object], version: Hashable) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            for key, value in values.items():
+                self._entries[(key, version)] = value
+                self._entries.move_to_end((key, version))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
@@ -1,7 +1,20 @@
 from __future__ import annotations
 
 import json
+import math
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
 
+import numpy as np
+import pandas as pd
+
+import ingest_engine
+import processing_engine as pe
+import shared_engine
+import table_engine as te
 from app import app
 
 
@@ -42,7 +55,131 @@ def run_tests() -> None:
             print(gi.data.decode("utf-8", errors="ignore"))
         print()
 
-        # 3) RAG ask (proxied)
+        # 3) Batch student summaries
+        batch = client.post("/students/batch", json={"ids": [1, 2, "1BM20CS001"]})
+        print("[Students Batch] status:", batch.status_code)
+        try:
+            print(pretty(batch.get_json()))
+        except Exception:
+            print(batch.data.decode("utf-8", errors="ignore"))
+        print()
+        assert batch.status_code == 200
+        assert set(batch.get_json()["summaries"]) == {"1", "2", "1BM20CS001"}
+
+        # 4) Cohort distributions
+        cohorts = client.get("/cohorts/department")
+        print("[Cohorts] status:", cohorts.status_code)
+        try:
+            print(pretty(cohorts.get_json()))
+        except Exception:
+            print(cohorts.data.decode("utf-8", errors="ignore"))
+        print()
+        assert cohorts.status_code == 200
+        assert cohorts.get_json()["dimension"] == "department"
+
+        # 5) Attendance over the last 30 days
+        att = client.get("/student/1BM20CS001/attendance?days=30")
+        print("[Attendance] status:", att.status_code)
+        try:
+            print(pretty(att.get_json()))
+        except Exception:
+            print(att.data.decode("utf-8", errors="ignore"))
+        print()
+        assert att.status_code == 200
+        assert {"days_present", "days_absent", "percentage", "streak"} <= set(att.get_json())
+
+        # 6) Monthly attendance trend
+        trend = client.get("/student/1BM20CS001/attendance/trend?period=month")
+        print("[Attendance Trend] status:", trend.status_code)
+        try:
+            print(pretty(trend.get_json()))
+        except Exception:
+            print(trend.data.decode("utf-8", errors="ignore"))
+        print()
+        assert trend.status_code == 200
+        assert trend.get_json()["period"] == "month"
+
+        # 7) Tag search
+        search = client.get("/students/search?tags=NLP,React Native&mode=any")
+        print("[Tag Search] status:", search.status_code)
+        try:
+            print(pretty(search.get_json()))
+        except Exception:
+            print(search.data.decode("utf-8", errors="ignore"))
+        print()
+        assert search.status_code == 200
+        assert search.get_json()["count"] == len(search.get_json()["students"])
+
+        # 8) Metrics query
+        query = client.post("/students/query", json={
+            "where": [{"field": "avg_grade", "op": ">=", "value": 0}],
+            "sort": "-avg_grade",
+            "limit": 3,
+        })
+        print("[Students Query] status:", query.status_code)
+        try:
+            print(pretty(query.get_json()))
+        except Exception:
+            print(query.data.decode("utf-8", errors="ignore"))
+        print()
+        assert query.status_code == 200
+        assert len(query.get_json()["students"]) <= 3
+
+        # 9) Similar students
+        similar = client.get("/student/1BM20CS001/similar?k=3")
+        print("[Similar Students] status:", similar.status_code)
+        try:
+            print(pretty(similar.get_json()))
+        except Exception:
+            print(similar.data.decode("utf-8", errors="ignore"))
+        print()
+        assert similar.status_code == 200
+
+        # 10) Chart-ready dashboard payload
+        dashboard = client.get("/student/1BM20CS001/dashboard")
+        print("[Dashboard] status:", dashboard.status_code)
+        try:
+            print(pretty(dashboard.get_json()))
+        except Exception:
+            print(dashboard.data.decode("utf-8", errors="ignore"))
+        print()
+        assert dashboard.status_code == 200
+        assert dashboard.get_json()["id"] == "1BM20CS001"
+
+        # 11) At-risk ranking
+        at_risk = client.get("/students/at-risk?limit=3")
+        print("[At Risk] status:", at_risk.status_code)
+        try:
+            print(pretty(at_risk.get_json()))
+        except Exception:
+            print(at_risk.data.decode("utf-8", errors="ignore"))
+        print()
+        assert at_risk.status_code == 200
+        assert len(at_risk.get_json()["students"]) <= 3
+
+        # 12) Event ingestion (a rejected batch, so the shipped data files stay untouched)
+        ingested = client.post("/ingest/grades", json={"events": [{"id": "1BM20CS001", "subject": "Math", "grade": "Z"}]})
+        print("[Ingest Events] status:", ingested.status_code)
+        try:
+            print(pretty(ingested.get_json()))
+        except Exception:
+            print(ingested.data.decode("utf-8", errors="ignore"))
+        print()
+        assert ingested.status_code == 400
+        assert "unknown grade" in ingested.get_json()["error"]
+
+        # 13) Validation report of the loaded CSVs
+        validation = client.get("/data/validation")
+        print("[Validation Report] status:", validation.status_code)
+        try:
+            print(pretty(validation.get_json()))
+        except Exception:
+            print(validation.data.decode("utf-8", errors="ignore"))
+        print()
+        assert validation.status_code == 200
+        assert "grades" in validation.get_json()["tables"]
+
+        # 14) RAG ask (proxied)
         # Note: requires ai_echo service running on 5001 to get real response; otherwise may error/timeout
         ask = client.post("/ask", json={"query": "Summarize 2024 AI projects"})
         print("[Ask] status:", ask.status_code)
@@ -53,7 +190,379 @@ def run_tests() -> None:
         print()
 
 
+# ----------------------------------------------------------------------------
+# Invariants: every way of loading the same rows must serve the same results
+# ----------------------------------------------------------------------------
+SUBJECTS = ("OS", "AI", "DBMS")
+DEPARTMENTS = ("CS", "EC", "ME")
+
+
+def make_dataset(root: Path, partitioned: bool = False, seed: int = 7) -> Path:
+    """Write a small students/grades/attendance/projects data directory under root.
+
+    With partitioned, grades and attendance are laid out as
+    <table>/semester=S/dept=D/part-0.csv, each student's rows under their own
+    department and a semester up to theirs.
+    """
+    rng = np.random.default_rng(seed)
+    root.mkdir(parents=True, exist_ok=True)
+    n = 30
+    students = pd.DataFrame({
+        "student_id": np.arange(1, n + 1),
+        "name": [f"N{i}" for i in range(1, n + 1)],
+        "usn": [f"1RV{i:04d}" for i in range(1, n + 1)],
+        "semester": rng.integers(1, 5, n),
+        "dob": "2003-01-01",
+        "department": rng.choice(DEPARTMENTS, n),
+    })
+    students.to_csv(root / "students.csv", index=False)
+    days = pd.date_range("2023-01-02", periods=45).strftime("%Y-%m-%d")
+    grades = pd.DataFrame(
+        [(sid, subj, round(float(rng.uniform(4, 10)), 2)) for sid in students["student_id"][:-2] for subj in SUBJECTS],
+        columns=["student_id", "subject", "grade"],
+    )
+    attendance = pd.DataFrame(
+        [(sid, day, subj, "Present" if rng.random() < 0.8 else "Absent")
+         for sid in students["student_id"][:-3] for day in days for subj in SUBJECTS[:2]],
+        columns=["student_id", "date", "subject", "status"],
+    )
+    pd.DataFrame({
+        "student_id": students["student_id"][:10],
+        "project_name": [f"P{i}" for i in range(10)],
+        "tags": ["ML,Web" if i % 2 else "NLP" for i in range(10)],
+    }).to_csv(root / "projects.csv", index=False)
+    for name, frame in (("grades", grades), ("attendance", attendance)):
+        if not partitioned:
+            frame.to_csv(root / f"{name}.csv", index=False)
+            continue
+        owner = students.set_index("student_id").loc[frame["student_id"]]
+        semester = [int(rng.integers(1, s + 1)) for s in owner["semester"]]
+        for (sem, dept), part in frame.groupby([semester, owner["department"].to_numpy()]):
+            directory = root / name / f"semester={sem}" / f"dept={dept}"
+            directory.mkdir(parents=True)
+            part.to_csv(directory / "part-0.csv", index=False)
+    return root
+
+
+@contextmanager
+def serving(data_dir: Path, backend: str = "pandas"):
+    """Serve requests from data_dir for the duration of the block.
+
+    Snapshots and the risk table go under data_dir as well, so test runs
+    leave nothing behind in backend/cache.
+    """
+    previous = pe.storage(), te.SNAPSHOT_DIR, pe.RISK_TABLE_PATH
+    te.SNAPSHOT_DIR = data_dir / "cache" / "columnar"
+    pe.RISK_TABLE_PATH = data_dir / "cache" / "risk_scores.csv"
+    pe.use_storage(pe.open_storage(data_dir, backend, db_path=data_dir / "eduweave.sqlite3"))
+    try:
+        yield
+    finally:
+        pe.use_storage(previous[0])
+        te.SNAPSHOT_DIR, pe.RISK_TABLE_PATH = previous[1:]
+
+
+def plain(obj):
+    """obj as comparable JSON: floats to 6 places, NaN as None, timestamps dropped."""
+    if isinstance(obj, dict):
+        return {str(k): plain(v) for k, v in obj.items() if k != "computed_at"}
+    if isinstance(obj, (list, tuple)):
+        return [plain(v) for v in obj]
+    if isinstance(obj, np.generic):
+        obj = obj.item()
+    if isinstance(obj, float):
+        return None if math.isnan(obj) else round(obj, 6)
+    return obj
+
+
+def results(keys) -> dict:
+    """Everything the public API serves about keys and the whole data set."""
+    few = list(keys)[:6]
+    return plain({
+        "summaries": pe.summarize_students(keys),
+        "windows": [pe.attendance_window(k, start="2023-01-05", end="2023-02-25", subject=s) for k in few for s in (None, "OS")],
+        "trends": [pe.attendance_trend(k, p, start="2023-01-09") for k in few for p in ("week", "month")],
+        "dashboards": [pe.dashboard_payload(k) for k in few],
+        "cohorts": {d: pe.cohort_distributions(d) for d in ("department", "semester")},
+        "queries": [
+            pe.query_students(None, "-avg_grade", 50),
+            pe.query_students([{"field": "department", "op": "==", "value": "CS"}], "avg_attendance", 50),
+            pe.query_students([{"field": "semester", "op": "in", "value": [1, 2]}], "-avg_grade", 50),
+            pe.query_students([{"field": "avg_attendance", "op": "<", "value": 85}], None, 50),
+        ],
+        "similar": [pe.similar_students(k, 3) for k in few if isinstance(k, int)],
+        "risk": pe.at_risk_students(50),
+        "tags": pe.students_with_tags(["ML", "NLP"], "any"),
+    })
+
+
+KEYS = [1, 2, 5, "1RV0007", 12, 28, 29, 30, 999]
+
+
+def test_batch_matches_single_summaries():
+    with tempfile.TemporaryDirectory() as tmp, serving(make_dataset(Path(tmp))):
+        batch = pe.summarize_students(KEYS)
+        pe.use_storage(pe.open_storage(Path(tmp), "pandas"))  # cold caches
+        assert plain(batch) == plain({pe.parse_student_key(k): pe.summarize_student(k) for k in KEYS})
+
+
+def test_appended_rows_match_full_reload():
+    with tempfile.TemporaryDirectory() as tmp:
+        data = make_dataset(Path(tmp))
+        path = data / "attendance.csv"
+        lines = path.read_text().splitlines(keepends=True)
+        tail = lines[-200:] + ["28,2023-03-01,Lab,Present\n", "30,2023-03-02,OS,Absent\n"]  # new subject, new student
+        path.write_text("".join(lines[:-200]))
+        with serving(data):
+            results(KEYS)
+            for start in range(0, len(tail), 90):
+                with open(path, "a") as f:
+                    f.write("".join(tail[start:start + 90]))
+                incremental = results(KEYS)
+        with serving(data):
+            assert incremental == results(KEYS)
+
+
+def test_rewritten_rows_are_reloaded():
+    with tempfile.TemporaryDirectory() as tmp:
+        data = make_dataset(Path(tmp))
+        path = data / "attendance.csv"
+        rows = path.read_text().splitlines(keepends=True)
+        assert path.stat().st_size > 4 * 4096 and rows[1].startswith("1,") and rows[2].startswith("1,")
+        with serving(data):
+            # Same size first, then an edit far from the end followed by an append
+            for i, extra in enumerate(["", "28,2023-03-01,Lab,Present\n"]):
+                results(KEYS)
+                rows[1 + i] = "2" + rows[1 + i][1:]
+                rows.append(extra)
+                mtime = path.stat().st_mtime_ns
+                path.write_text("".join(rows))
+                os.utime(path, ns=(mtime + 10**9, mtime + 10**9))
+                served = results(KEYS)
+                with serving(data):
+                    assert served == results(KEYS)
+
+
+def test_streaming_matches_resident():
+    with tempfile.TemporaryDirectory() as tmp:
+        data = make_dataset(Path(tmp))
+        with serving(data):
+            resident = results(KEYS)
+        mode, rows = pe.STREAMING_MODE, pe.STREAM_CHUNK_ROWS
+        pe.STREAMING_MODE, pe.STREAM_CHUNK_ROWS = "always", 97
+        try:
+            with serving(data):
+                assert results(KEYS) == resident
+        finally:
+            pe.STREAMING_MODE, pe.STREAM_CHUNK_ROWS = mode, rows
+
+
+def test_sqlite_matches_pandas():
+    with tempfile.TemporaryDirectory() as tmp:
+        data = make_dataset(Path(tmp))
+        with serving(data):
+            expected = results(KEYS)
+        with serving(data, "sqlite"):
+            assert results(KEYS) == expected
+
+
+def test_partitioned_matches_single_file():
+    with tempfile.TemporaryDirectory() as tmp:
+        with serving(make_dataset(Path(tmp) / "flat")):
+            expected = results(KEYS)
+        with serving(make_dataset(Path(tmp) / "partitioned", partitioned=True)):
+            assert results(KEYS) == expected
+
+
+def test_ingested_events_survive_compaction():
+    attendance = [{"id": 2, "date": "2023-02-20", "subject": "OS", "status": "Absent"},
+                  {"id": 28, "date": "2023-02-21", "subject": "AI", "status": "Present"}]
+    grades = [{"id": 4, "subject": "ML", "grade": 9.5}, {"id": 30, "subject": "OS", "grade": 6}]
+    for partitioned in (False, True):
+        with tempfile.TemporaryDirectory() as tmp:
+            check_events_survive_compaction(Path(tmp), partitioned, attendance, grades)
+
+
+def check_events_survive_compaction(tmp: Path, partitioned: bool, attendance, grades):
+    logged, flat = make_dataset(tmp / "logged", partitioned), make_dataset(tmp / "flat")
+
+    def write_flat(att, gr):
+        with open(flat / "attendance.csv", "a") as f:
+            f.writelines(f"{e['id']},{e['date']},{e['subject']},{e['status']}\n" for e in att)
+        with open(flat / "grades.csv", "a") as f:
+            f.writelines(f"{e['id']},{e['subject']},{e['grade']}\n" for e in gr)
+
+    with serving(logged):
+        results(KEYS)
+        ingest_engine.append("attendance", attendance)
+        ingest_engine.append("grades", grades)
+        appended = results(KEYS)
+        ingest_engine.compact("attendance")
+        ingest_engine.compact("grades")
+        compacted = results(KEYS)
+        ingest_engine.append("attendance", attendance[:1])
+        after = results(KEYS)
+    with serving(logged):
+        reloaded = results(KEYS)
+    write_flat(attendance, grades)
+    with serving(flat):
+        expected = results(KEYS)
+    assert appended == compacted == expected
+    write_flat(attendance[:1], [])
+    with serving(flat):
+        expected = results(KEYS)
+    assert after == reloaded == expected
+
+
+def test_lost_segment_is_served_from_its_log():
+    grades = [{"id": 4, "subject": "ML", "grade": 9.5}, {"id": 30, "subject": "OS", "grade": 6}]
+    with tempfile.TemporaryDirectory() as tmp:
+        data = make_dataset(Path(tmp))
+        with serving(data):
+            ingest_engine.append("grades", grades)
+            ingest_engine.compact("grades")
+            expected = results(KEYS)
+        (data / "wal" / "grades-compacted-1.json").write_text("{")
+        with serving(data):
+            assert results(KEYS) == expected
+        (data / "wal" / "grades-0.csv").unlink()
+        with serving(data):
+            try:
+                pe.summarize_students(KEYS)
+            except te.MissingSegment as e:
+                assert "grades-compacted-1" in str(e)
+            else:
+                raise AssertionError("a lost segment without its log must not be served as empty")
+
+
+def test_snapshots_follow_their_csv():
+    with tempfile.TemporaryDirectory() as tmp:
+        data = make_dataset(Path(tmp))
+        snapshots = data / "cache" / "columnar"
+        path = data / "grades.csv"
+        with serving(data):
+            results(KEYS)
+            extra = data / "extra.csv"
+            extra.write_text(path.read_text())
+            te.read_csv_cached(extra)
+            extra.unlink()
+            # Touched: same bytes under a new mtime keep the snapshot
+            os.utime(path, ns=(path.stat().st_mtime_ns + 10**9,) * 2)
+            touched = results(KEYS)
+            # Rewritten at the same size: the content hash no longer matches
+            rows = path.read_text().splitlines(keepends=True)
+            rows[1] = rows[1][:-2] + ("1" if rows[1][-2] != "1" else "2") + "\n"
+            mtime = path.stat().st_mtime_ns
+            path.write_text("".join(rows))
+            os.utime(path, ns=(mtime + 2 * 10**9,) * 2)
+            rewritten = results(KEYS)
+        sources = [json.loads(p.read_text())["source"] for p in snapshots.glob("*.json")]
+        assert sorted(Path(source).name for source in sources) == [
+            "attendance.csv", "grades.csv", "projects.csv", "students.csv"]
+        shutil.rmtree(snapshots)
+        with serving(data):
+            assert rewritten == results(KEYS) != touched
+
+
+def test_memory_stats_count_encoded_columns():
+    with tempfile.TemporaryDirectory() as tmp:
+        data = make_dataset(Path(tmp))
+        with serving(data):
+            stats = pe.memory_stats()
+        for name in ("students", "grades", "attendance", "projects"):
+            assert stats[name]["rows"] == len(pd.read_csv(data / f"{name}.csv"))
+            assert 0 < stats[name]["bytes"] < stats[name]["bytes_unencoded"]
+        assert stats["students"]["encoded_columns"]["usn"] == 30
+        assert stats["grades"]["encoded_columns"] == {"subject": len(SUBJECTS)}
+        assert stats["attendance"]["calendar_bytes"] > 0
+
+
+def test_summary_cache_counts_hits_per_data_version():
+    with tempfile.TemporaryDirectory() as tmp:
+        data = make_dataset(Path(tmp))
+        with serving(data):
+            first = plain(pe.summarize_students([1, 2]))
+            assert pe.summary_cache_stats()["misses"] == 2 and pe.summary_cache_stats()["hits"] == 0
+            assert plain(pe.summarize_students([1, 2, 3])) == {**first, "3": plain(pe.summarize_student(3))}
+            stats = pe.summary_cache_stats()
+            assert (stats["hits"], stats["misses"], stats["size"]) == (3, 3, 3)
+            version = stats["data_version"]
+            with open(data / "attendance.csv", "a") as f:
+                f.write("1,2023-03-01,OS,Absent\n")
+            changed = plain(pe.summarize_students([1]))
+            stats = pe.summary_cache_stats()
+            assert stats["data_version"] != version and stats["misses"] == 4
+            assert changed != {"1": first["1"]}
+
+
+def test_shared_tables_match_private_ones():
+    with tempfile.TemporaryDirectory() as tmp:
+        data = make_dataset(Path(tmp))
+        with serving(data):
+            private = results(KEYS)
+        flag, directory = pe.SHARED_DATA, shared_engine.SHARED_DIR
+        pe.SHARED_DATA, shared_engine.SHARED_DIR = True, Path(tmp) / "shared"
+        try:
+            with serving(data):
+                assert results(KEYS) == private
+                assert all(table.shared for table in pe.storage().snapshot().tables.values())
+                with open(data / "attendance.csv", "a") as f:
+                    f.write("28,2023-03-01,Lab,Present\n")
+                republished = results(KEYS)
+            assert len(list(shared_engine.SHARED_DIR.glob("attendance-*"))) == 2
+        finally:
+            pe.SHARED_DATA, shared_engine.SHARED_DIR = flag, directory
+        with serving(data):
+            assert republished == results(KEYS)
+
+
+def test_grades_off_the_ten_point_scale_are_not_loaded():
+    with tempfile.TemporaryDirectory() as tmp:
+        data = make_dataset(Path(tmp))
+        grades = pd.read_csv(data / "grades.csv")
+        grades.loc[:2, "grade"] = 75.0
+        grades.to_csv(data / "grades.csv", index=False)
+        with serving(data):
+            rule = pe.validation_report()["grades"]["rules"]["grade_out_of_range"]
+            assert (rule["count"], rule["action"], rule["sample_lines"]) == (3, "rejected", [2, 3, 4])
+            assert pe.summarize_student(1)["subject_details"] == {}  # all three of student 1's rows
+            assert len(pe.summarize_student(2)["subject_details"]) == len(SUBJECTS)
+        grades.rename(columns={"grade": "marks"}).to_csv(data / "grades.csv", index=False)
+        with serving(data):
+            assert pe.summarize_student(2)["subject_details"] == {}
+
+
+def test_invalid_params_are_rejected():
+    bad = [
+        ("get", "/student/1BM20CS001/attendance?start=not-a-date", None),
+        ("get", "/student/1BM20CS001/attendance?start=", None),
+        ("get", "/student/1BM20CS001/attendance?start=2023-02-01&end=2023-01-01", None),
+        ("get", "/student/1BM20CS001/attendance?start=2999-01-01", None),
+        ("get", "/student/1BM20CS001/attendance?days=0", None),
+        ("get", "/student/1BM20CS001/attendance/trend?period=year", None),
+        ("get", "/student/1BM20CS001/attendance/trend?end=31/02/2023", None),
+        ("post", "/students/query", {"where": [{"field": "avg_grade", "op": "~", "value": 1}]}),
+        ("post", "/students/query", {"where": [{"field": "no_such_field", "op": "==", "value": 1}]}),
+        ("post", "/students/query", {"where": [{"field": "primary", "op": "==", "value": True}]}),
+        ("post", "/students/query", {"fields": ["avg_grade", "primary"]}),
+        ("post", "/students/query", {"sort": "-primary"}),
+        ("post", "/students/query", {"sort": "department"}),
+        ("post", "/students/query", {"limit": 0}),
+        ("post", "/students/batch", {"ids": [True]}),
+        ("get", "/cohorts/shoe_size", None),
+    ]
+    with app.test_client() as client:
+        for method, url, body in bad:
+            response = getattr(client, method)(url, json=body) if body is not None else getattr(client, method)(url)
+            assert response.status_code == 400, (url, body, response.status_code)
+            assert response.get_json()["error"]
+
+
 if __name__ == "__main__":
     run_tests()
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"[{name}] ok")
 
 